@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the scraping services, using in-memory stand-ins for the cloud backends.
+
+Run a benchmark from the repository root, e.g. `python -m benchmarks.bench_firestore_writes`.
+"""
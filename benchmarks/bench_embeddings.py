@@ -0,0 +1,77 @@
+"""
+Benchmark the EmbeddingDispatcher against a local fake embeddings API with rate limits.
+
+The 'serial' strategy sends one request at a time, as `OpenAIEmbeddings` does. The 'dispatcher' strategy keeps up
+to `--in_flight` requests in flight. Both pack chunks by token budget and go through the same token buckets. Tokens
+are counted with the approximation of the fake server unless `--tiktoken` is given, because tiktoken downloads its
+encodings on first use.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.fake_embedding_server import FakeEmbeddingServer, approximate_tokens
+
+
+def synthetic_chunks(rng, num_chunks, chunk_chars):
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10)))
+             for _ in range(5000)]
+    chunks = []
+    for _ in range(num_chunks):
+        chunk = []
+        while sum(len(word) + 1 for word in chunk) < chunk_chars:
+            chunk.append(rng.choice(words))
+        chunks.append(' '.join(chunk))
+    return chunks
+
+
+def main():
+    from embedding_dispatcher import EmbeddingDispatcher  # pylint: disable=C0415
+
+    parser = argparse.ArgumentParser(description='Benchmark the embedding dispatcher against a fake embeddings API')
+    parser.add_argument('-n', '--num_chunks', type=int, default=2000, help='Number of chunks to embed')
+    parser.add_argument('--chunk_chars', type=int, default=1024, help='Characters per chunk')
+    parser.add_argument('--latency', type=float, default=0.3, help='Fixed latency per request in seconds')
+    parser.add_argument('--seconds_per_token', type=float, default=0.00005, help='Latency per token')
+    parser.add_argument('--rpm', type=int, default=3000, help='Requests-per-minute limit of the server')
+    parser.add_argument('--tpm', type=int, default=5000000, help='Tokens-per-minute limit of the server')
+    parser.add_argument('--in_flight', type=int, default=8, help='Concurrent requests of the dispatcher')
+    parser.add_argument('--dimensions', type=int, default=64, help='Length of the returned vectors')
+    parser.add_argument('--tiktoken', action='store_true', help='Count tokens with tiktoken')
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(random.Random(0), args.num_chunks, args.chunk_chars)
+    token_counter = None if args.tiktoken else approximate_tokens
+
+    results = {}
+    for name, in_flight in (('serial', 1), ('dispatcher', args.in_flight)):
+        server = FakeEmbeddingServer(latency=args.latency, seconds_per_token=args.seconds_per_token,
+                                     requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                                     dimensions=args.dimensions).start()
+        try:
+            # The client limits are set slightly above the server limits, so that 429 backoff is exercised
+            dispatcher = EmbeddingDispatcher(api_key='bench', api_base=f'{server.url}/v1', max_in_flight=in_flight,
+                                             requests_per_minute=int(args.rpm * 1.1),
+                                             tokens_per_minute=int(args.tpm * 1.1), base_sleep_time=0.1,
+                                             token_counter=token_counter)
+            start = time.perf_counter()
+            vectors = dispatcher.embed_documents(chunks)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.stop()
+        assert len(vectors) == len(chunks) and all(vector == server.vector(chunk.replace('\n', ' '))
+                                                   for chunk, vector in zip(chunks, vectors))
+        results[name] = {
+            'chunks': len(chunks),
+            'requests': dispatcher.requests_sent,
+            'throttled': dispatcher.throttled,
+            'seconds': round(elapsed, 3),
+            'client_tokens_per_second': round(dispatcher.tokens_embedded / elapsed),
+            'server_tokens_per_second': round(server.tokens_per_second()),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
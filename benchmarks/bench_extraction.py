@@ -0,0 +1,118 @@
+"""
+Micro-benchmark of the paragraph extraction engines on a corpus of saved pages.
+
+Pass a directory of saved `.html` pages with `--corpus`; without it a synthetic corpus is generated. For every
+engine the benchmark reports pages/s and its output parity with the original 'bs4' extractor: the share of
+pages with identical text and character count, and the mean text similarity of the pages that differ.
+
+The parity cases below, malformed markup common on real sites, are checked on top of the corpus. With `--check` the
+benchmark exits with status 1 if an engine differs from 'bs4' on any page or parity case, e.g.:
+
+    python -m benchmarks.bench_extraction --corpus saved_pages --check
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+from text_extraction import EXTRACTION_ENGINES
+
+WORDS = ('Steuern', 'Kanton', 'Luzern', 'Gemeinde', 'Einkommen', 'Vermögen', 'Abzüge', 'Formular', 'Frist',
+         'Veranlagung', 'Grundstück', 'Gebühr', 'Rückerstattung', 'Quellensteuer', 'Personalamt', 'Finanzen')
+
+
+# Markup where the tree built by 'html.parser' differs from the tree of a browser
+PARITY_CASES = {
+    'block_in_p': '<html><body><p>Intro<div>block</div>tail</p></body></html>',
+    'nested_p': '<html><body><p>a<p>b</p></p></body></html>',
+    'unclosed_p': '<html><body><p>first<p>second<p>third</body></html>',
+    'table_in_p': '<html><body><p>Rates<table><tr><td>1.5%</td></tr></table>apply</p></body></html>',
+    'list_in_p': '<html><body><p>Documents:<ul><li>Form</li><li>Receipt</li></ul></p></body></html>',
+    'stray_end_p': '<html><body>text</p><p>after</p></body></html>',
+    'p_in_inline': '<html><body><span><p>inside span</p></span><a href="/x"><p>inside link</p></a></body></html>',
+    'heading_in_p': '<html><body><p>Title<h2>Heading</h2>body</p></body></html>',
+    'entities': '<html><body><p>Z&uuml;rich &amp Co &#8364; &nbsp;end</p></body></html>',
+    'comment_in_p': '<html><body><p>before<!-- hidden -->after</p></body></html>',
+    'script_in_p': '<html><body><p>text<script>var p = "<p>x</p>";</script>more</p></body></html>',
+}
+
+
+def synthetic_page(rng, num_paragraphs):
+    paragraphs = []
+    for _ in range(num_paragraphs):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 80))]
+        if rng.random() < 0.3:
+            words[rng.randrange(len(words))] = f'<a href="/seite{rng.randint(0, 999)}">{rng.choice(WORDS)}</a>'
+        if rng.random() < 0.2:
+            words[rng.randrange(len(words))] = f'<strong>{rng.choice(WORDS)}</strong>'
+        paragraphs.append(f"<p>{' '.join(words)}.</p>")
+    if rng.random() < 0.3:
+        paragraphs.append('<p></p>')
+    navigation = ''.join(f'<li><a href="/nav{i}">{rng.choice(WORDS)}</a></li>' for i in range(40))
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{rng.choice(WORDS)}</title>'
+            f'<script>var x = "<p>not a paragraph</p>";</script></head>'
+            f'<body><nav><ul>{navigation}</ul></nav><main>{"".join(paragraphs)}</main>'
+            f'<footer><p>Kanton Luzern, Bahnhofstrasse 15, 6002 Luzern</p></footer></body></html>')
+
+
+def load_corpus(corpus_dir, num_pages, seed):
+    if corpus_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(corpus_dir, '*.htm*'))):
+            with open(path, encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+        return pages
+    rng = random.Random(seed)
+    return [synthetic_page(rng, rng.randint(3, 60)) for _ in range(num_pages)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark paragraph extraction engines')
+    parser.add_argument('--corpus', type=str, default=None, help='Directory of saved .html pages')
+    parser.add_argument('-n', '--num_pages', type=int, default=300, help='Number of synthetic pages')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic corpus')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if an engine differs from bs4 on any page or parity case')
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus, args.num_pages, args.seed)
+    results = {}
+    reference = None
+    parity_reference = None
+    for name, engine in EXTRACTION_ENGINES.items():
+        start = time.perf_counter()
+        outputs = [engine(page) for page in pages]
+        elapsed = time.perf_counter() - start
+        parity_outputs = {case: engine(html) for case, html in PARITY_CASES.items()}
+        if reference is None:
+            reference = outputs
+            parity_reference = parity_outputs
+        identical = sum(output == expected for output, expected in zip(outputs, reference))
+        similarities = [difflib.SequenceMatcher(None, output[0], expected[0]).ratio()
+                        for output, expected in zip(outputs, reference) if output != expected]
+        results[name] = {
+            'pages': len(pages),
+            'seconds': round(elapsed, 3),
+            'pages_per_second': round(len(pages) / elapsed, 1),
+            'identical_to_bs4': round(identical / len(pages), 4) if pages else None,
+            'mean_similarity_of_differing_pages': round(sum(similarities) / len(similarities), 4)
+            if similarities else None,
+            'differing_parity_cases': sorted(case for case, output in parity_outputs.items()
+                                             if output != parity_reference[case]),
+        }
+    print(json.dumps(results, indent=2))
+
+    if args.check:
+        failed = [name for name, result in results.items()
+                  if result['identical_to_bs4'] not in (None, 1) or result['differing_parity_cases']]
+        if failed:
+            print(f"Output differs from bs4: {', '.join(failed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
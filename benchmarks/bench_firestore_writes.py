@@ -0,0 +1,57 @@
+"""
+Benchmark per-URL Firestore writes against BufferedFirestoreWriter.
+
+Every URL is stored once by the link collector and updated once by the scraper, as in a real run. The benchmark
+reports the number of RPCs and the achieved writes per second for both strategies against FakeFirestore.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.fakes import FakeFirestore
+from firestore_writer import BufferedFirestoreWriter
+
+
+def run_direct(db, num_urls):
+    collection = db.collection('links')
+    for i in range(num_urls):
+        collection.document(f'doc{i}').set({'url': f'https://example.com/{i}', 'status': 'pending'})
+    for i in range(num_urls):
+        collection.document(f'doc{i}').update({'status': 'scraped', 'num_characters': i})
+
+
+def run_buffered(db, num_urls):
+    collection = db.collection('links')
+    writer = BufferedFirestoreWriter(db)
+    for i in range(num_urls):
+        writer.set(collection.document(f'doc{i}'), {'url': f'https://example.com/{i}', 'status': 'pending'})
+    writer.flush()
+    for i in range(num_urls):
+        writer.update(collection.document(f'doc{i}'), {'status': 'scraped', 'num_characters': i})
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched Firestore writes')
+    parser.add_argument('-n', '--num_urls', type=int, default=2000, help='Number of URLs to write')
+    parser.add_argument('--latency', type=float, default=0.005, help='Simulated RPC latency in seconds')
+    args = parser.parse_args()
+
+    results = {}
+    for name, strategy in (('direct', run_direct), ('buffered', run_buffered)):
+        db = FakeFirestore(latency=args.latency)
+        start = time.perf_counter()
+        strategy(db, args.num_urls)
+        elapsed = time.perf_counter() - start
+        assert all(doc['status'] == 'scraped' for doc in db.documents.values())
+        results[name] = {
+            'writes': 2 * args.num_urls,
+            'rpc_count': db.rpc_count,
+            'seconds': round(elapsed, 3),
+            'writes_per_second': round(2 * args.num_urls / elapsed, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark per-upload storage clients against the pooled GCSUploader, using a local fake GCS server.
+
+The 'per_upload' strategy mirrors the previous ScraperService upload code: a new `storage.Client` and a
+`get_bucket` call for every blob, uploaded in the calling thread. The 'pooled' strategy uploads through one
+GCSUploader with a thread pool.
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.fake_gcs_server import FakeGCSServer
+
+
+def run_per_upload(num_blobs, payload):
+    from google.cloud import storage  # pylint: disable=C0415
+
+    for i in range(num_blobs):
+        storage_client = storage.Client()
+        bucket = storage_client.get_bucket('bench-bucket')
+        bucket.blob(f'page{i}.txt').upload_from_string(payload)
+
+
+def run_pooled(num_blobs, payload, workers):
+    from gcs_uploader import GCSUploader  # pylint: disable=C0415
+
+    uploader = GCSUploader(max_workers=workers, max_pending=4 * workers)
+    failures = []
+
+    def on_done(future):
+        if future.exception() is not None:
+            failures.append(future.exception())
+
+    for i in range(num_blobs):
+        uploader.submit('bench-bucket', f'page{i}.txt', payload, callback=on_done)
+    uploader.close()
+    if failures:
+        raise RuntimeError(f"{len(failures)} uploads failed, first error: {failures[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark GCS uploads against a local fake GCS server')
+    parser.add_argument('-n', '--num_blobs', type=int, default=200, help='Number of blobs to upload')
+    parser.add_argument('--size', type=int, default=8192, help='Size of each blob in bytes')
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated latency per request in seconds')
+    parser.add_argument('--workers', type=int, default=8, help='Upload threads of the pooled uploader')
+    args = parser.parse_args()
+
+    payload = b'x' * args.size
+    results = {}
+    for name in ('per_upload', 'pooled'):
+        server = FakeGCSServer(latency=args.latency).start()
+        os.environ['STORAGE_EMULATOR_HOST'] = server.url
+        try:
+            start = time.perf_counter()
+            if name == 'per_upload':
+                run_per_upload(args.num_blobs, payload)
+            else:
+                run_pooled(args.num_blobs, payload, args.workers)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.stop()
+        assert len(server.objects) == args.num_blobs
+        results[name] = {
+            'uploads': args.num_blobs,
+            'requests': server.request_count,
+            'seconds': round(elapsed, 3),
+            'uploads_per_second': round(args.num_blobs / elapsed, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
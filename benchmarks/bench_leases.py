@@ -0,0 +1,165 @@
+"""
+Benchmark and check the link leases of LinkLeaseManager against FakeFirestore.
+
+Three scenarios are run:
+
+- 'concurrent_claims': several claimers, each with its own LinkLeaseManager, claim and complete all pending links in
+  parallel. Every link must be claimed exactly once and end up with the result of the node that claimed it.
+- 'expired_lease': a node whose lease expired without renewal completes its links after another node claimed and
+  completed them again. The late results must be dropped.
+- 'renewed_lease': a node renews its leases while it scrapes for longer than the lease duration. No other node may
+  claim the links in the meantime.
+
+With `--check` the benchmark exits with status 1 if a scenario fails, e.g.:
+
+    python -m benchmarks.bench_leases --claimers 6 --check
+"""
+import argparse
+import collections
+import json
+import sys
+import threading
+import time
+
+from benchmarks.fakes import FakeFirestore
+from link_leases import LinkLeaseManager, link_document_id
+
+COLLECTION = 'links'
+
+
+def seed_links(db, num_links):
+    urls = [f'https://example.com/page{i}' for i in range(num_links)]
+    for url in urls:
+        db.collection(COLLECTION).document(link_document_id(url)).set({
+            'url': url, 'status': 'pending', 'lease_owner': None, 'lease_expires_at': None})
+    return urls
+
+
+def documents(db):
+    prefix = f'{COLLECTION}/'
+    return {doc['url']: doc for path, doc in db.documents.items() if path.startswith(prefix)}
+
+
+def run_concurrent_claims(num_links, num_claimers, batch_size, latency):
+    db = FakeFirestore(latency=latency)
+    urls = seed_links(db, num_links)
+    claims = collections.Counter()
+    lock = threading.Lock()
+    managers = [LinkLeaseManager(db, COLLECTION, owner=f'node{i}', max_attempts=20) for i in range(num_claimers)]
+
+    def claimer(manager):
+        while True:
+            claimed = manager.claim_batch(batch_size)
+            if not claimed:
+                break
+            with lock:
+                claims.update(claimed)
+            for url in claimed:
+                manager.complete(url, {'status': 'scraped', 'scraped_by': manager.owner})
+            manager.flush()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=claimer, args=(manager,)) for manager in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    docs = documents(db)
+    double_claims = sum(1 for count in claims.values() if count > 1)
+    unclaimed = sum(1 for url in urls if claims[url] == 0)
+    not_scraped = sum(1 for doc in docs.values() if doc['status'] != 'scraped' or doc['lease_owner'] is not None)
+    return {
+        'links': num_links,
+        'claimers': num_claimers,
+        'seconds': round(elapsed, 3),
+        'links_per_second': round(num_links / elapsed, 1),
+        'rpcs': db.rpc_count,
+        'double_claims': double_claims,
+        'unclaimed': unclaimed,
+        'not_scraped': not_scraped,
+        'lost_leases': sum(manager.lost for manager in managers),
+        'ok': double_claims == 0 and unclaimed == 0 and not_scraped == 0,
+    }
+
+
+def run_expired_lease(num_links, lease_seconds):
+    db = FakeFirestore()
+    seed_links(db, num_links)
+    slow = LinkLeaseManager(db, COLLECTION, owner='slow', lease_seconds=lease_seconds)
+    fast = LinkLeaseManager(db, COLLECTION, owner='fast', lease_seconds=60)
+
+    claimed_slow = slow.claim_batch(num_links)
+    time.sleep(2 * lease_seconds)
+    claimed_fast = fast.claim_batch(num_links)
+    for url in claimed_fast:
+        fast.complete(url, {'status': 'scraped', 'scraped_by': 'fast'})
+    fast.flush()
+    for url in claimed_slow:
+        slow.complete(url, {'status': 'scraped', 'scraped_by': 'slow'})
+    slow.flush()
+
+    overwritten = sum(1 for doc in documents(db).values() if doc.get('scraped_by') != 'fast')
+    return {
+        'links': num_links,
+        'reclaimed': len(claimed_fast),
+        'late_results_dropped': slow.lost,
+        'overwritten': overwritten,
+        'ok': len(claimed_fast) == num_links and overwritten == 0 and slow.lost == num_links,
+    }
+
+
+def run_renewed_lease(num_links, lease_seconds):
+    db = FakeFirestore()
+    seed_links(db, num_links)
+    holder = LinkLeaseManager(db, COLLECTION, owner='holder', lease_seconds=lease_seconds)
+    other = LinkLeaseManager(db, COLLECTION, owner='other', lease_seconds=lease_seconds)
+
+    claimed = holder.claim_batch(num_links)
+    holder.start_renewal(interval=lease_seconds / 4)
+    stolen = []
+    deadline = time.monotonic() + 5 * lease_seconds
+    while time.monotonic() < deadline:
+        stolen.extend(other.claim_batch(num_links))
+        time.sleep(lease_seconds / 10)
+    holder.stop_renewal()
+    for url in claimed:
+        holder.complete(url, {'status': 'scraped', 'scraped_by': 'holder'})
+    holder.flush()
+
+    scraped = sum(1 for doc in documents(db).values() if doc.get('scraped_by') == 'holder')
+    return {
+        'links': num_links,
+        'claimed': len(claimed),
+        'stolen': len(stolen),
+        'scraped': scraped,
+        'ok': len(claimed) == num_links and not stolen and scraped == num_links,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and check the link leases')
+    parser.add_argument('-n', '--num_links', type=int, default=600, help='Number of pending links')
+    parser.add_argument('--claimers', type=int, default=6, help='Number of concurrent claimers')
+    parser.add_argument('--batch_size', type=int, default=25, help='Links per claim')
+    parser.add_argument('--latency', type=float, default=0.002, help='Simulated Firestore RPC latency in seconds')
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 if a scenario fails')
+    args = parser.parse_args()
+
+    results = {
+        'concurrent_claims': run_concurrent_claims(args.num_links, args.claimers, args.batch_size, args.latency),
+        'expired_lease': run_expired_lease(20, lease_seconds=0.2),
+        'renewed_lease': run_renewed_lease(20, lease_seconds=0.4),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.check:
+        failed = [name for name, result in results.items() if not result['ok']]
+        if failed:
+            print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark the MilvusBulkInserter against the previous per-batch write pattern, using an in-memory collection.
+
+The 'per_batch' strategy mirrors what `Milvus.from_documents` did for every 100-file batch: connect, check and
+describe the collection, insert, then flush and count the entities. The 'bulk' strategy buffers the same rows in
+the MilvusBulkInserter, which inserts `--batch_rows` rows per request and flushes once.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.fakes import FakeMilvusCollection
+
+
+class Chunk:
+    def __init__(self, page_content, metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def synthetic_files(rng, num_files, chunks_per_file, dimension):
+    files = []
+    for i in range(num_files):
+        chunks = [Chunk(f'chunk {j} of file {i}', {'source': f'gs://bench/file{i}.txt', 'page': 0})
+                  for j in range(chunks_per_file)]
+        vectors = [[rng.random() for _ in range(dimension)] for _ in chunks]
+        files.append((f'doc{i}', chunks, vectors))
+    return files
+
+
+def run_per_batch(collection, files, files_per_batch):
+    for start in range(0, len(files), files_per_batch):
+        batch = files[start:start + files_per_batch]
+        # Connection, has_collection and describe_collection of a new LangChain wrapper
+        for _ in range(3):
+            collection._rpc(collection.latency)  # pylint: disable=W0212
+        rows = [(chunk, vector) for _, chunks, vectors in batch for chunk, vector in zip(chunks, vectors)]
+        collection.insert([[chunk.page_content for chunk, _ in rows], [vector for _, vector in rows],
+                           [chunk.metadata['source'] for chunk, _ in rows],
+                           [chunk.metadata['page'] for chunk, _ in rows]])
+        collection.flush()
+        _ = collection.num_entities
+    return [doc_id for doc_id, _, _ in files]
+
+
+def run_bulk(collection, files, batch_rows):
+    from milvus_inserter import MilvusBulkInserter  # pylint: disable=C0415
+
+    inserter = MilvusBulkInserter(client=None, collection_name='bench', batch_rows=batch_rows, collection=collection)
+    for doc_id, chunks, vectors in files:
+        inserter.add(chunks, vectors, tag=doc_id)
+    return inserter.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Milvus inserts against an in-memory collection')
+    parser.add_argument('-n', '--num_files', type=int, default=2000, help='Number of files')
+    parser.add_argument('--chunks_per_file', type=int, default=5, help='Chunks per file')
+    parser.add_argument('--dimension', type=int, default=128, help='Vector dimension')
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated round-trip time per request')
+    parser.add_argument('--flush_latency', type=float, default=0.5, help='Additional time per flush')
+    parser.add_argument('--seconds_per_row', type=float, default=0.00001, help='Insert time per row')
+    parser.add_argument('--batch_rows', type=int, default=2000, help='Rows per insert of the bulk inserter')
+    args = parser.parse_args()
+
+    files = synthetic_files(random.Random(0), args.num_files, args.chunks_per_file, args.dimension)
+    total_rows = args.num_files * args.chunks_per_file
+
+    results = {}
+    for name in ('per_batch', 'bulk'):
+        collection = FakeMilvusCollection(latency=args.latency, seconds_per_row=args.seconds_per_row,
+                                          flush_latency=args.flush_latency)
+        start = time.perf_counter()
+        if name == 'per_batch':
+            doc_ids = run_per_batch(collection, files, 100)
+        else:
+            doc_ids = run_bulk(collection, files, args.batch_rows)
+        elapsed = time.perf_counter() - start
+        assert len(collection.rows) == total_rows and len(doc_ids) == args.num_files
+        results[name] = {
+            'rows': total_rows,
+            'requests': collection.rpc_count,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(total_rows / elapsed),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
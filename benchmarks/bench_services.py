@@ -0,0 +1,244 @@
+"""
+Benchmark LinkCollectorService, ScraperService and VectorStoreService end to end, without any cloud backend.
+
+Every scenario of `scenarios.json` serves synthetic websites on local ports and replaces Firestore, GCS, BigQuery,
+the embedding API and Milvus with the in-memory fakes of `benchmarks.fakes`, with the configured latency per RPC.
+The services run one after another, or at the same time with `"streaming": true`. For every service the benchmark
+reports its throughput, the RPCs it made against every backend and the peak RSS of the process and its child
+processes. Every scenario runs in a new interpreter, so that peak RSS is measured per scenario.
+
+    python -m benchmarks.bench_services                       # all scenarios
+    python -m benchmarks.bench_services -s small -o out.json  # one scenario, results also written to a file
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios.json')
+
+COLLECTION = 'links'
+TEXT_BUCKET = 'bench-texts'
+PDF_BUCKET = 'bench-pdfs'
+
+
+def peak_rss_mb():
+    """
+    Get the peak resident set size of this process and of its largest child process in MiB.
+    """
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return {
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'peak_child_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+class Backends:
+    """
+    The synthetic websites and the fake backends of one scenario.
+    """
+
+    def __init__(self, config):
+        # pylint: disable=C0415
+        from benchmarks.fake_website import SyntheticWebsite
+        from benchmarks.fakes import (FakeBigQueryClient, FakeEmbeddings, FakeFirestore, FakeMilvusClient,
+                                      FakeMilvusCollection, FakeStorageClient)
+
+        sites = dict(config['sites'])
+        count = sites.pop('count', 1)
+        self.sites = [SyntheticWebsite(seed=i, **sites).start() for i in range(count)]
+        latency = config.get('backends', {})
+        self.db = FakeFirestore(latency=latency.get('firestore', 0.0))
+        self.storage = FakeStorageClient(latency=latency.get('gcs', 0.0))
+        self.bigquery = FakeBigQueryClient(latency=latency.get('bigquery', 0.0))
+        self.embeddings = FakeEmbeddings(latency=latency.get('embeddings', 0.0))
+        self.collection = FakeMilvusCollection(latency=latency.get('milvus', 0.0), auto_id=False)
+        self.milvus = FakeMilvusClient(self.collection)
+
+    @property
+    def seeds(self):
+        return [(site.start_url, site.base_url) for site in self.sites]
+
+    def rpc_counts(self):
+        return {
+            'http': sum(site.request_count for site in self.sites),
+            'firestore': self.db.rpc_count,
+            'gcs': self.storage.rpc_count,
+            'bigquery': self.bigquery.rpc_count,
+            'embeddings': self.embeddings.rpc_count,
+            'milvus': self.collection.rpc_count,
+        }
+
+    def count_links(self, status):
+        prefix = f'{COLLECTION}/'
+        return sum(1 for path, doc in self.db.documents.items()
+                   if path.startswith(prefix) and doc.get('status') == status)
+
+    def stop(self):
+        for site in self.sites:
+            site.stop()
+
+
+def build_services(backends, config):
+    # pylint: disable=C0415
+    from link_collector_service import LinkCollectorService
+    from scraping_service import ScraperService
+    from vector_store_service import VectorStoreService
+
+    run_id = uuid.uuid4()
+    vector_config = config.get('vector_store', {})
+    link_collector = LinkCollectorService(run_id, COLLECTION, db=backends.db)
+    scraper = ScraperService(run_id, COLLECTION, pdf_bucket_name=PDF_BUCKET, gcp_bucket=TEXT_BUCKET,
+                             dataset_id='bench', table_id='audit', db=backends.db, bq_client=backends.bigquery,
+                             storage_client=backends.storage)
+    vector_store = VectorStoreService(run_id, 'bench', TEXT_BUCKET, COLLECTION, 'bench',
+                                      dedup_threshold=vector_config.get('dedup_threshold'),
+                                      pdf_bucket_name=PDF_BUCKET if vector_config.get('ingest_pdfs') else None,
+                                      db=backends.db, storage_client=backends.storage,
+                                      milvus_client=backends.milvus, milvus_collection=backends.collection,
+                                      embeddings=backends.embeddings)
+    return link_collector, scraper, vector_store
+
+
+def collector_kwargs(config):
+    kwargs = dict(config.get('link_collector', {}))
+    kwargs.pop('multi_seed', None)
+    return kwargs
+
+
+def vector_store_kwargs(config):
+    return {key: value for key, value in config.get('vector_store', {}).items()
+            if key not in ('dedup_threshold', 'ingest_pdfs')}
+
+
+def measure(backends, func):
+    """
+    Run a function and get its duration, the RPCs it made and the peak RSS after it.
+    """
+    before = backends.rpc_counts()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    after = backends.rpc_counts()
+    return {
+        'seconds': round(seconds, 3),
+        'rpcs': {name: after[name] - before[name] for name in after},
+        **peak_rss_mb(),
+    }
+
+
+def per_second(count, seconds):
+    return round(count / seconds, 2) if seconds else 0.0
+
+
+def run_sequential(backends, config, link_collector, scraper, vector_store):
+    results = {}
+    multi_seed = config.get('link_collector', {}).get('multi_seed')
+
+    def collect():
+        if multi_seed:
+            link_collector.run_multi(backends.seeds, **collector_kwargs(config))
+        else:
+            for start_url, base_url in backends.seeds:
+                link_collector.run(start_url, base_url, **collector_kwargs(config))
+
+    results['link_collector'] = measure(backends, collect)
+    pages = backends.count_links('pending')
+    results['link_collector'].update(pages=pages, pages_per_second=per_second(pages,
+                                                                              results['link_collector']['seconds']))
+
+    results['scraper'] = measure(backends, lambda: scraper.run(**config.get('scraper', {})))
+    pages = backends.count_links('scraped')
+    results['scraper'].update(pages=pages, pages_per_second=per_second(pages, results['scraper']['seconds']))
+
+    results['vector_store'] = measure(backends, lambda: vector_store.run(**vector_store_kwargs(config)))
+    files = backends.count_links('db_inserted')
+    chunks = len(backends.collection.rows)
+    results['vector_store'].update(files=files, chunks=chunks,
+                                   chunks_per_second=per_second(chunks, results['vector_store']['seconds']))
+    return results
+
+
+def run_streaming(backends, config, link_collector, scraper, vector_store):
+    from streaming_orchestrator import StreamingOrchestrator  # pylint: disable=C0415
+
+    orchestrator = StreamingOrchestrator(link_collector, scraper, vector_store,
+                                         multi_seed=config.get('link_collector', {}).get('multi_seed', False))
+    summary = {}
+
+    def run():
+        summary.update(orchestrator.run(backends.seeds, collector_kwargs(config), config.get('scraper', {}),
+                                        vector_store_kwargs(config)))
+
+    result = measure(backends, run)
+    pages = backends.count_links('db_inserted') + backends.count_links('scraped')
+    chunks = len(backends.collection.rows)
+    result.update(pages=pages, chunks=chunks, pages_per_second=per_second(pages, result['seconds']),
+                  chunks_per_second=per_second(chunks, result['seconds']), bottleneck=summary.get('bottleneck'),
+                  stages=summary.get('stages'))
+    return {'streaming': result}
+
+
+def run_scenario(config):
+    """
+    Run one scenario in this process.
+
+    Returns:
+    dict: The results of every service.
+    """
+    backends = Backends(config)
+    try:
+        services = build_services(backends, config)
+        if config.get('streaming'):
+            return run_streaming(backends, config, *services)
+        return run_sequential(backends, config, *services)
+    finally:
+        backends.stop()
+
+
+def run_child(name, scenarios_path):
+    """
+    Run a scenario in a new interpreter and return its results.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    child = subprocess.run([sys.executable, '-m', 'benchmarks.bench_services', '--child', name,
+                            '--scenarios', scenarios_path], cwd=REPO_DIR, env=env, capture_output=True, text=True,
+                           check=False)
+    if child.returncode:
+        raise RuntimeError(f"Scenario {name} failed:\n{child.stderr}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the services against synthetic sites and fake backends')
+    parser.add_argument('-s', '--scenario', nargs='*', help='Scenarios to run, all by default')
+    parser.add_argument('--scenarios', default=SCENARIOS_PATH, help='JSON file with the scenarios')
+    parser.add_argument('-o', '--output', help='Also write the results to this JSON file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    with open(args.scenarios, encoding='utf-8') as f:
+        scenarios = json.load(f)
+
+    if args.child:
+        print(json.dumps(run_scenario(scenarios[args.child])))
+        return
+
+    results = {}
+    for name in args.scenario or scenarios:
+        results[name] = run_child(name, os.path.abspath(args.scenarios))
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark the startup of web_scraper.py for a link-collection-only run.
+
+Every measurement runs in a new interpreter. The 'link_collector' scenario imports web_scraper, creates the
+WebScraper and its LinkCollectorService, with FakeFirestore in place of the Firestore client. The 'eager_imports'
+scenario additionally imports the ScraperService and VectorStoreService modules, which web_scraper.py imported
+before the services were created on demand. Creating their clients, the BigQuery table check and the Milvus
+connection added network round trips on top of that, which the benchmark cannot measure offline.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['langchain', 'pymilvus', 'openai', 'tiktoken', 'google.cloud.bigquery', 'scraping_service',
+                 'vector_store_service']
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import web_scraper
+from benchmarks.fakes import FakeFirestore
+scraper = web_scraper.WebScraper()
+scraper.db = FakeFirestore()
+scraper.link_collector
+if {eager}:
+    import scraping_service, vector_store_service
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(eager):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    child = subprocess.run([sys.executable, '-c', CHILD.format(eager=eager, heavy=HEAVY_MODULES)], env=env,
+                           capture_output=True, text=True, check=False)
+    if child.returncode:
+        raise RuntimeError(f"Startup measurement failed:\n{child.stderr}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of a link-collection-only run')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Number of measurements per scenario')
+    args = parser.parse_args()
+
+    results = {}
+    for name, eager in (('link_collector', False), ('eager_imports', True)):
+        runs = [measure(eager) for _ in range(args.repeat)]
+        results[name] = {
+            'median_seconds': round(statistics.median(run['seconds'] for run in runs), 3),
+            'max_seconds': round(max(run['seconds'] for run in runs), 3),
+            'heavy_modules': runs[-1]['modules'],
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+A minimal local HTTP server that answers OpenAI embeddings requests with deterministic vectors.
+
+Point the dispatcher at it with `api_base=<server.url>/v1`. Every request waits a fixed latency plus a time per
+token, and the server answers 429 with a Retry-After header when a request would exceed its requests-per-minute or
+tokens-per-minute limit within the last second, scaled to a per-second limit. It reports the tokens/s it achieved.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def approximate_tokens(text):
+    """
+    Approximate the number of tokens of a text, about four characters per token.
+    """
+    return max(1, len(text) // 4)
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    """
+    Threaded fake embeddings API.
+
+    Attributes:
+        latency (float): Fixed latency per request in seconds.
+        seconds_per_token (float): Additional latency per token.
+        requests_per_minute (int): Limit of requests per minute, None for no limit.
+        tokens_per_minute (int): Limit of tokens per minute, None for no limit.
+        dimensions (int): Length of the returned vectors.
+        request_count (int): Number of requests answered with embeddings.
+        throttled_count (int): Number of requests answered with 429.
+        tokens (int): Number of tokens embedded.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, seconds_per_token=0.0, requests_per_minute=None, tokens_per_minute=None,
+                 dimensions=1536, port=0):
+        super().__init__(('127.0.0.1', port), FakeEmbeddingHandler)
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.dimensions = dimensions
+        self.request_count = 0
+        self.throttled_count = 0
+        self.tokens = 0
+        self.lock = threading.Lock()
+        self._window = deque()
+        self._first = None
+        self._last = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def admit(self, tokens):
+        """
+        Record a request of `tokens` tokens, or return the seconds to wait if it exceeds the rate limits.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self._window and self._window[0][0] <= now - 1:
+                self._window.popleft()
+            window_tokens = sum(count for _, count in self._window)
+            too_many_requests = (self.requests_per_minute is not None
+                                 and len(self._window) + 1 > self.requests_per_minute / 60)
+            too_many_tokens = (self.tokens_per_minute is not None
+                               and self._window and window_tokens + tokens > self.tokens_per_minute / 60)
+            if too_many_requests or too_many_tokens:
+                self.throttled_count += 1
+                return self._window[0][0] + 1 - now if self._window else 1.0
+            self._window.append((now, tokens))
+            return None
+
+    def record(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            self._first = self._first if self._first is not None else now
+            self._last = now
+            self.request_count += 1
+            self.tokens += tokens
+
+    def tokens_per_second(self):
+        """
+        The tokens embedded per second between the first and the last answered request.
+        """
+        if self._first is None or self._last == self._first:
+            return 0.0
+        return self.tokens / (self._last - self._first)
+
+    def vector(self, text):
+        seed = int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], 'big')
+        rng = random.Random(seed)
+        return [rng.uniform(-1, 1) for _ in range(self.dimensions)]
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    server: FakeEmbeddingServer
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=C0103
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        if not self.path.endswith('/embeddings'):
+            self._reply(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+        texts = request['input']
+        texts = [texts] if isinstance(texts, str) else texts
+        tokens = sum(approximate_tokens(text) for text in texts)
+
+        wait = self.server.admit(tokens)
+        if wait is not None:
+            self._reply(429, {'error': {'message': 'Rate limit reached'}}, {'Retry-After': f'{wait:.3f}'})
+            return
+
+        time.sleep(self.server.latency + tokens * self.server.seconds_per_token)
+        self.server.record(tokens)
+        self._reply(200, {
+            'object': 'list',
+            'model': request.get('model'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': self.server.vector(text)}
+                     for i, text in enumerate(texts)],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        })
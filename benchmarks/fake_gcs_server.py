@@ -0,0 +1,107 @@
+"""
+A minimal local HTTP server that speaks enough of the GCS JSON API for `google.cloud.storage` uploads.
+
+Point the storage client at it with `STORAGE_EMULATOR_HOST=http://127.0.0.1:<port>`. The server answers bucket
+lookups and simple or multipart uploads, keeps the uploaded objects in memory and adds a configurable latency to
+every request.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+NAME_PATTERN = re.compile(rb'"name"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class FakeGCSServer(ThreadingHTTPServer):
+    """
+    Threaded fake GCS server.
+
+    Attributes:
+        latency (float): Simulated latency per request in seconds.
+        objects (dict): Uploaded objects, keyed by (bucket, name).
+        request_count (int): Number of requests served.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, port=0):
+        super().__init__(('127.0.0.1', port), FakeGCSHandler)
+        self.latency = latency
+        self.objects = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeGCSHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for FakeGCSServer.
+    """
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+    def _begin(self):
+        with self.server.lock:
+            self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=C0103
+        self._begin()
+        match = re.match(r'^/storage/v1/b/([^/?]+)$', urlparse(self.path).path)
+        if match:
+            self._send_json(200, {'kind': 'storage#bucket', 'name': unquote(match.group(1))})
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not Found'}})
+
+    def do_POST(self):  # pylint: disable=C0103
+        self._begin()
+        parsed = urlparse(self.path)
+        match = re.match(r'^/upload/storage/v1/b/([^/]+)/o$', parsed.path)
+        if not match:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not Found'}})
+            return
+
+        bucket = unquote(match.group(1))
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        query = parse_qs(parsed.query)
+        if 'name' in query:
+            name = query['name'][0]
+        else:
+            # Multipart upload: the object name is in the JSON metadata part
+            name_match = NAME_PATTERN.search(body)
+            name = json.loads(b'"' + name_match.group(1) + b'"') if name_match else 'unnamed'
+
+        with self.server.lock:
+            self.server.objects[(bucket, name)] = body
+        self._send_json(200, {
+            'kind': 'storage#object',
+            'bucket': bucket,
+            'name': name,
+            'size': str(len(body)),
+            'generation': '1',
+        })
@@ -0,0 +1,201 @@
+"""
+A local synthetic website for crawling and scraping benchmarks.
+
+The site is a tree of `num_pages` HTML pages: page i links to its `fan_out` children, its parent, one other page
+and one external URL. Every `pdf_every`-th page also links to a PDF with `pdf_pages` pages.
+Page texts are generated from a fixed seed, so every run serves the same site. Every page repeats the same footer
+paragraph, like the navigation and legal texts of real sites. Responses carry an ETag and answer conditional requests
+with 304 Not Modified, and every request is delayed by `latency` seconds.
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ('steuer einkommen vermoegen kanton gemeinde abzug erklaerung frist veranlagung rechnung zahlung quelle '
+         'verwaltung gesetz verordnung person unternehmen grundstueck gewinn kapital rente vorsorge familie kind '
+         'beruf kosten wohnsitz ausland bund tarif satz formular merkblatt beispiel antrag entscheid').split()
+
+FOOTER = ('Kanton Luzern, Dienststelle Steuern. Alle Angaben ohne Gewaehr. Kontakt, Impressum, Datenschutz und '
+          'rechtliche Hinweise finden Sie auf der Startseite.')
+
+PAGE_PATTERN = re.compile(r'^/page/(\d+)\.html$')
+PDF_PATTERN = re.compile(r'^/doc/(\d+)\.pdf$')
+
+
+def _escape_pdf_text(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages):
+    """
+    Build a minimal PDF with one text page per entry.
+
+    Parameters:
+    pages (list): The lines of every page, as lists of strings.
+
+    Returns:
+    bytes: The PDF file.
+    """
+    num_pages = len(pages)
+    kids = ' '.join(f'{3 + 2 * i} 0 R' for i in range(num_pages))
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {num_pages} >>'.encode(),
+    ]
+    font_id = 3 + 2 * num_pages
+    for i, lines in enumerate(pages):
+        content = 'BT /F1 10 Tf 50 750 Td 12 TL ' + ' '.join(f'({_escape_pdf_text(line)}) Tj T*' for line in lines)
+        content = (content + ' ET').encode('latin-1', errors='replace')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R '
+                       f'/Resources << /Font << /F1 {font_id} 0 R >> >> >>'.encode())
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content))
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class SyntheticWebsite(ThreadingHTTPServer):
+    """
+    Threaded HTTP server serving a generated website.
+
+    Attributes:
+        num_pages (int): Number of HTML pages.
+        fan_out (int): Number of child links per HTML page.
+        pdf_every (int): Every n-th HTML page links to a PDF, 0 for no PDFs.
+        pdf_pages (int): Number of pages per PDF.
+        paragraphs (int): Number of paragraphs per HTML page, besides the footer.
+        latency (float): Simulated latency per request in seconds.
+        request_count (int): Number of requests served.
+    """
+    daemon_threads = True
+
+    def __init__(self, num_pages=500, fan_out=5, pdf_every=0, pdf_pages=3, paragraphs=5, words_per_paragraph=80,
+                 latency=0.0, seed=0, port=0):
+        super().__init__(('127.0.0.1', port), SyntheticWebsiteHandler)
+        self.num_pages = num_pages
+        self.fan_out = fan_out
+        self.pdf_every = pdf_every
+        self.pdf_pages = pdf_pages
+        self.paragraphs = paragraphs
+        self.words_per_paragraph = words_per_paragraph
+        self.latency = latency
+        self.seed = seed
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def start_url(self):
+        return f"{self.url}/page/0.html"
+
+    @property
+    def base_url(self):
+        return f"{self.url}/"
+
+    @property
+    def num_pdfs(self):
+        return self.num_pages // self.pdf_every if self.pdf_every else 0
+
+    def has_pdf(self, index):
+        return bool(self.pdf_every) and index % self.pdf_every == self.pdf_every - 1
+
+    def page_url(self, index):
+        return f"{self.url}/page/{index}.html"
+
+    def pdf_url(self, index):
+        return f"{self.url}/doc/{index}.pdf"
+
+    def _paragraph(self, rng):
+        return ' '.join(rng.choice(WORDS) for _ in range(self.words_per_paragraph)).capitalize() + '.'
+
+    def html(self, index):
+        rng = random.Random(f'{self.seed}-{index}')
+        children = [index * self.fan_out + k for k in range(1, self.fan_out + 1)]
+        links = [self.page_url(child) for child in children if child < self.num_pages]
+        if index:
+            links.append(self.page_url((index - 1) // self.fan_out))
+        links.append(self.page_url(rng.randrange(self.num_pages)))
+        if self.has_pdf(index):
+            links.append(self.pdf_url(index))
+        links.append('https://www.example.org/external')
+        anchors = ''.join(f'<li><a href="{link}">Link {i}</a></li>' for i, link in enumerate(links))
+        paragraphs = ''.join(f'<p>{self._paragraph(rng)}</p>' for _ in range(self.paragraphs))
+        return (f'<html><head><title>Seite {index}</title></head><body><h1>Seite {index}</h1>{paragraphs}'
+                f'<ul>{anchors}</ul><p>{FOOTER}</p></body></html>').encode('utf-8')
+
+    def pdf(self, index):
+        rng = random.Random(f'{self.seed}-pdf-{index}')
+        pages = []
+        for _ in range(self.pdf_pages):
+            words = self._paragraph(rng).split()
+            pages.append([' '.join(words[i:i + 12]) for i in range(0, len(words), 12)])
+        return make_pdf(pages)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SyntheticWebsiteHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for SyntheticWebsite.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+    def do_GET(self):  # pylint: disable=C0103
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        path = self.path.split('?', 1)[0]
+        page = PAGE_PATTERN.match(path)
+        pdf = PDF_PATTERN.match(path)
+        if page and int(page.group(1)) < server.num_pages:
+            body, content_type = server.html(int(page.group(1))), 'text/html; charset=utf-8'
+        elif pdf and int(pdf.group(1)) < server.num_pages and server.has_pdf(int(pdf.group(1))):
+            body, content_type = server.pdf(int(pdf.group(1))), 'application/pdf'
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
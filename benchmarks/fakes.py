@@ -0,0 +1,468 @@
+"""
+In-memory stand-ins for the cloud backends used by the services.
+
+The fakes implement only the parts of the client APIs the services use. Every call that would be a network round
+trip increments `rpc_count` and sleeps for `latency` seconds, so benchmarks can compare the number of round trips
+and the resulting throughput of different strategies.
+"""
+import copy
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import types
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+
+
+class FakeFirestore:
+    """
+    In-memory stand-in for `firestore.Client`.
+
+    Documents carry an `update_time`, so writes with a `last_update_time` precondition behave like in Firestore.
+
+    Attributes:
+        latency (float): Simulated round-trip time of one RPC in seconds.
+        rpc_count (int): Number of RPCs made against the fake.
+        documents (dict): Stored documents, keyed by 'collection/document_id'.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rpc_count = 0
+        self.documents = {}
+        self.update_times = {}
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpc_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references):
+        self._rpc()
+        with self._lock:
+            return [FakeDocumentSnapshot(reference, self.documents.get(reference.path),
+                                         self.update_times.get(reference.path)) for reference in references]
+
+    def write_option(self, last_update_time=None):
+        return FakeWriteOption(last_update_time)
+
+    def _check(self, path, option):
+        if option is not None and self.update_times.get(path) != option.last_update_time:
+            raise FailedPrecondition(f"Document was modified since it was read: {path}")
+
+    def _set(self, path, data, merge=False):
+        with self._lock:
+            if merge and path in self.documents:
+                self.documents[path].update(copy.deepcopy(data))
+            else:
+                self.documents[path] = copy.deepcopy(data)
+            self.update_times[path] = next(self._clock)
+            return FakeWriteResult(self.update_times[path])
+
+    def _update(self, path, data, option=None):
+        with self._lock:
+            if path not in self.documents:
+                raise NotFound(f"No document to update: {path}")
+            self._check(path, option)
+            self.documents[path].update(copy.deepcopy(data))
+            self.update_times[path] = next(self._clock)
+            return FakeWriteResult(self.update_times[path])
+
+
+class FakeWriteResult:
+    """
+    In-memory stand-in for a Firestore `WriteResult`.
+    """
+
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeWriteOption:
+    """
+    In-memory stand-in for the write option returned by `firestore.Client.write_option`.
+    """
+
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class FakeDocumentReference:
+    """
+    In-memory stand-in for a Firestore `DocumentReference`.
+    """
+
+    def __init__(self, db, collection_name, doc_id):
+        self._db = db
+        self.id = doc_id
+        self.path = f"{collection_name}/{doc_id}"
+
+    def get(self):
+        self._db._rpc()  # pylint: disable=W0212
+        with self._db._lock:  # pylint: disable=W0212
+            return FakeDocumentSnapshot(self, self._db.documents.get(self.path), self._db.update_times.get(self.path))
+
+    def set(self, data, merge=False):
+        self._db._rpc()  # pylint: disable=W0212
+        return self._db._set(self.path, data, merge)  # pylint: disable=W0212
+
+    def update(self, data, option=None):
+        self._db._rpc()  # pylint: disable=W0212
+        return self._db._update(self.path, data, option)  # pylint: disable=W0212
+
+
+class FakeDocumentSnapshot:
+    """
+    In-memory stand-in for a Firestore `DocumentSnapshot`.
+    """
+
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class FakeQuery:
+    """
+    In-memory stand-in for a Firestore collection and the queries built from it.
+    """
+
+    OPERATORS = {
+        '==': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a is not None and a < b,
+        '<=': lambda a, b: a is not None and a <= b,
+        '>': lambda a, b: a is not None and a > b,
+        '>=': lambda a, b: a is not None and a >= b,
+        'in': lambda a, b: a in b,
+    }
+
+    def __init__(self, db, collection_name, filters=(), limit=None, start_after=None):
+        self._db = db
+        self._collection_name = collection_name
+        self._filters = tuple(filters)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = {'filters': self._filters, 'limit': self._limit, 'start_after': self._start_after}
+        state.update(changes)
+        return FakeQuery(self._db, self._collection_name, **state)
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self._db, self._collection_name, doc_id)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):  # pylint: disable=W0622
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        # Documents are ordered by path, like Firestore orders by document name
+        return self._copy(start_after=snapshot.reference.path)
+
+    def stream(self):
+        self._db._rpc()  # pylint: disable=W0212
+        prefix = f"{self._collection_name}/"
+        with self._db._lock:  # pylint: disable=W0212
+            items = sorted((path, copy.deepcopy(data), self._db.update_times.get(path))  # pylint: disable=W0212
+                           for path, data in self._db.documents.items() if path.startswith(prefix))
+        matched = 0
+        for path, data, update_time in items:
+            if self._start_after is not None and path <= self._start_after:
+                continue
+            if all(self.OPERATORS[op](data.get(field), value) for field, op, value in self._filters):
+                yield FakeDocumentSnapshot(self.document(path[len(prefix):]), data, update_time)
+                matched += 1
+                if self._limit is not None and matched >= self._limit:
+                    return
+
+
+class FakeWriteBatch:
+    """
+    In-memory stand-in for a Firestore `WriteBatch`. A commit is one RPC and applies all writes atomically: if a
+    precondition fails, none of the writes are applied.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference.path, document_data, merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference.path, field_updates, option))
+
+    def commit(self):
+        db = self._db
+        db._rpc()  # pylint: disable=W0212
+        with db._lock:  # pylint: disable=W0212
+            for operation, path, _, option in self._writes:
+                if operation == 'update':
+                    if path not in db.documents:
+                        raise NotFound(f"No document to update: {path}")
+                    db._check(path, option)  # pylint: disable=W0212
+            return [db._set(path, data, extra) if operation == 'set'  # pylint: disable=W0212
+                    else db._update(path, data)  # pylint: disable=W0212
+                    for operation, path, data, extra in self._writes]
+
+
+class FakeMilvusCollection:
+    """
+    In-memory stand-in for `pymilvus.Collection` with the schema LangChain creates: 'pk', 'text', 'vector' and one
+    field per metadata key.
+
+    Every request costs `latency` seconds plus `seconds_per_row` per inserted row, and flushes cost `flush_latency`
+    seconds, since Milvus seals the growing segments on flush. With `auto_id=False` the primary keys are passed in
+    and `delete` accepts 'pk in [...]' expressions.
+
+    Attributes:
+        rpc_count (int): Number of requests made against the fake.
+        rows (list): Inserted rows, as dicts keyed by field name.
+        index_built_at_rows (int): Number of rows in the collection when the index was built, or None.
+    """
+
+    def __init__(self, metadata_fields=(('source', 'VARCHAR'), ('page', 'INT64')), latency=0.0,
+                 seconds_per_row=0.0, flush_latency=0.0, auto_id=True):
+        fields = [('pk', 'INT64', auto_id), ('text', 'VARCHAR', False), ('vector', 'FLOAT_VECTOR', False)]
+        fields += [(name, dtype, False) for name, dtype in metadata_fields]
+        self.schema = types.SimpleNamespace(fields=[
+            types.SimpleNamespace(name=name, dtype=types.SimpleNamespace(name=dtype), auto_id=auto_id)
+            for name, dtype, auto_id in fields
+        ])
+        self.latency = latency
+        self.seconds_per_row = seconds_per_row
+        self.flush_latency = flush_latency
+        self.rpc_count = 0
+        self.rows = []
+        self.index_built_at_rows = None
+        self._lock = threading.Lock()
+
+    def _rpc(self, seconds):
+        with self._lock:
+            self.rpc_count += 1
+        if seconds:
+            time.sleep(seconds)
+
+    def insert(self, columns):
+        names = [field.name for field in self.schema.fields if not field.auto_id]
+        if len(columns) != len(names) or len({len(column) for column in columns}) != 1:
+            raise ValueError(f"Expected {len(names)} columns of equal length for fields {names}")
+        self._rpc(self.latency + self.seconds_per_row * len(columns[0]))
+        with self._lock:
+            self.rows.extend(dict(zip(names, values)) for values in zip(*columns))
+
+    def delete(self, expr):
+        match = re.fullmatch(r'pk in \[([\d, ]*)\]', expr)
+        if match is None:
+            raise ValueError(f"Unsupported delete expression: {expr}")
+        ids = {int(pk) for pk in match.group(1).split(',') if pk.strip()}
+        self._rpc(self.latency)
+        with self._lock:
+            self.rows = [row for row in self.rows if row.get('pk') not in ids]
+
+    def flush(self):
+        self._rpc(self.latency + self.flush_latency)
+
+    def create_index(self, field_name, index_params):
+        self._rpc(self.latency)
+        self.index_built_at_rows = len(self.rows)
+
+    def load(self):
+        self._rpc(self.latency)
+
+    @property
+    def num_entities(self):
+        self._rpc(self.latency)
+        return len(self.rows)
+
+
+class FakeMilvusClient:
+    """
+    In-memory stand-in for `pymilvus.MilvusClient`, serving one FakeMilvusCollection.
+
+    Attributes:
+        collection (FakeMilvusCollection): The collection.
+    """
+
+    _using = 'fake'
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def num_entities(self, collection_name):
+        return self.collection.num_entities
+
+
+class FakeStorageClient:
+    """
+    In-memory stand-in for `storage.Client`. Uploads and downloads are one RPC each, bucket handles none.
+
+    Attributes:
+        latency (float): Simulated round-trip time of one RPC in seconds.
+        rpc_count (int): Number of RPCs made against the fake.
+        objects (dict): Stored blobs as bytes, keyed by (bucket, name).
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rpc_count = 0
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpc_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bucket(self, bucket_name):
+        return FakeBucket(self, bucket_name)
+
+
+class FakeBucket:
+    """
+    In-memory stand-in for a GCS `Bucket`.
+    """
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name):
+        return FakeBlob(self, blob_name)
+
+
+class FakeBlob:
+    """
+    In-memory stand-in for a GCS `Blob`.
+    """
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_string(self, data, content_type=None):
+        client = self.bucket.client
+        client._rpc()  # pylint: disable=W0212
+        with client._lock:  # pylint: disable=W0212
+            client.objects[(self.bucket.name, self.name)] = data.encode('utf-8') if isinstance(data, str) else data
+
+    def download_as_bytes(self):
+        client = self.bucket.client
+        client._rpc()  # pylint: disable=W0212
+        with client._lock:  # pylint: disable=W0212
+            if (self.bucket.name, self.name) not in client.objects:
+                raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+            return client.objects[(self.bucket.name, self.name)]
+
+
+class FakeBigQueryClient:
+    """
+    In-memory stand-in for `bigquery.Client`. Every table exists, rows are appended to `rows` by streaming inserts
+    and NDJSON load jobs.
+
+    Attributes:
+        project (str): The project of the tables.
+        latency (float): Simulated round-trip time of one RPC in seconds.
+        rpc_count (int): Number of RPCs made against the fake.
+        rows (dict): Inserted rows, keyed by table ID.
+    """
+
+    def __init__(self, project='bench', latency=0.0):
+        self.project = project
+        self.latency = latency
+        self.rpc_count = 0
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpc_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def dataset(self, dataset_id):
+        return types.SimpleNamespace(table=lambda table_id: f"{self.project}.{dataset_id}.{table_id}")
+
+    def get_table(self, table_ref):
+        self._rpc()
+        return types.SimpleNamespace(table_id=str(table_ref))
+
+    def insert_rows_json(self, table, rows):
+        self._rpc()
+        with self._lock:
+            self.rows.setdefault(table.table_id, []).extend(rows)
+        return []
+
+    def load_table_from_file(self, file_obj, table, job_config=None):
+        self._rpc()
+        rows = [json.loads(line) for line in file_obj.read().decode('utf-8').splitlines() if line.strip()]
+        with self._lock:
+            self.rows.setdefault(table.table_id, []).extend(rows)
+        return types.SimpleNamespace(result=lambda: None, output_rows=len(rows))
+
+
+class FakeEmbeddings:
+    """
+    Stand-in for LangChain embeddings that returns deterministic vectors derived from the text.
+
+    Every request of up to `batch_size` texts costs `latency` seconds plus `seconds_per_text` per text.
+
+    Attributes:
+        dimension (int): Size of the vectors.
+        rpc_count (int): Number of embedding requests.
+        texts_embedded (int): Number of texts embedded.
+    """
+
+    def __init__(self, dimension=64, batch_size=1000, latency=0.0, seconds_per_text=0.0):
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.latency = latency
+        self.seconds_per_text = seconds_per_text
+        self.rpc_count = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return [digest[i % len(digest)] / 255.0 for i in range(self.dimension)]
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            with self._lock:
+                self.rpc_count += 1
+                self.texts_embedded += len(batch)
+            if self.latency or self.seconds_per_text:
+                time.sleep(self.latency + self.seconds_per_text * len(batch))
+            vectors.extend(self._vector(text) for text in batch)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,182 @@
+"""
+This module provides the BufferedBigQuerySink class, which collects audit rows and writes them to BigQuery in bulk.
+
+Rows are either sent with one streaming insert per `batch_size` rows, or appended to a local NDJSON spool file and
+written with a single load job when the sink is flushed. Load jobs are free of streaming insert costs, and rows in
+the spool file survive a crash and are loaded by the next flush. The spool file stays open and rows are written to
+it in batches, so a crash loses at most the last `batch_size` rows.
+
+After a failed streaming insert, the rows stay buffered and the sink backs off exponentially before the next insert,
+so that a failing API is not called again for every added row. Rows that still cannot be inserted when the sink is
+flushed are appended to an NDJSON fallback file instead of being lost with the process. Every flush writes the
+fallback file with a load job, like the spool file.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+# Longest wait in seconds between two inserts after failures
+MAX_BACKOFF = 300
+# File for the rows of failed streaming inserts, in the working directory
+FALLBACK_PATH = 'bigquery_fallback.ndjson'
+
+
+class BufferedBigQuerySink:
+    """
+    Buffer rows for a BigQuery table and write them in bulk.
+
+    Attributes:
+        bq_client (bigquery.Client): BigQuery client.
+        table_ref (str): Fully qualified table ID, 'project.dataset.table'.
+        batch_size (int): Number of buffered rows that triggers a streaming insert or a write to the spool file.
+        spool_path (str): NDJSON spool file for load jobs, or None to use streaming inserts.
+        fallback_path (str): NDJSON file for the rows that streaming inserts failed to write by the time of a flush.
+        base_sleep_time (float): Backoff in seconds after the first failed insert, doubled on every failure.
+    """
+
+    def __init__(self, bq_client, table_ref, batch_size=500, spool_path=None, fallback_path=FALLBACK_PATH,
+                 base_sleep_time=1):
+        """
+        Initialize the sink.
+
+        Parameters:
+        bq_client (bigquery.Client): BigQuery client.
+        table_ref (str): Fully qualified table ID, 'project.dataset.table'.
+        batch_size (int): Number of buffered rows that triggers a streaming insert or a write to the spool file.
+        spool_path (str, optional): If given, rows are spooled to this NDJSON file and written with a load job
+            on `flush` instead of streaming inserts.
+        fallback_path (str): NDJSON file for the rows that streaming inserts failed to write by the time of a
+            flush. It is written with a load job by the next flush.
+        base_sleep_time (float): Backoff in seconds after the first failed insert, doubled on every failure.
+        """
+        self.bq_client = bq_client
+        self.table_ref = table_ref
+        self.batch_size = batch_size
+        self.spool_path = spool_path
+        self.fallback_path = fallback_path
+        self.base_sleep_time = base_sleep_time
+        self._rows = []
+        self._table = None
+        self._spool_file = None
+        self._failures = 0
+        # No insert triggered by `add` before this time after a failed one
+        self._retry_at = 0.0
+        self._lock = threading.RLock()
+
+    def _get_table(self):
+        """
+        Get the table once and reuse it for all later writes.
+        """
+        if self._table is None:
+            self._table = self.bq_client.get_table(self.table_ref)
+        return self._table
+
+    def add(self, row):
+        """
+        Buffer a row.
+
+        Parameters:
+        row (dict): The row to write, matching the table schema.
+        """
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) < self.batch_size:
+                return
+            if self.spool_path:
+                self._write_spool()
+            elif time.monotonic() >= self._retry_at:
+                self._insert_rows()
+
+    def flush(self):
+        """
+        Write all buffered rows to BigQuery, also while backing off after a failure. Rows whose streaming insert
+        fails are appended to the fallback file.
+        """
+        with self._lock:
+            if self.spool_path:
+                self._write_spool()
+                if self._spool_file is not None:
+                    self._spool_file.close()
+                    self._spool_file = None
+                self._load_file(self.spool_path)
+                return
+            if self._rows:
+                self._insert_rows()
+            if self._rows:
+                self._write_fallback()
+            self._load_file(self.fallback_path)
+
+    def _write_spool(self):
+        """
+        Append the buffered rows to the spool file, opened once and kept open until the next flush.
+        """
+        if not self._rows:
+            return
+        if self._spool_file is None:
+            self._spool_file = open(self.spool_path, 'a', encoding='utf-8')  # pylint: disable=R1732
+        self._spool_file.write(''.join(json.dumps(row) + '\n' for row in self._rows))
+        self._spool_file.flush()
+        self._rows = []
+
+    def _write_fallback(self):
+        """
+        Append the buffered rows to the fallback file.
+        """
+        with open(self.fallback_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(row) + '\n' for row in self._rows))
+        logger.warning(f"Wrote {len(self._rows)} rows that could not be inserted into {self.table_ref} to "
+                       f"{self.fallback_path}")
+        self._rows = []
+
+    def _insert_rows(self):
+        """
+        Write the buffered rows with one streaming insert per `batch_size` rows. If a request fails, its rows and
+        the rows after them are kept for the next insert, which `add` only triggers after an exponential backoff.
+        """
+        while self._rows:
+            rows = self._rows[:self.batch_size]
+            try:
+                errors = self.bq_client.insert_rows_json(self._get_table(), rows)
+            except Exception as err:  # pylint: disable=W0718
+                sleep_time = min(self.base_sleep_time * 2 ** self._failures, MAX_BACKOFF)
+                self._failures += 1
+                self._retry_at = time.monotonic() + sleep_time
+                logger.error(f"Failed to insert {len(rows)} rows into {self.table_ref}, keeping {len(self._rows)} "
+                             f"rows and retrying in {sleep_time} seconds: {err}")
+                return
+            del self._rows[:len(rows)]
+            self._failures = 0
+            self._retry_at = 0.0
+            if errors:
+                logger.error(f"Encountered errors while inserting/updating rows: {errors}")
+            else:
+                logger.info(f"{len(rows)} rows successfully inserted into table {self.table_ref}.")
+
+    def _load_file(self, path):
+        """
+        Write an NDJSON file, the spool or the fallback file, with one load job and delete it once the job has
+        succeeded.
+        """
+        if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        try:
+            with open(path, 'rb') as f:
+                job = self.bq_client.load_table_from_file(f, self._get_table(), job_config=job_config)
+            job.result()
+        except Exception as err:  # pylint: disable=W0718
+            logger.error(f"Failed to load {path} into {self.table_ref}, keeping the file: {err}")
+            return
+
+        logger.info(f"{job.output_rows} rows successfully loaded into table {self.table_ref}.")
+        os.remove(path)
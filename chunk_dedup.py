@@ -0,0 +1,221 @@
+"""
+This module provides the ChunkDeduplicator class, which drops near-duplicate chunks before they are embedded.
+
+Each chunk is reduced to a MinHash signature over its word shingles. Signatures are split into bands and indexed
+with locality sensitive hashing (LSH), so a new chunk is only compared with kept chunks that share at least one band.
+A chunk whose estimated Jaccard similarity with a kept chunk reaches the threshold is dropped, and its source is
+recorded as sharing the kept chunk. If the kept chunks are given an owner and a key, e.g. the Firestore document and
+the Milvus primary key, the deduplicator also records which keys of every owner are shared, so that they are not
+deleted while the dropped copies depend on them.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _lsh_params(num_perm, threshold):
+    """
+    Choose the number of bands and rows per band whose LSH threshold (1/b)^(1/r) is closest to `threshold`.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class ChunkDeduplicator:
+    """
+    Filter near-duplicate chunks with MinHash and LSH. The index lives for the lifetime of the instance, so chunks
+    are deduplicated across all batches of a run.
+
+    Attributes:
+        threshold (float): Estimated Jaccard similarity at which a chunk counts as a duplicate.
+        num_perm (int): Number of hash permutations in a signature.
+        shingle_size (int): Number of words per shingle.
+        seen (int): Number of chunks checked.
+        dropped (int): Number of chunks dropped as duplicates.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, shingle_size=5, seed=1):
+        """
+        Initialize the deduplicator.
+
+        Parameters:
+        threshold (float): Estimated Jaccard similarity at which a chunk counts as a duplicate, between 0 and 1.
+        num_perm (int): Number of hash permutations in a signature.
+        shingle_size (int): Number of words per shingle.
+        seed (int): Seed of the hash permutations.
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(f"The dedup threshold must be between 0 and 1, got {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seen = 0
+        self.dropped = 0
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._bands, self._rows = _lsh_params(num_perm, threshold)
+        self._buckets = [defaultdict(list) for _ in range(self._bands)]
+        self._signatures = []
+        self._keys = []
+        self._shared_sources = []
+        self._owners = []
+        self._referenced = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def _shingles(self, text):
+        words = re.findall(r'\w+', text.lower())
+        if len(words) <= self.shingle_size:
+            return {' '.join(words)}
+        return {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        """
+        Compute the MinHash signature of a text.
+
+        Parameters:
+        text (str): The text.
+
+        Returns:
+        numpy.ndarray: The signature, `num_perm` unsigned integers.
+        """
+        hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in self._shingles(text)), dtype=np.uint64)
+        # Overflow of the multiplication is intended, as in the usual universal hashing of MinHash
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        return [signature[i * self._rows:(i + 1) * self._rows].tobytes() for i in range(self._bands)]
+
+    def _find_duplicate(self, signature, band_keys):
+        """
+        Get the index of a kept chunk similar to the signature, or None.
+        """
+        candidates = set()
+        for bucket, key in zip(self._buckets, band_keys):
+            candidates.update(bucket.get(key, ()))
+        for index in sorted(candidates):
+            if np.mean(self._signatures[index] == signature) >= self.threshold:
+                return index
+        return None
+
+    def filter(self, docs, owner=None, keys=None):
+        """
+        Drop the documents that are near duplicates of a document kept earlier.
+
+        Parameters:
+        docs (list): LangChain documents, usually the chunks of `split_documents`.
+        owner (optional): Identifies the file of the documents, e.g. its Firestore document ID.
+        keys (list, optional): The keys the kept documents are stored under, in order: the first kept document
+            gets the first key, and so on. Must hold at least one key per document.
+
+        Returns:
+        list: The documents to embed.
+        """
+        kept = []
+        for doc in docs:
+            source = doc.metadata.get('source')
+            signature = self.signature(doc.page_content)
+            band_keys = self._band_keys(signature)
+            key = keys[len(kept)] if keys is not None else None
+            with self._lock:
+                if self._keep(doc, source, signature, band_keys, (owner, key)):
+                    kept.append(doc)
+        return kept
+
+    def _keep(self, doc, source, signature, band_keys, owner_key):
+        """
+        Add a chunk to the index, or record its source on the kept chunk it duplicates.
+
+        Returns:
+        bool: True if the chunk is kept.
+        """
+        self.seen += 1
+        index = self._find_duplicate(signature, band_keys)
+        if index is not None:
+            self.dropped += 1
+            self._shared_sources[index].add(source)
+            owner, key = self._owners[index]
+            if key is not None and owner != owner_key[0]:
+                self._referenced[owner].add(key)
+            return False
+
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._keys.append(hashlib.sha1(doc.page_content.encode()).hexdigest())
+        self._shared_sources.append({source})
+        self._owners.append(owner_key)
+        for bucket, key in zip(self._buckets, band_keys):
+            bucket[key].append(index)
+        return True
+
+    def referenced_keys(self, owner):
+        """
+        Get the keys of the kept chunks of an owner that other chunks were dropped for.
+
+        Parameters:
+        owner: The owner passed to `filter`.
+
+        Returns:
+        set: The keys.
+        """
+        with self._lock:
+            return set(self._referenced.get(owner, ()))
+
+    def shared_sources(self):
+        """
+        Get the sources of every kept chunk that was found in more than one source.
+
+        Returns:
+        dict: Maps the SHA-1 of the kept chunk text to the sorted list of sources containing the chunk.
+        """
+        return {
+            key: sorted(str(source) for source in sources)
+            for key, sources in zip(self._keys, self._shared_sources)
+            if len(sources) > 1
+        }
+
+    def write_report(self, path):
+        """
+        Write the statistics and the shared sources of the kept chunks to a JSON file.
+
+        Parameters:
+        path (str): The path of the report.
+        """
+        report = {
+            'threshold': self.threshold,
+            'chunks_seen': self.seen,
+            'chunks_dropped': self.dropped,
+            'shared_sources': self.shared_sources(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Wrote dedup report to {path}")
+
+    def log_summary(self):
+        """
+        Log how many chunks were dropped, i.e. how many embedding requests and vectors were saved.
+        """
+        ratio = self.dropped / self.seen if self.seen else 0
+        logger.info(f"Dedup: {self.dropped} of {self.seen} chunks were near duplicates ({ratio:.1%}). "
+                    f"Saved {self.dropped} embeddings and {self.dropped} vectors.")
@@ -0,0 +1,163 @@
+"""
+This module provides the ContentCache class, a local on-disk cache for fetched page content.
+
+LinkCollectorService fills the cache while crawling and ScraperService reads from it, so that every page is
+downloaded only once per run. Entries are keyed by the URL hash used for the Firestore document IDs, stored
+zlib-compressed and evicted in least-recently-used order once the cache grows beyond its size limit.
+"""
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    """
+    A cached HTTP response that offers the parts of the `requests.Response` interface used by the services.
+
+    Attributes:
+        url (str): The URL the content was fetched from.
+        content (bytes): The raw response body.
+        headers (dict): The response headers that were cached.
+        encoding (str): The text encoding of the body.
+        status_code (int): Always 200, only successful responses are cached.
+    """
+
+    def __init__(self, url, content, headers, encoding):
+        self.url = url
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding
+        self.status_code = 200
+
+    @property
+    def text(self):
+        """
+        The body decoded with the cached encoding.
+        """
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def raise_for_status(self):
+        """
+        Cached responses are always successful.
+        """
+
+
+class ContentCache:
+    """
+    Size-bounded, compressed on-disk cache of page content with LRU eviction.
+
+    Attributes:
+        directory (str): Directory the cache files are stored in.
+        max_bytes (int): Maximum total size of the compressed cache files.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        """
+        Open the cache directory and index the entries it already contains.
+
+        Parameters:
+        directory (str): Directory the cache files are stored in. It is created if it does not exist.
+        max_bytes (int): Maximum total size of the compressed cache files.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith('.z'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-2], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+        logger.info(f"Content cache {directory}: {len(self._entries)} entries, {self._size} bytes")
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.z")
+
+    def put(self, key, url, content, headers, encoding=None):
+        """
+        Store a response body in the cache, evicting the least recently used entries if needed.
+
+        Parameters:
+        key (str): The cache key, usually the hashed URL.
+        url (str): The URL the content was fetched from.
+        content (bytes): The raw response body.
+        headers (dict): Response headers to keep with the body, e.g. Content-Type.
+        encoding (str, optional): The text encoding of the body.
+        """
+        header = json.dumps({'url': url, 'headers': dict(headers), 'encoding': encoding}).encode()
+        data = zlib.compress(header + b'\n' + content)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def get(self, key):
+        """
+        Read a response from the cache.
+
+        Parameters:
+        key (str): The cache key, usually the hashed URL.
+
+        Returns:
+        CachedResponse: The cached response, or None if the key is not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            os.utime(path)
+        except (OSError, zlib.error) as err:
+            logger.error(f"Failed to read content cache entry {key}: {err}")
+            self._discard(key)
+            return None
+
+        header, _, content = data.partition(b'\n')
+        meta = json.loads(header)
+        return CachedResponse(meta['url'], content, meta['headers'], meta['encoding'])
+
+    def _discard(self, key):
+        """
+        Remove an entry from the index and delete its file.
+        """
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache fits into `max_bytes`. Must hold the lock.
+        """
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted content cache entry {key}")
@@ -0,0 +1,217 @@
+"""
+This module provides the CrawlFrontier class, a crawl queue and visited set that can be persisted to SQLite.
+
+The frontier keeps its working state in memory (a deque per host for the queue and sets for membership checks) and
+hands out URLs round-robin across hosts, so that the crawl of several sites makes progress on all of them. It writes
+changes to a local SQLite file every `flush_interval` completed URLs. A crawl that is interrupted can then be resumed
+from the last flush instead of starting again from the start URL.
+"""
+import logging
+import sqlite3
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlFrontier:
+    """
+    Crawl frontier with an optional SQLite checkpoint file. URLs of the same host are handed out in FIFO order, and
+    the hosts take turns.
+
+    URLs are handed out with `pop` and must be confirmed with `task_done` once they have been processed. Only
+    confirmed URLs are removed from the persisted queue, so URLs that were in flight during a crash are fetched
+    again on resume.
+
+    Attributes:
+        path (str): Path of the SQLite file, or None to keep the frontier in memory only.
+        flush_interval (int): Number of completed URLs after which the state is written to disk.
+        before_flush (callable): Called before every flush, e.g. to commit buffered writes of completed URLs. If it
+            raises, nothing is written to disk.
+        pages_scraped (int): Number of pages collected so far, persisted with the queue.
+    """
+
+    def __init__(self, path=None, flush_interval=100, before_flush=None):
+        """
+        Open the frontier and load any state left by a previous run.
+
+        Parameters:
+        path (str, optional): Path of the SQLite checkpoint file.
+        flush_interval (int): Number of completed URLs between two flushes.
+        before_flush (callable, optional): Called before every flush.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.before_flush = before_flush
+        self.pages_scraped = 0
+
+        # Queued (row ID, URL) tuples by host, in the order in which the hosts take turns
+        self._queues = OrderedDict()
+        self._size = 0
+        self._queued = set()
+        self._visited = set()
+        self._in_flight = {}
+        self._next_id = 0
+
+        self._pending_pushes = []
+        self._pending_visits = []
+        self._pending_deletes = []
+        self._completed_since_flush = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY, url TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);"
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            )
+            self._load()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, url):
+        return url in self._visited
+
+    def _load(self):
+        """
+        Load the queue, the visited set and the page counter from the SQLite file.
+        """
+        for row_id, url in self._conn.execute("SELECT id, url FROM queue ORDER BY id"):
+            self._enqueue(row_id, url)
+            self._next_id = row_id + 1
+        self._visited.update(url for (url,) in self._conn.execute("SELECT url FROM visited"))
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'pages_scraped'").fetchone()
+        if row:
+            self.pages_scraped = int(row[0])
+        if self._size or self._visited:
+            logger.info(f"Resuming crawl frontier from {self.path}: {self._size} queued, "
+                        f"{len(self._visited)} visited, {self.pages_scraped} pages scraped")
+
+    def is_empty(self):
+        """
+        Check whether the frontier holds no state at all, i.e. it has not been seeded yet.
+
+        Returns:
+        bool: True if nothing has been queued or visited.
+        """
+        return not self._size and not self._visited and not self._in_flight
+
+    def _enqueue(self, row_id, url):
+        self._queues.setdefault(urlparse(url).netloc, deque()).append((row_id, url))
+        self._queued.add(url)
+        self._size += 1
+
+    def push(self, url):
+        """
+        Add a URL to the end of the queue unless it is already queued or visited.
+
+        Parameters:
+        url (str): The URL to add.
+
+        Returns:
+        bool: True if the URL was added.
+        """
+        if url in self._visited or url in self._queued:
+            return False
+        row_id = self._next_id
+        self._next_id += 1
+        self._enqueue(row_id, url)
+        self._pending_pushes.append((row_id, url))
+        return True
+
+    def pop(self, ready=None):
+        """
+        Take the next URL of the next host in turn and mark it as visited. The host then moves to the end of the
+        turn order.
+
+        Parameters:
+        ready (callable, optional): Called with a host name. Hosts for which it returns False are skipped, e.g.
+            because they already have as many requests in flight as politeness allows.
+
+        Returns:
+        str: The next URL, or None if the queue is empty or no host is ready.
+        """
+        host = next((host for host in self._queues if ready is None or ready(host)), None)
+        if host is None:
+            return None
+        queue = self._queues[host]
+        row_id, url = queue.popleft()
+        if queue:
+            self._queues.move_to_end(host)
+        else:
+            del self._queues[host]
+        self._size -= 1
+        self._queued.discard(url)
+        self._visited.add(url)
+        self._in_flight[url] = row_id
+        return url
+
+    def task_done(self, url, scraped=False):
+        """
+        Confirm that a URL returned by `pop` has been processed.
+
+        Parameters:
+        url (str): The URL that was processed.
+        scraped (bool): Whether the URL counted as a collected page.
+        """
+        row_id = self._in_flight.pop(url, None)
+        if row_id is not None:
+            self._pending_deletes.append((row_id,))
+        self._pending_visits.append((url,))
+        if scraped:
+            self.pages_scraped += 1
+        self._completed_since_flush += 1
+        if self._completed_since_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all changes since the last flush to the SQLite file in one transaction.
+        """
+        self._completed_since_flush = 0
+        if self.before_flush is not None:
+            self.before_flush()
+        if self._conn is None:
+            self._pending_pushes, self._pending_visits, self._pending_deletes = [], [], []
+            return
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO queue (id, url) VALUES (?, ?)", self._pending_pushes)
+            self._conn.executemany("INSERT OR IGNORE INTO visited (url) VALUES (?)", self._pending_visits)
+            self._conn.executemany("DELETE FROM queue WHERE id = ?", self._pending_deletes)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('pages_scraped', ?)",
+                               (str(self.pages_scraped),))
+        self._pending_pushes, self._pending_visits, self._pending_deletes = [], [], []
+
+    def reset(self):
+        """
+        Discard all state, in memory and on disk, so that a new crawl can be seeded.
+        """
+        self._queues.clear()
+        self._size = 0
+        self._queued.clear()
+        self._visited.clear()
+        self._in_flight.clear()
+        self._pending_pushes, self._pending_visits, self._pending_deletes = [], [], []
+        self._completed_since_flush = 0
+        self._next_id = 0
+        self.pages_scraped = 0
+        if self._conn is not None:
+            with self._conn:
+                self._conn.execute("DELETE FROM queue")
+                self._conn.execute("DELETE FROM visited")
+                self._conn.execute("DELETE FROM meta")
+
+    def close(self, checkpoint=True):
+        """
+        Flush outstanding changes and close the SQLite file.
+
+        Parameters:
+        checkpoint (bool): Whether to flush. Without a flush, the file keeps the state of the last flush.
+        """
+        if checkpoint:
+            self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
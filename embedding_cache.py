@@ -0,0 +1,155 @@
+"""
+This module provides the CachedEmbeddings class, a persistent embedding cache in front of an embedding model.
+
+Embeddings are stored as float32 blobs in a local SQLite file, keyed by a hash of the model name and the chunk
+text. Only texts that are not in the cache are sent to the wrapped model. The cache holds at most `max_entries`
+vectors and evicts the least recently used ones beyond that.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of variables per statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain embeddings that look up vectors in a SQLite cache before calling the wrapped embeddings.
+
+    Attributes:
+        embeddings (Embeddings): The wrapped embedding model.
+        model_name (str): Name of the model, part of the cache key.
+        path (str): Path of the SQLite file.
+        max_entries (int): Maximum number of cached vectors.
+        hits (int): Number of texts served from the cache.
+        misses (int): Number of texts sent to the wrapped embeddings.
+    """
+
+    def __init__(self, embeddings, path, model_name, max_entries=1000000):
+        """
+        Open the cache.
+
+        Parameters:
+        embeddings (Embeddings): The wrapped embedding model.
+        path (str): Path of the SQLite file. It is created if it does not exist.
+        model_name (str): Name of the model, part of the cache key.
+        max_entries (int): Maximum number of cached vectors.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);"
+        )
+        # Counted once, then kept up to date by `_store`, since COUNT(*) scans the whole table
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of texts, calling the wrapped embeddings only for texts that are not cached.
+
+        Parameters:
+        texts (list): The texts to embed.
+
+        Returns:
+        list: One embedding per text, in the order of `texts`.
+        """
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(set(keys))
+
+        # Embed every missing text once, even if it occurs several times in the request
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        """
+        Embed a query text, using the cache.
+
+        Parameters:
+        text (str): The text to embed.
+
+        Returns:
+        list: The embedding.
+        """
+        return self.embed_documents([text])[0]
+
+    def _lookup(self, keys):
+        """
+        Read the cached vectors of the given keys and mark them as used.
+        """
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                           [(now, key) for key in found])
+        return found
+
+    def _store(self, vectors):
+        """
+        Write new vectors to the cache and evict the least recently used ones beyond `max_entries`.
+
+        A key stored in the meantime, e.g. by a concurrent call for the same text, keeps its vector, which is the
+        same for the same model and text.
+        """
+        now = time.time()
+        rows = [(key, array('f', vector).tobytes(), now) for key, vector in vectors.items()]
+        with self._lock, self._conn:
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows).rowcount
+            self._count += inserted
+            if self._count > self.max_entries:
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (self._count - self.max_entries,)
+                ).rowcount
+                self._count -= evicted
+                logger.info(f"Evicted {evicted} entries from the embedding cache")
+
+    def close(self):
+        """
+        Close the SQLite file.
+        """
+        with self._lock:
+            self._conn.close()
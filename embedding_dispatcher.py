@@ -0,0 +1,281 @@
+"""
+This module provides the EmbeddingDispatcher class, a concurrent, rate-limit-aware client for the OpenAI embeddings
+API.
+
+`OpenAIEmbeddings` sends its requests one after the other. The dispatcher packs the texts into requests by token
+budget, keeps several requests in flight and stays within the requests-per-minute and tokens-per-minute limits of
+the account with two token buckets. When the API answers 429 anyway, all requests pause for the advertised or an
+exponentially growing delay, and the number of requests in flight is halved and then grown back one by one.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import aiohttp
+from langchain.embeddings.base import Embeddings
+
+from metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Seconds of the per-minute limits that may be used in a burst. The API enforces its limits over short intervals.
+BURST_SECONDS = 1
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket refilled continuously at `rate_per_minute`. Waiters are served in order.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens in the bucket.
+    """
+
+    def __init__(self, rate_per_minute, burst_seconds=BURST_SECONDS):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    async def acquire(self, amount):
+        """
+        Wait until `amount` tokens are available and take them. Requests larger than the capacity wait for a full
+        bucket.
+
+        Parameters:
+        amount (float): The number of tokens to take.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio locks are bound to the event loop they are first used in
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class EmbeddingDispatcher(Embeddings):
+    """
+    LangChain embeddings that call the OpenAI embeddings API with several concurrent, rate-limited requests.
+
+    Attributes:
+        model (str): The embedding model.
+        max_tokens_per_request (int): Token budget of one request.
+        max_texts_per_request (int): Maximum number of texts in one request.
+        max_in_flight (int): Maximum number of concurrent requests.
+        requests_sent (int): Number of requests sent, including retries.
+        tokens_embedded (int): Number of tokens embedded, as reported by the API.
+        throttled (int): Number of requests answered with 429.
+    """
+
+    def __init__(self, model="text-embedding-ada-002", api_key=None, api_base=None, max_tokens_per_request=8000,
+                 max_texts_per_request=2048, max_in_flight=8, requests_per_minute=3000,
+                 tokens_per_minute=1000000, max_retries=8, base_sleep_time=1, timeout=60, token_counter=None):
+        """
+        Initialize the dispatcher.
+
+        Parameters:
+        model (str): The embedding model.
+        api_key (str, optional): The OpenAI API key. Defaults to OPENAI_API_KEY.
+        api_base (str, optional): The API base URL. Defaults to OPENAI_API_BASE or the public OpenAI API.
+        max_tokens_per_request (int): Token budget of one request.
+        max_texts_per_request (int): Maximum number of texts in one request.
+        max_in_flight (int): Maximum number of concurrent requests.
+        requests_per_minute (int): Requests-per-minute limit of the account.
+        tokens_per_minute (int): Tokens-per-minute limit of the account.
+        max_retries (int): Number of attempts per request on 429, 5xx and connection errors.
+        base_sleep_time (float): Initial backoff in seconds, doubled on every retry.
+        timeout (float): Timeout of one request in seconds.
+        token_counter (callable, optional): Returns the number of tokens of a text. Defaults to the tiktoken
+            encoding of the model.
+        """
+        self.model = model
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.api_base = (api_base or os.getenv('OPENAI_API_BASE') or 'https://api.openai.com/v1').rstrip('/')
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_texts_per_request = max_texts_per_request
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_sleep_time = base_sleep_time
+        self.timeout = timeout
+        self.token_counter = token_counter or self._tiktoken_counter(model)
+
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.requests_sent = 0
+        self.tokens_embedded = 0
+        self.throttled = 0
+
+        self._limit = float(max_in_flight)
+        self._in_flight = 0
+        self._pause_until = 0.0
+        self._condition = None
+        self._call_lock = threading.Lock()
+
+    @staticmethod
+    def _tiktoken_counter(model):
+        import tiktoken  # pylint: disable=C0415
+
+        encoding = tiktoken.encoding_for_model(model)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+    def embed_documents(self, texts):
+        """
+        Embed a list of texts.
+
+        Parameters:
+        texts (list): The texts to embed.
+
+        Returns:
+        list: One embedding per text, in the order of `texts`.
+        """
+        # Calls from several threads are serialized, they share the rate limits and already run concurrently inside
+        with self._call_lock:
+            return asyncio.run(self.aembed_documents(texts))
+
+    def embed_query(self, text):
+        """
+        Embed a query text.
+
+        Parameters:
+        text (str): The text to embed.
+
+        Returns:
+        list: The embedding.
+        """
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        """
+        Embed a list of texts with concurrent requests.
+
+        Parameters:
+        texts (list): The texts to embed.
+
+        Returns:
+        list: One embedding per text, in the order of `texts`.
+        """
+        if not texts:
+            return []
+        # OpenAI recommends replacing newlines, as OpenAIEmbeddings does
+        texts = [text.replace('\n', ' ') for text in texts]
+        counts = [self.token_counter(text) for text in texts]
+        packs = self._pack(counts)
+
+        start = time.perf_counter()
+        tokens_before = self.tokens_embedded
+        self._condition = asyncio.Condition()
+        embeddings = [None] * len(texts)
+        headers = {'Authorization': f'Bearer {self.api_key}'}
+        async with aiohttp.ClientSession(headers=headers,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+
+            async def embed_pack(indices):
+                vectors = await self._request(session, [texts[i] for i in indices], sum(counts[i] for i in indices))
+                for i, vector in zip(indices, vectors):
+                    embeddings[i] = vector
+
+            await asyncio.gather(*(embed_pack(indices) for indices in packs))
+
+        elapsed = time.perf_counter() - start
+        tokens = self.tokens_embedded - tokens_before
+        logger.debug(f"Embedded {len(texts)} texts ({tokens} tokens) in {len(packs)} requests in {elapsed:.2f} s, "
+                     f"{tokens / elapsed if elapsed else 0:.0f} tokens/s")
+        return embeddings
+
+    def _pack(self, counts):
+        """
+        Group text indices into requests of at most `max_tokens_per_request` tokens and `max_texts_per_request`
+        texts. A text larger than the budget gets a request of its own.
+        """
+        packs = []
+        current = []
+        current_tokens = 0
+        for i, count in enumerate(counts):
+            if current and (current_tokens + count > self.max_tokens_per_request
+                            or len(current) >= self.max_texts_per_request):
+                packs.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += count
+        if current:
+            packs.append(current)
+        return packs
+
+    async def _acquire_slot(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self._limit))
+            self._in_flight += 1
+
+    async def _release_slot(self, throttled):
+        async with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._limit = max(1.0, self._limit / 2)
+            else:
+                # Additive increase: about one more request in flight per round of successful requests
+                self._limit = min(float(self.max_in_flight), self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    async def _request(self, session, texts, tokens):
+        """
+        Send one embeddings request, retrying on 429, 5xx and connection errors.
+        """
+        for attempt in range(self.max_retries):
+            pause = self._pause_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(tokens)
+
+            await self._acquire_slot()
+            throttled = False
+            retry_after = None
+            try:
+                self.requests_sent += 1
+                async with session.post(f'{self.api_base}/embeddings',
+                                        json={'model': self.model, 'input': texts}) as response:
+                    if response.status not in RETRYABLE_STATUS:
+                        response.raise_for_status()
+                        payload = await response.json()
+                        self.tokens_embedded += payload.get('usage', {}).get('total_tokens', tokens)
+                        return [item['embedding'] for item in sorted(payload['data'], key=lambda d: d['index'])]
+                    throttled = response.status == 429
+                    retry_after = response.headers.get('Retry-After')
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                error = repr(err)
+            finally:
+                await self._release_slot(throttled)
+
+            sleep_time = self.base_sleep_time * 2 ** attempt * random.uniform(0.5, 1.5)
+            if retry_after is not None:
+                try:
+                    sleep_time = max(sleep_time, float(retry_after))
+                except ValueError:
+                    pass
+            RETRIES.labels('embeddings').inc()
+            if throttled:
+                self.throttled += 1
+                # Every request backs off, not only the one that was throttled
+                self._pause_until = max(self._pause_until, time.monotonic() + sleep_time)
+            logger.info(f"Embedding request of {len(texts)} texts failed with {error}. "
+                        f"Retrying in {sleep_time:.2f} seconds...")
+            await asyncio.sleep(sleep_time)
+
+        raise RuntimeError(f"Embedding request of {len(texts)} texts failed after {self.max_retries} attempts")
@@ -0,0 +1,269 @@
+"""
+This module provides the BufferedFirestoreWriter class, which coalesces Firestore document writes into batches.
+
+Writing one document per URL costs one synchronous round trip per write. The writer buffers `set` and `update`
+calls, merges repeated writes to the same document and commits them with Firestore batched writes once enough
+writes are buffered or the oldest buffered write is older than the flush interval. A background timer flushes
+writes that reach the flush interval while no new writes arrive.
+
+Writes that cannot be committed are never dropped silently: an explicit `flush` raises FirestoreWriteError, so that
+callers such as the crawl frontier do not checkpoint work whose state was not stored. A batch rejected with a
+non-retryable error is committed again one write at a time, so that only the writes Firestore rejects are dropped.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from google.api_core.exceptions import Aborted, DeadlineExceeded, GoogleAPICallError, ServiceUnavailable
+
+from metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Firestore accepts at most 500 writes per batch
+MAX_BATCH_SIZE = 500
+RETRYABLE_ERRORS = (Aborted, DeadlineExceeded, ServiceUnavailable)
+
+
+class FirestoreWriteError(Exception):
+    """
+    Raised by `BufferedFirestoreWriter.flush` when buffered writes could not be committed.
+
+    Attributes:
+        writes (list): The writes that were not committed.
+        requeued (bool): Whether the writes were buffered again to be retried by the next flush. Writes rejected
+            with a non-retryable error, e.g. NotFound or PermissionDenied, are not requeued.
+    """
+
+    def __init__(self, message, writes, requeued):
+        super().__init__(message)
+        self.writes = writes
+        self.requeued = requeued
+
+
+class BufferedFirestoreWriter:
+    """
+    Buffer Firestore writes and commit them in batches.
+
+    Attributes:
+        db (firestore.Client): Firestore client used to create the batches.
+        batch_size (int): Number of buffered writes that triggers a flush.
+        flush_interval (float): Age in seconds of the oldest buffered write that triggers a flush.
+        rpc_count (int): Number of batch commits sent to Firestore, including retries.
+        writes_committed (int): Number of document writes committed.
+    """
+
+    def __init__(self, db, batch_size=MAX_BATCH_SIZE, flush_interval=5.0, max_retries=5, base_sleep_time=1):
+        """
+        Initialize the writer.
+
+        Parameters:
+        db (firestore.Client): Firestore client used to create the batches.
+        batch_size (int): Number of buffered writes that triggers a flush, at most 500.
+        flush_interval (float): Age in seconds of the oldest buffered write that triggers a flush.
+        max_retries (int): Number of attempts to commit a batch.
+        base_sleep_time (float): Initial backoff in seconds between two attempts, doubled on every retry.
+        """
+        self.db = db
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_sleep_time = base_sleep_time
+
+        self.rpc_count = 0
+        self.writes_committed = 0
+
+        self._pending = OrderedDict()
+        self._oldest = None
+        # No automatic flush before this time after a failed one, so that a failing backend is not hammered
+        self._retry_at = 0.0
+        # Guards the buffer. Held only briefly, never while a batch is committed or a retry sleeps.
+        self._lock = threading.Lock()
+        # Serializes flushes, so that batches of the same document are committed in order
+        self._flush_lock = threading.RLock()
+        self._closed = threading.Event()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @staticmethod
+    def _combine(older, newer):
+        """
+        Combine two writes of the same document into one write with the same effect.
+        """
+        operation, doc_ref, data, merge = newer
+        if operation == 'set' and not merge:
+            return newer
+        previous_operation, _, previous_data, previous_merge = older
+        if operation == 'set':
+            # A merge on top of a buffered write keeps the earlier fields
+            return 'set', doc_ref, {**previous_data, **data}, previous_merge if previous_operation == 'set' else True
+        return previous_operation, doc_ref, {**previous_data, **data}, previous_merge
+
+    def _buffer(self, write):
+        path = write[1].path
+        with self._lock:
+            previous = self._pending.get(path)
+            self._pending[path] = write if previous is None else self._combine(previous, write)
+            now = time.monotonic()
+            if self._oldest is None:
+                self._oldest = now
+            due = (now >= self._retry_at
+                   and (len(self._pending) >= self.batch_size or now - self._oldest >= self.flush_interval))
+        if self._timer is None:
+            self._start_timer()
+        if due:
+            self._auto_flush()
+
+    def set(self, doc_ref, data, merge=False):
+        """
+        Buffer a `set` of a document.
+
+        Parameters:
+        doc_ref (DocumentReference): The document to write.
+        data (dict): The document data.
+        merge (bool): Whether to merge the data into an existing document.
+        """
+        self._buffer(('set', doc_ref, dict(data), merge))
+
+    def update(self, doc_ref, data):
+        """
+        Buffer an `update` of an existing document.
+
+        Parameters:
+        doc_ref (DocumentReference): The document to update.
+        data (dict): The fields to update.
+        """
+        self._buffer(('update', doc_ref, dict(data), False))
+
+    def _start_timer(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Thread(target=self._flush_periodically, name='firestore-flush', daemon=True)
+        self._timer.start()
+
+    def _flush_periodically(self):
+        """
+        Flush writes that reached the flush interval while no new writes arrived.
+        """
+        while not self._closed.wait(self.flush_interval / 2):
+            with self._lock:
+                now = time.monotonic()
+                due = self._oldest is not None and now >= self._retry_at and now - self._oldest >= self.flush_interval
+            if due:
+                self._auto_flush()
+
+    def _auto_flush(self):
+        """
+        Flush because of the batch size or the flush interval. A failure is logged instead of raised into the code
+        that buffered a write. The requeued writes are retried by the next flush.
+        """
+        try:
+            self.flush()
+        except FirestoreWriteError as err:
+            if err.requeued:
+                logger.error(f"Automatic flush failed, retrying after {self.flush_interval} seconds: {err}")
+            else:
+                logger.error(f"Automatic flush dropped {len(err.writes)} rejected writes: {err}")
+
+    def flush(self):
+        """
+        Commit all buffered writes in batches of at most `batch_size` writes.
+
+        Each batch is retried on its own with exponential backoff, so a failed batch does not cause the writes
+        of successful batches to be sent again. If a batch still fails, it and the batches after it are buffered
+        again, and FirestoreWriteError is raised. A batch rejected with a non-retryable error, e.g. NotFound for
+        one of its updates, is committed one write at a time. The rejected writes are dropped and reported with
+        FirestoreWriteError once all batches are committed.
+
+        Raises:
+        FirestoreWriteError: If a batch could not be committed, or if Firestore rejected writes.
+        """
+        with self._flush_lock:
+            with self._lock:
+                writes = list(self._pending.values())
+                self._pending.clear()
+                self._oldest = None
+            rejected = []
+            for start in range(0, len(writes), self.batch_size):
+                batch = writes[start:start + self.batch_size]
+                try:
+                    self._commit(batch)
+                except RETRYABLE_ERRORS as err:
+                    self._requeue(writes[start:])
+                    raise FirestoreWriteError(f"Failed to commit {len(batch)} Firestore writes after "
+                                              f"{self.max_retries} attempts: {err!r}", batch, True) from err
+                except GoogleAPICallError as err:
+                    logger.error(f"Firestore rejected a batch of {len(batch)} writes, committing them one at a "
+                                 f"time: {err!r}")
+                    for i, write in enumerate(batch):
+                        try:
+                            self._commit([write])
+                        except RETRYABLE_ERRORS as write_err:
+                            self._requeue(writes[start + i:])
+                            raise FirestoreWriteError(f"Failed to commit a Firestore write after {self.max_retries} "
+                                                      f"attempts: {write_err!r}", batch[i:], True) from write_err
+                        except GoogleAPICallError as write_err:
+                            logger.error(f"Firestore rejected the write of {write[1].path}: {write_err!r}")
+                            rejected.append(write)
+            if rejected:
+                raise FirestoreWriteError(f"Firestore rejected {len(rejected)} writes", rejected, False)
+
+    def _requeue(self, writes):
+        """
+        Put writes that were not committed back in front of the buffer. Writes buffered in the meantime take
+        precedence over them.
+        """
+        with self._lock:
+            pending = OrderedDict((write[1].path, write) for write in writes)
+            for path, write in self._pending.items():
+                pending[path] = self._combine(pending[path], write) if path in pending else write
+            self._pending = pending
+            now = time.monotonic()
+            self._oldest = now
+            self._retry_at = now + self.flush_interval
+
+    def _commit(self, writes):
+        """
+        Commit one batch of writes, retrying it on transient errors.
+
+        Parameters:
+        writes (list): The buffered writes of the batch.
+
+        Raises:
+        GoogleAPICallError: The error of the last attempt, if no attempt succeeded.
+        """
+        for i in range(self.max_retries):
+            batch = self.db.batch()
+            for operation, doc_ref, data, merge in writes:
+                if operation == 'set':
+                    batch.set(doc_ref, data, merge=merge)
+                else:
+                    batch.update(doc_ref, data)
+            try:
+                self.rpc_count += 1
+                batch.commit()
+                self.writes_committed += len(writes)
+                logger.info(f"Committed {len(writes)} writes to Firestore")
+                return
+            except RETRYABLE_ERRORS as err:
+                if i == self.max_retries - 1:
+                    raise
+                RETRIES.labels('firestore').inc()
+                sleep_time = self.base_sleep_time * 2 ** i
+                logger.error(f"{type(err).__name__} error occurred when committing {len(writes)} writes. "
+                             f"Retrying in {sleep_time} seconds...")
+                time.sleep(sleep_time)
+
+    def close(self):
+        """
+        Flush all buffered writes and stop the flush timer. Must be called when the owning service shuts down.
+
+        Raises:
+        FirestoreWriteError: If a batch could not be committed.
+        """
+        self._closed.set()
+        self.flush()
@@ -0,0 +1,61 @@
+"""
+This module provides the GCSTextLoader class, which loads plain text blobs from Google Cloud Storage as LangChain
+documents.
+
+ScraperService uploads the extracted text as UTF-8, so the blobs need no partitioning. The loader reads each blob
+into memory with one shared storage client and bucket handle, without temporary files.
+"""
+import logging
+
+from google.cloud import storage
+from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+
+class GCSTextLoader:
+    """
+    Load UTF-8 text blobs from a bucket as documents.
+
+    Attributes:
+        bucket_name (str): The name of the bucket.
+        storage_client (storage.Client): The storage client shared by all downloads.
+    """
+
+    def __init__(self, bucket_name, storage_client=None):
+        """
+        Initialize the loader.
+
+        Parameters:
+        bucket_name (str): The name of the bucket.
+        storage_client (storage.Client, optional): The storage client to use. A new one is created if not given.
+        """
+        self.bucket_name = bucket_name
+        self.storage_client = storage_client or storage.Client()
+        # `storage.Client.bucket` does not make an RPC, unlike `get_bucket`
+        self.bucket = self.storage_client.bucket(bucket_name)
+
+    def download(self, blob_name):
+        """
+        Download a blob into memory.
+
+        Parameters:
+        blob_name (str): The name of the blob.
+
+        Returns:
+        bytes: The content of the blob.
+        """
+        return self.bucket.blob(blob_name).download_as_bytes()
+
+    def load(self, blob_name):
+        """
+        Load a blob as a document.
+
+        Parameters:
+        blob_name (str): The name of the blob.
+
+        Returns:
+        list: A list with one document, whose 'source' metadata is the gs:// URI of the blob.
+        """
+        text = self.download(blob_name).decode('utf-8', errors='replace')
+        return [Document(page_content=text, metadata={'source': f'gs://{self.bucket_name}/{blob_name}'})]
@@ -0,0 +1,124 @@
+"""
+This module provides the GCSUploader class, a long-lived uploader that writes blobs to Google Cloud Storage in the
+background.
+
+The uploader reuses one storage client and one bucket handle per bucket, and runs the uploads in a bounded thread
+pool. When `max_pending` uploads are queued, `submit` blocks until one of them has finished, so a fast producer
+cannot buffer an unbounded amount of content in memory.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud import storage
+
+from metrics import BYTES_UPLOADED, UPLOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class GCSUploader:
+    """
+    Upload blobs to Google Cloud Storage with a bounded thread pool.
+
+    Attributes:
+        storage_client (storage.Client): The storage client shared by all uploads.
+        max_workers (int): Number of uploads running at the same time.
+        max_pending (int): Number of uploads that can be queued or running before `submit` blocks.
+    """
+
+    def __init__(self, storage_client=None, max_workers=8, max_pending=64):
+        """
+        Initialize the uploader.
+
+        Parameters:
+        storage_client (storage.Client, optional): The storage client to use. A new one is created if not given.
+        max_workers (int): Number of uploads running at the same time.
+        max_pending (int): Number of uploads that can be queued or running before `submit` blocks.
+        """
+        self.storage_client = storage_client or storage.Client()
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self._buckets = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gcs-upload')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = set()
+        self._lock = threading.Condition()
+
+    def _bucket(self, bucket_name):
+        """
+        Get a cached bucket handle. `storage.Client.bucket` does not make an RPC, unlike `get_bucket`.
+        """
+        with self._lock:
+            if bucket_name not in self._buckets:
+                self._buckets[bucket_name] = self.storage_client.bucket(bucket_name)
+            return self._buckets[bucket_name]
+
+    def upload(self, bucket_name, blob_name, data, content_type=None):
+        """
+        Upload a blob and wait for the upload to finish.
+
+        Parameters:
+        bucket_name (str): The name of the bucket.
+        blob_name (str): The name of the blob.
+        data (bytes or str): The content of the blob.
+        content_type (str, optional): The content type of the blob.
+
+        Returns:
+        str: The name of the uploaded blob.
+        """
+        blob = self._bucket(bucket_name).blob(blob_name)
+        with UPLOAD_SECONDS.time():
+            blob.upload_from_string(data, content_type=content_type)
+        BYTES_UPLOADED.inc(len(data.encode('utf-8') if isinstance(data, str) else data))
+        logger.debug(f"Uploaded to GCS: {bucket_name}/{blob_name}")
+        return blob_name
+
+    def submit(self, bucket_name, blob_name, data, content_type=None, callback=None):
+        """
+        Upload a blob in the background. Blocks while `max_pending` uploads are queued or running.
+
+        Parameters:
+        bucket_name (str): The name of the bucket.
+        blob_name (str): The name of the blob.
+        data (bytes or str): The content of the blob.
+        content_type (str, optional): The content type of the blob.
+        callback (callable, optional): Called with the future once the upload has finished. `join` waits for
+            the callback to return.
+
+        Returns:
+        concurrent.futures.Future: Resolves to the name of the uploaded blob, or raises the upload error.
+        """
+        self._slots.acquire()  # pylint: disable=R1732
+        try:
+            future = self._executor.submit(self.upload, bucket_name, blob_name, data, content_type)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+        if callback is not None:
+            future.add_done_callback(callback)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._futures.discard(future)
+            self._lock.notify_all()
+        self._slots.release()
+
+    def join(self):
+        """
+        Wait until all submitted uploads, including their done callbacks, have finished.
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: not self._futures)
+
+    def close(self):
+        """
+        Wait for all submitted uploads and shut down the thread pool.
+        """
+        self.join()
+        self._executor.shutdown(wait=True)
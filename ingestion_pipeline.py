@@ -0,0 +1,229 @@
+"""
+This module provides a small staged pipeline: worker threads connected by bounded queues.
+
+Each Stage reads items from its input queue, applies its function and passes the result on to the next stage, so
+downloads, CPU work and API calls of different items overlap. Bounded queues apply backpressure: a stage that falls
+behind blocks the stages before it instead of letting them buffer without limit. Every stage records its
+throughput, the time its workers were busy and the depth of its input queue.
+"""
+import logging
+import queue
+import threading
+import time
+
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """
+    A pipeline stage with its own workers and bounded input queue.
+
+    A stage without `batch_size` maps one item to one output item. A stage with `batch_size` collects up to
+    `batch_size` items, waiting at most `max_wait` seconds for more once it has one, and maps the batch to a list of
+    output items. Returning None drops the item or batch. Exceptions are logged and drop the item or batch as well.
+    The return value of the last stage is ignored.
+
+    Attributes:
+        name (str): Name of the stage in logs and metrics.
+        workers (int): Number of worker threads.
+        batch_size (int): Number of items per batch, or None for an unbatched stage.
+        processed (int): Number of input items processed.
+        failed (int): Number of input items dropped because of an exception.
+        busy_seconds (float): Time the workers spent in the stage function.
+        max_depth (int): Largest observed depth of the input queue.
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=None, max_wait=1.0, queue_size=64):
+        """
+        Initialize the stage.
+
+        Parameters:
+        name (str): Name of the stage in logs and metrics.
+        func (callable): Maps an item, or a list of items if `batch_size` is set, to the output.
+        workers (int): Number of worker threads.
+        batch_size (int, optional): Number of items per batch.
+        max_wait (float): Seconds a batched stage waits for more items before processing a partial batch.
+        queue_size (int): Capacity of the input queue.
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.input = queue.Queue(maxsize=queue_size)
+        self.output = None
+
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._running = workers
+        self._lock = threading.Lock()
+
+    def _get(self, timeout=None):
+        item = self.input.get(timeout=timeout)
+        depth = self.input.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+        return item
+
+    def _next_batch(self):
+        """
+        Get the next list of items, or None once the input is exhausted.
+        """
+        item = self._get()
+        if item is _DONE:
+            return None
+        batch = [item]
+        if self.batch_size is None:
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                item = self._get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                # Leave the end marker for the next read
+                self.input.put(_DONE)
+                break
+            batch.append(item)
+        return batch
+
+    def _emit(self, item):
+        if item is not None:
+            self.output.put(item)
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            start = time.perf_counter()
+            try:
+                if self.batch_size is None:
+                    results = [self.func(batch[0])]
+                else:
+                    results = self.func(batch) or []
+            except Exception as err:  # pylint: disable=W0718
+                logger.error(f"Stage {self.name} failed on {len(batch)} items: {err}", exc_info=True)
+                with self._lock:
+                    self.failed += len(batch)
+                results = []
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+                self.processed += len(batch)
+            if self.output is not None:
+                for result in results:
+                    self._emit(result)
+
+        # Let the other workers see the end marker, and close the next stage after the last worker
+        self.input.put(_DONE)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last and self.output is not None:
+            self.output.put(_DONE)
+
+    def start(self):
+        QUEUE_DEPTH.labels(f'ingest_{self.name}').set_function(self.input.qsize)
+        threads = [threading.Thread(target=self._work, name=f'{self.name}-{i}', daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def metrics(self, elapsed):
+        """
+        Get the metrics of the stage.
+
+        Parameters:
+        elapsed (float): Wall time of the pipeline in seconds.
+
+        Returns:
+        dict: Items processed and failed, items per second, worker utilization and input queue depth.
+        """
+        with self._lock:
+            return {
+                'processed': self.processed,
+                'failed': self.failed,
+                'items_per_second': round(self.processed / elapsed, 2) if elapsed else 0.0,
+                'utilization': round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+                'queue_depth': self.input.qsize(),
+                'avg_queue_depth': round(self._depth_total / self._depth_samples, 1) if self._depth_samples else 0.0,
+                'max_queue_depth': self.max_depth,
+            }
+
+
+class IngestionPipeline:
+    """
+    A chain of stages. The output of each stage is the input of the next one, the output of the last stage is
+    discarded.
+
+    Attributes:
+        stages (list): The stages, in order.
+        report_interval (float): Seconds between two metric reports in the log while the pipeline runs.
+    """
+
+    def __init__(self, stages, report_interval=30.0):
+        self.stages = stages
+        self.report_interval = report_interval
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.output = next_stage.input
+
+    def run(self, items):
+        """
+        Feed the items into the first stage and wait until every stage has finished.
+
+        Parameters:
+        items (iterable): The input items. They are read lazily, as the first stage accepts them.
+
+        Returns:
+        dict: The metrics of every stage, by stage name.
+        """
+        start = time.perf_counter()
+        threads = [thread for stage in self.stages for thread in stage.start()]
+        finished = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(start, finished), daemon=True)
+        monitor.start()
+
+        try:
+            for item in items:
+                self.stages[0].input.put(item)
+        finally:
+            self.stages[0].input.put(_DONE)
+            for thread in threads:
+                thread.join()
+            # Drop the end markers the workers left behind
+            for stage in self.stages:
+                while not stage.input.empty():
+                    stage.input.get_nowait()
+            finished.set()
+            monitor.join()
+
+        metrics = self.metrics(time.perf_counter() - start)
+        self._log_metrics(metrics)
+        return metrics
+
+    def metrics(self, elapsed):
+        return {stage.name: stage.metrics(elapsed) for stage in self.stages}
+
+    def _monitor(self, start, finished):
+        while not finished.wait(self.report_interval):
+            self._log_metrics(self.metrics(time.perf_counter() - start))
+
+    @staticmethod
+    def _log_metrics(metrics):
+        for name, values in metrics.items():
+            logger.info(f"Stage {name}: {values['processed']} items ({values['failed']} failed), "
+                        f"{values['items_per_second']} items/s, {values['utilization']:.0%} busy, "
+                        f"queue depth {values['queue_depth']} (avg {values['avg_queue_depth']}, "
+                        f"max {values['max_queue_depth']})")
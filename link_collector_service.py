@@ -1,16 +1,39 @@
 """
 This module contains classes for scraping a website and storing the scraped links in Firestore.
 """
+import asyncio
 import hashlib
 import logging
-from urllib.parse import urljoin
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse
 
 import requests
 from bs4 import BeautifulSoup, ParserRejectedMarkup
 from google.cloud import firestore
 
+from crawl_frontier import CrawlFrontier
+from firestore_writer import BufferedFirestoreWriter, FirestoreWriteError
+from link_leases import link_document_id
+from metrics import BYTES_FETCHED, FETCH_SECONDS, FRONTIER_DEPTH, PAGES, PARSE_SECONDS, SKIPPED
+
 logger = logging.getLogger(__name__)
 
+SERVICE = 'link_collector'
+
+# Responses after which a stored page counts as removed from the site. Pages that only stop being linked, or fail
+# in other ways, are kept, since a failed hub page would otherwise make every page below it look removed.
+REMOVED_HTTP_STATUSES = (404, 410)
+# Statuses of links whose page was removed, before and after its vectors were deleted by VectorStoreService
+REMOVED_STATUSES = ('removed', 'db_removed')
+# Number of stored link documents read with one request
+LINK_STATE_BATCH_SIZE = 100
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 '
+           '(KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
+
 
 class LinkCollectorService:
     """
@@ -22,80 +45,583 @@ class LinkCollectorService:
         max_pages (int): Maximum number of pages to scrape.
         collection_name (str): Name of the Firestore collection to store the links in.
         db (firestore.Client): Firestore client.
+        on_link_stored (callable): If set, called with every URL stored as 'pending', e.g. to stream it to the
+            scraper.
     """
-    def __init__(self, run_id,collection_name):
+    def __init__(self, run_id,collection_name, frontier_dir=None, content_cache=None, db=None):
         """
         Initialize LinkCollector with the start URL, base URL, maximum number of pages to scrape,
         and Firestore collection name.
+
+        If `frontier_dir` is given, the crawl frontier of each start URL is checkpointed to a SQLite file in
+        that directory so that an interrupted crawl resumes where it stopped. If `content_cache` is given,
+        fetched pages are stored in it so that ScraperService does not need to download them again. If `db` is
+        given, that Firestore client is used instead of a new one.
         """
         self.run_id = run_id
         self.collection_name = collection_name
-        self.db = firestore.Client()
+        self.frontier_dir = frontier_dir
+        self.content_cache = content_cache
+        self.db = db or firestore.Client()
+        self.writer = BufferedFirestoreWriter(self.db)
+        self.on_link_stored = None
 
-    def run(self, start_url, base_url, max_pages=1000000):
+        # Stored documents read ahead for queued URLs, and queued URLs whose document was not read yet
+        self._link_states = {}
+        self._unread_links = OrderedDict()
+        self._link_state_lock = threading.Lock()
+
+    def run(self, start_url, base_url, max_pages=1000000, concurrency=None, per_host_concurrency=4):
         """
         Collect links from the website and store them in Firestore.
+
+        Parameters:
+        start_url (str): URL to start the crawl from.
+        base_url (str): Only links starting with this prefix are followed.
+        max_pages (int): Maximum number of pages to collect.
+        concurrency (int, optional): If set, crawl with asyncio using this many concurrent requests.
+        per_host_concurrency (int): Maximum concurrent requests per host in asyncio mode.
         """
+        if concurrency:
+            return asyncio.run(self.run_async(start_url, base_url, max_pages, concurrency, per_host_concurrency))
+
         logger.info(f"Starting collecting links. Run ID: {self.run_id}")
-        visited = set()
-        queue = [start_url]
-        pages_scraped = 0
+        frontier = self._open_frontier(start_url)
+        start_pages = frontier.pages_scraped
+        start_time = time.monotonic()
 
-        while queue and pages_scraped < max_pages:
-            url = queue.pop(0)
-            logger.info(f"Visiting URL: {url}")
+        try:
+            while len(frontier) and frontier.pages_scraped < max_pages:
+                url = frontier.pop()
+                logger.debug(f"Visiting URL: {url}")
 
-            if url in visited or "#" in url:
-                logger.info(f"URL already visited or contains #: {url}")
-                continue
+                links, page = self._visit(url, base_url)
+                if links is not None:
+                    for link in links:
+                        if frontier.push(link):
+                            self._queue_link_state(link)
+                            logger.debug(f"Added URL to queue: {link}")
 
-            visited.add(url)
+                    self._store_link(url, page)
 
-            try:
+                frontier.task_done(url, scraped=links is not None)
+                if links is not None:
+                    logger.debug(f'Scraped {url}, total pages scraped: {frontier.pages_scraped}, '
+                                 f'URLs in queue: {len(frontier)}')
+        except BaseException:
+            self._abort_frontier(frontier)
+            raise
 
-                headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 '
-                           '(KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
-                response = requests.get(url, timeout=10, headers=headers)
-                response.raise_for_status()
-                content_type = response.headers.get('Content-Type', '')
+        pages_scraped = frontier.pages_scraped
+        self._close_frontier(frontier)
+        self._log_throughput(pages_scraped - start_pages, start_time)
+        return pages_scraped
+
+    async def run_async(self, start_url, base_url, max_pages=1000000, concurrency=32, per_host_concurrency=4):
+        """
+        Collect links with concurrent asyncio requests and store them in Firestore.
+
+        Follows the same rules as `run`: only links starting with `base_url` are followed, URLs containing
+        '#' are skipped and only text, JSON and PDF responses are stored.
+
+        Parameters:
+        start_url (str): URL to start the crawl from.
+        base_url (str): Only links starting with this prefix are followed.
+        max_pages (int): Maximum number of pages to collect.
+        concurrency (int): Maximum number of requests in flight overall.
+        per_host_concurrency (int): Maximum number of requests in flight per host.
+
+        Returns:
+        int: The number of pages collected.
+        """
+        pages_scraped, _ = await self._crawl_async([(start_url, base_url)], max_pages, concurrency,
+                                                   per_host_concurrency)
+        return pages_scraped
 
-                # Check for content types
-                is_not_text = 'text' not in content_type
-                is_not_json = 'application/json' not in content_type
-                is_not_pdf = 'application/pdf' not in content_type
+    def run_multi(self, seeds, max_pages=1000000, concurrency=32, per_host_concurrency=4, per_host_delay=0.0):
+        """
+        Collect links from several websites at the same time, with one shared frontier.
 
-                # If none of the content types are found, log a message and continue
-                if is_not_text and is_not_json and is_not_pdf:
-                    logger.info(f"Skipping URL due to non-text/non-PDF Content-Type: {content_type}")
-                    continue
+        A URL is fetched once, even if several sites link to it. The frontier hands out URLs round-robin across
+        hosts, so that all sites make progress in parallel, while every host gets at most `per_host_concurrency`
+        requests at a time and at most one new request every `per_host_delay` seconds. Links are followed if they
+        start with the base URL of any seed, and every page counts towards the seed with the longest matching base
+        URL.
+
+        Parameters:
+        seeds (list): Tuples of start URL and base URL.
+        max_pages (int): Maximum number of pages to collect per seed.
+        concurrency (int): Maximum number of requests in flight overall.
+        per_host_concurrency (int): Maximum number of requests in flight per host.
+        per_host_delay (float): Minimum number of seconds between the starts of two requests to the same host.
 
-            except requests.HTTPError as err:
+        Returns:
+        dict: The pages, seconds and pages per second of every seed, by start URL.
+        """
+        _, seed_stats = asyncio.run(self._crawl_async(seeds, max_pages, concurrency, per_host_concurrency,
+                                                      per_host_delay))
+        return seed_stats
+
+    async def _crawl_async(self, seeds, max_pages, concurrency, per_host_concurrency, per_host_delay=0.0):
+        """
+        Crawl from one or more seeds with concurrent asyncio requests, see `run_async` and `run_multi`.
+
+        Returns:
+        tuple: The number of pages collected, and the statistics of every seed by start URL.
+        """
+        import aiohttp  # pylint: disable=C0415
+
+        logger.info(f"Starting async link collection of {len(seeds)} seeds. Run ID: {self.run_id}, concurrency: "
+                    f"{concurrency}, per host: {per_host_concurrency}, delay per host: {per_host_delay}s")
+        base_urls = tuple(base_url for _, base_url in seeds)
+        frontier = self._open_frontier([start_url for start_url, _ in seeds])
+        start_pages = frontier.pages_scraped
+        # A resumed single-seed crawl continues counting towards max_pages
+        accepted = [frontier.pages_scraped if len(seeds) == 1 else 0] + [0] * (len(seeds) - 1)
+        last_page_at = [None] * len(seeds)
+        host_in_flight = {}
+        next_request_at = {}
+        start_time = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        def ready(host):
+            return (host_in_flight.get(host, 0) < per_host_concurrency
+                    and next_request_at.get(host, 0.0) <= time.monotonic())
+
+        async def fetch(session, url, request_headers):
+            with FETCH_SECONDS.labels(SERVICE).time():
+                async with session.get(url, headers=request_headers) as response:
+                    response.raise_for_status()
+                    if response.status == 304:
+                        return 304, None, response.headers, None
+                    content_type = response.headers.get('Content-Type', '')
+                    if not self._is_supported_content_type(content_type):
+                        logger.debug(f"Skipping URL due to non-text/non-PDF Content-Type: {content_type}")
+                        SKIPPED.labels(SERVICE, 'content_type').inc()
+                        return None
+                    content = await response.read()
+            BYTES_FETCHED.labels(SERVICE).inc(len(content))
+            return response.status, content, response.headers, response.charset or 'utf-8'
+
+        async def visit(session, url, seed):
+            if "#" in url:
+                logger.debug(f"URL contains #: {url}")
+                SKIPPED.labels(SERVICE, 'fragment').inc()
+                return url, None
+            logger.debug(f"Visiting URL: {url}")
+            previous = await loop.run_in_executor(None, self._get_link_state, url)
+            try:
+                fetched = await fetch(session, url, self._request_headers(previous))
+                if fetched is not None and fetched[0] == 304:
+                    cached = await loop.run_in_executor(None, self._get_cached_response, url)
+                    if cached is not None:
+                        fetched = 304, cached.content, cached.headers, cached.encoding
+                    else:
+                        fetched = await fetch(session, url, HEADERS)
+            except aiohttp.ClientResponseError as err:
                 logger.error(f"HTTP error occurred: {err}")
-                continue
-            except requests.exceptions.RequestException as err:
+                SKIPPED.labels(SERVICE, 'http_error').inc()
+                if err.status in REMOVED_HTTP_STATUSES:
+                    await loop.run_in_executor(None, self._mark_removed, url, previous)
+                return url, None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
                 logger.error(f"Request error occurred: {err}")
-                continue
+                SKIPPED.labels(SERVICE, 'request_error').inc()
+                return url, None
+            if fetched is None:
+                return url, None
+
+            status, content, headers, encoding = fetched
+            if status == 304:
+                page = self._page_record(previous, not_modified=True)
+            else:
+                await loop.run_in_executor(None, self._cache_response, url, content, headers, encoding)
+                page = self._page_record(previous, content, headers)
+            text = content.decode(encoding, errors='replace')
+            links = await loop.run_in_executor(None, self._extract_links, url, text, base_urls)
+            if links is None or accepted[seed] >= max_pages:
+                return url, None
+            accepted[seed] += 1
+            last_page_at[seed] = time.monotonic()
+            await loop.run_in_executor(None, self._store_link, url, page)
+            logger.debug(f'Scraped {url}')
+            return url, links
+
+        timeout = aiohttp.ClientTimeout(total=10)
+        connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host_concurrency)
+        in_flight = set()
+        try:
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                while (len(frontier) or in_flight) and min(accepted) < max_pages:
+                    while len(in_flight) < concurrency:
+                        url = frontier.pop(ready)
+                        if url is None:
+                            break
+                        seed = self._seed_index(url, seeds)
+                        if accepted[seed] >= max_pages:
+                            frontier.task_done(url)
+                            continue
+                        host = urlparse(url).netloc
+                        host_in_flight[host] = host_in_flight.get(host, 0) + 1
+                        next_request_at[host] = time.monotonic() + per_host_delay
+                        in_flight.add(asyncio.create_task(visit(session, url, seed)))
+                    if not in_flight:
+                        # Every host with queued URLs waits for its delay
+                        now = time.monotonic()
+                        await asyncio.sleep(min((at for at in next_request_at.values() if at > now), default=now) - now)
+                        continue
+                    done, in_flight = await asyncio.wait(in_flight, timeout=per_host_delay or None,
+                                                         return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        url, links = task.result()
+                        host_in_flight[urlparse(url).netloc] -= 1
+                        for link in links or []:
+                            if frontier.push(link):
+                                self._queue_link_state(link)
+                        frontier.task_done(url, scraped=links is not None)
+        except BaseException:
+            self._abort_frontier(frontier)
+            raise
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+        pages_scraped = frontier.pages_scraped
+        self._close_frontier(frontier)
+        self._log_throughput(pages_scraped - start_pages, start_time)
+        seed_stats = {}
+        for (start_url, _), pages, finished_at in zip(seeds, accepted, last_page_at):
+            seconds = (finished_at or start_time) - start_time
+            seed_stats[start_url] = {
+                'pages': pages,
+                'seconds': round(seconds, 3),
+                'pages_per_second': round(pages / seconds, 2) if seconds > 0 else 0.0,
+            }
+            if len(seeds) > 1:
+                logger.info(f"Seed {start_url}: {pages} pages in {seconds:.1f}s "
+                            f"({seed_stats[start_url]['pages_per_second']:.2f} pages/s)")
+        return pages_scraped, seed_stats
+
+    @staticmethod
+    def _seed_index(url, seeds):
+        """
+        Get the index of the seed a URL belongs to: the seed with the longest base URL the URL starts with, or
+        otherwise the first seed on the same host.
+        """
+        matches = [i for i, (start_url, base_url) in enumerate(seeds) if url == start_url or url.startswith(base_url)]
+        if matches:
+            return max(matches, key=lambda i: len(seeds[i][1]))
+        host = urlparse(url).netloc
+        return next((i for i, (start_url, _) in enumerate(seeds) if urlparse(start_url).netloc == host), 0)
+
+    def _open_frontier(self, start_urls):
+        """
+        Open the crawl frontier for one or more start URLs, resuming an interrupted crawl if a checkpoint exists.
+
+        Parameters:
+        start_urls (str or list): The URL or URLs the crawl starts from.
+
+        Returns:
+        CrawlFrontier: The frontier, seeded with the start URLs if it holds no state.
+        """
+        if isinstance(start_urls, str):
+            start_urls = [start_urls]
+        path = None
+        if self.frontier_dir:
+            os.makedirs(self.frontier_dir, exist_ok=True)
+            # A single seed keeps the checkpoint name of the sequential crawl
+            key = start_urls[0] if len(start_urls) == 1 else '\n'.join(sorted(start_urls))
+            path = os.path.join(self.frontier_dir, f"{self._hash_url(key)}.sqlite")
+        # Commit buffered link writes before the checkpoint marks their URLs as done
+        frontier = CrawlFrontier(path, before_flush=self.writer.flush if path else None)
+        if frontier.is_empty():
+            for start_url in start_urls:
+                frontier.push(start_url)
+        # Read when the metrics are collected, so the crawl loop does not pay for it
+        FRONTIER_DEPTH.set_function(frontier.__len__)
+        return frontier
+
+    def _close_frontier(self, frontier):
+        """
+        Close the crawl frontier after a completed crawl, so that the next run starts from the start URL again.
+
+        Parameters:
+        frontier (CrawlFrontier): The frontier to close.
+        """
+        self._clear_link_states()
+        try:
+            self.writer.flush()
+        except FirestoreWriteError:
+            # Keep the last checkpoint, so that the next run visits the URLs whose links were not stored again
+            frontier.close(checkpoint=False)
+            raise
+        frontier.reset()
+        frontier.close()
+
+    def _mark_removed(self, url, previous):
+        """
+        Mark a stored link as 'removed' because its page no longer exists, so that VectorStoreService deletes its
+        vectors. Links that were never stored are not written.
+
+        Parameters:
+        url (str): The URL of the page.
+        previous (dict): The stored document of the URL, or None.
+        """
+        if not previous or previous.get('status') in REMOVED_STATUSES:
+            return
+        doc_ref = self.db.collection(self.collection_name).document(self._hash_url(url))
+        self.writer.update(doc_ref, {u'status': u'removed', u'timestamp': firestore.SERVER_TIMESTAMP})
+        logger.debug(f"Marked removed page: {url}")
+
+    def _abort_frontier(self, frontier):
+        """
+        Close the crawl frontier after a failed or interrupted crawl. The frontier is checkpointed only if the links
+        stored so far could be committed to Firestore, so that the next run resumes from here without losing links.
+
+        Parameters:
+        frontier (CrawlFrontier): The frontier to close.
+        """
+        self._clear_link_states()
+        try:
+            self.writer.flush()
+        except FirestoreWriteError as err:
+            logger.error(f"Not checkpointing the crawl frontier, the stored links could not be committed: {err}")
+            frontier.close(checkpoint=False)
+            return
+        frontier.close()
+
+    def _visit(self, url, base_url):
+        """
+        Fetch a page and return the links found on it.
+
+        If the link was stored by a previous run, the request is made conditional on its ETag and Last-Modified
+        validators. A 304 response is served from the content cache, or refetched if the page is not cached.
+
+        Parameters:
+        url (str): The URL to fetch.
+        base_url (str): Only links starting with this prefix are returned.
 
+        Returns:
+        tuple: The links found on the page and the page record for `_store_link`, or (None, None) if the
+        page was skipped.
+        """
+        if "#" in url:
+            logger.debug(f"URL contains #: {url}")
+            SKIPPED.labels(SERVICE, 'fragment').inc()
+            return None, None
+
+        previous = self._get_link_state(url)
+        try:
+            with FETCH_SECONDS.labels(SERVICE).time():
+                response = requests.get(url, timeout=10, headers=self._request_headers(previous))
+            response.raise_for_status()
+            if response.status_code == 304:
+                cached = self._get_cached_response(url)
+                if cached is not None:
+                    page = self._page_record(previous, not_modified=True)
+                    return self._extract_links(url, cached.text, base_url), page
+                with FETCH_SECONDS.labels(SERVICE).time():
+                    response = requests.get(url, timeout=10, headers=HEADERS)
+                response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+
+            # If none of the content types are found, log a message and continue
+            if not self._is_supported_content_type(content_type):
+                logger.debug(f"Skipping URL due to non-text/non-PDF Content-Type: {content_type}")
+                SKIPPED.labels(SERVICE, 'content_type').inc()
+                return None, None
+
+        except requests.HTTPError as err:
+            logger.error(f"HTTP error occurred: {err}")
+            SKIPPED.labels(SERVICE, 'http_error').inc()
+            if err.response is not None and err.response.status_code in REMOVED_HTTP_STATUSES:
+                self._mark_removed(url, previous)
+            return None, None
+        except requests.exceptions.RequestException as err:
+            logger.error(f"Request error occurred: {err}")
+            SKIPPED.labels(SERVICE, 'request_error').inc()
+            return None, None
+
+        BYTES_FETCHED.labels(SERVICE).inc(len(response.content))
+        self._cache_response(url, response.content, response.headers, response.encoding)
+        page = self._page_record(previous, response.content, response.headers)
+        return self._extract_links(url, response.text, base_url), page
+
+    def _queue_link_state(self, url):
+        """
+        Note a URL added to the frontier, so that its stored document is read together with the documents of other
+        queued URLs. URLs with a fragment are skipped without a read.
+        """
+        if "#" in url:
+            return
+        with self._link_state_lock:
+            self._unread_links[url] = None
+
+    def _get_link_state(self, url):
+        """
+        Get the Firestore document stored for a URL by a previous run.
+
+        Documents are read ahead in batches: if the document of the URL was not read yet, it is read together with
+        the documents of the next queued URLs, up to `LINK_STATE_BATCH_SIZE` documents in one request.
+
+        Parameters:
+        url (str): The URL to look up.
+
+        Returns:
+        dict: The stored document, or None if the URL has not been stored before.
+        """
+        with self._link_state_lock:
+            if url in self._link_states:
+                return self._link_states.pop(url)
+            self._unread_links.pop(url, None)
+            batch = [url]
+            while self._unread_links and len(batch) < LINK_STATE_BATCH_SIZE:
+                batch.append(self._unread_links.popitem(last=False)[0])
+
+        collection_ref = self.db.collection(self.collection_name)
+        doc_ids = {self._hash_url(link): link for link in batch}
+        states = {link: None for link in batch}
+        for doc in self.db.get_all([collection_ref.document(doc_id) for doc_id in doc_ids]):
+            if doc.exists:
+                states[doc_ids[doc.id]] = doc.to_dict()
+
+        state = states.pop(url)
+        with self._link_state_lock:
+            self._link_states.update(states)
+        return state
+
+    def _clear_link_states(self):
+        with self._link_state_lock:
+            self._link_states.clear()
+            self._unread_links.clear()
+
+    def _request_headers(self, previous):
+        """
+        Build the request headers, adding conditional GET validators from the previously stored document.
+
+        Parameters:
+        previous (dict): The stored document of the URL, or None.
+
+        Returns:
+        dict: The request headers.
+        """
+        headers = dict(HEADERS)
+        if previous:
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+        return headers
+
+    def _page_record(self, previous, content=None, headers=None, not_modified=False):
+        """
+        Build the validators of a fetched page and decide whether it changed since the previous run.
+
+        Parameters:
+        previous (dict): The stored document of the URL, or None.
+        content (bytes, optional): The response body. Not needed for a 304 response.
+        headers (Mapping, optional): The response headers. Not needed for a 304 response.
+        not_modified (bool): Whether the server answered 304 Not Modified.
+
+        Returns:
+        dict: The etag, last_modified and content_hash of the page, whether it is unchanged and the
+        status stored by the previous run.
+        """
+        previous = previous or {}
+        if not_modified:
+            page = {key: previous.get(key) for key in ('etag', 'last_modified', 'content_hash')}
+            page['unchanged'] = True
+        else:
+            content_hash = hashlib.sha256(content).hexdigest()
+            page = {
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_hash': content_hash,
+                'unchanged': previous.get('content_hash') == content_hash,
+            }
+        page['previous_status'] = previous.get('status')
+        return page
+
+    def _get_cached_response(self, url):
+        """
+        Read a page from the content cache, if one is configured.
+
+        Parameters:
+        url (str): The URL of the page.
+
+        Returns:
+        CachedResponse: The cached page, or None if it is not cached.
+        """
+        if self.content_cache is None:
+            return None
+        return self.content_cache.get(self._hash_url(url))
+
+    def _cache_response(self, url, content, headers, encoding):
+        """
+        Store a fetched page in the content cache, if one is configured.
+
+        Parameters:
+        url (str): The URL of the page.
+        content (bytes): The raw response body.
+        headers (Mapping): The response headers.
+        encoding (str): The text encoding of the body.
+        """
+        if self.content_cache is None:
+            return
+        cached_headers = {key: headers[key] for key in ('Content-Type', 'ETag', 'Last-Modified') if key in headers}
+        self.content_cache.put(self._hash_url(url), url, content, cached_headers, encoding)
+
+    def _is_supported_content_type(self, content_type):
+        """
+        Check whether a response with the given Content-Type should be collected.
+
+        Parameters:
+        content_type (str): The Content-Type header of the response.
+
+        Returns:
+        bool: True for text, JSON and PDF content, False otherwise.
+        """
+        return 'text' in content_type or 'application/json' in content_type or 'application/pdf' in content_type
+
+    def _extract_links(self, url, html, base_url):
+        """
+        Parse a page and return the links that start with the base URL and contain no '#'.
+
+        Parameters:
+        url (str): The URL of the page, used to resolve relative links.
+        html (str): The content of the page.
+        base_url (str or tuple): Only links starting with this prefix, or one of these prefixes, are returned.
+
+        Returns:
+        list: The links found on the page, or None if the page could not be parsed.
+        """
+        with PARSE_SECONDS.labels(SERVICE).time():
             try:
-                soup = BeautifulSoup(response.text, 'html.parser')
+                soup = BeautifulSoup(html, 'html.parser')
             except (ParserRejectedMarkup, Exception) as e: # pylint: disable=W0718
                 logger.error(f"Failed to parse HTML from URL: {url}. Error: {e}")
-                continue
+                SKIPPED.labels(SERVICE, 'parse_error').inc()
+                return None
 
+            links = []
             for anchor_tag in soup.find_all('a', href=True):
                 link = urljoin(url, anchor_tag['href'])
                 if link.startswith(base_url) and "#" not in link:
-                    if link not in visited and pages_scraped < max_pages:
-                        queue.append(link)
-                        logger.info(f"Added URL to queue: {link}")
+                    links.append(link)
+            return links
 
+    def _log_throughput(self, pages_scraped, start_time):
+        """
+        Log the number of collected pages and the achieved pages per second.
 
-            self._store_link(url)
-
-            pages_scraped += 1
-            logger.info(f'Scraped {url}, total pages scraped: {pages_scraped}')
-            logger.info(f"Number of URLs in queue: {len(queue)}")
-            logger.info(f"Number of URLs visited: {len(visited)}")
+        Parameters:
+        pages_scraped (int): The number of pages collected.
+        start_time (float): The `time.monotonic()` value at the start of the crawl.
+        """
+        elapsed = time.monotonic() - start_time
+        pages_per_second = pages_scraped / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Collected {pages_scraped} pages in {elapsed:.1f}s ({pages_per_second:.2f} pages/s)")
 
     def _hash_url(self, url):
         """
@@ -107,22 +633,46 @@ class LinkCollectorService:
         Returns:
         str: The hashed URL.
         """
-        return hashlib.md5(url.encode()).hexdigest()
+        return link_document_id(url)
 
-    def _store_link(self, url):
+    def _store_link(self, url, page=None):
         """
         Store a URL in Firestore with a status of 'pending' and a timestamp of the current server time.
         
         The URL is hashed to create a unique string ID, which is used as the document name in Firestore.
+
+        If the page is unchanged since the previous run, the document keeps its status, or is marked 'unchanged'
+        if it was already inserted into the vector store, so that it is not scraped and embedded again. A page that
+        was removed and is back is stored as 'pending' again.
         
         Parameters:
         url (str): The URL to store.
+        page (dict, optional): The page record built by `_page_record`.
         """
         doc_id = self._hash_url(url)
         doc_ref = self.db.collection(self.collection_name).document(doc_id)
-        doc_ref.set({
+        PAGES.labels(SERVICE).inc()
+        if page and page['unchanged'] and page['previous_status'] and page['previous_status'] not in REMOVED_STATUSES:
+            fields = {u'timestamp': firestore.SERVER_TIMESTAMP}
+            if page['previous_status'] in ('db_inserted', 'unchanged'):
+                fields[u'status'] = u'unchanged'
+            self.writer.update(doc_ref, fields)
+            logger.debug(f"URL unchanged since previous run: {url}")
+            SKIPPED.labels(SERVICE, 'unchanged').inc()
+            return
+
+        data = {
             u'url': url,
             u'status': u'pending',
             u'timestamp': firestore.SERVER_TIMESTAMP
-        })
-        logger.info(f"Stored URL in Firestore: {url}")
+        }
+        if page:
+            data.update({
+                u'etag': page['etag'],
+                u'last_modified': page['last_modified'],
+                u'content_hash': page['content_hash'],
+            })
+        self.writer.set(doc_ref, data, merge=True)
+        logger.debug(f"Stored URL in Firestore: {url}")
+        if self.on_link_stored is not None:
+            self.on_link_stored(url)
@@ -0,0 +1,289 @@
+"""
+This module provides the LinkLeaseManager class, which lets several ScraperService nodes share one collection.
+
+A node claims a batch of links by moving them from 'pending' to 'in_progress' together with a lease owner and a
+lease expiry. The claim is a single batched write in which every update is conditional on the document not having
+changed since it was read, so the batch is applied atomically and two nodes can never claim the same link. Links
+whose lease has expired, e.g. because the node crashed, are claimed again by the next node that asks for work.
+
+The manager remembers the update time of its last write to every link it holds. Lease renewals, results and
+releases are written on the condition that the link was not changed since, so a node whose lease expired and was
+claimed by another node cannot overwrite the work of that node.
+"""
+import datetime
+import hashlib
+import logging
+import random
+import socket
+import threading
+import time
+import uuid
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_writer import MAX_BATCH_SIZE
+from metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Number of pending links read per link to claim
+CANDIDATE_FACTOR = 4
+
+
+def link_document_id(url):
+    """
+    Get the ID of the Firestore document of a link, the MD5 hash of its URL.
+
+    Parameters:
+    url (str): The URL of the link.
+
+    Returns:
+    str: The document ID.
+    """
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+class LinkLeaseManager:
+    """
+    Claim batches of pending links with a lease.
+
+    Attributes:
+        db (firestore.Client): Firestore client.
+        collection_name (str): Name of the Firestore collection holding the links.
+        owner (str): Identifier of this node, stored as the lease owner.
+        lease_seconds (int): Duration of a lease.
+        max_attempts (int): Number of attempts to claim a batch when other nodes claim the same links.
+        result_batch_size (int): Number of buffered results that triggers a write.
+        lost (int): Number of leases found taken over by another node when renewing, completing or releasing them.
+    """
+
+    def __init__(self, db, collection_name, owner=None, lease_seconds=600, max_attempts=5, result_batch_size=100):
+        """
+        Initialize the lease manager.
+
+        Parameters:
+        db (firestore.Client): Firestore client.
+        collection_name (str): Name of the Firestore collection holding the links.
+        owner (str, optional): Identifier of this node. Defaults to the host name and a random suffix.
+        lease_seconds (int): Duration of a lease. Must be longer than it takes to scrape one batch.
+        max_attempts (int): Number of attempts to claim a batch when other nodes claim the same links.
+        result_batch_size (int): Number of buffered results that triggers a write, at most 500.
+        """
+        self.db = db
+        self.collection_name = collection_name
+        self.owner = owner or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.result_batch_size = min(result_batch_size, MAX_BATCH_SIZE)
+        self.lost = 0
+
+        # Update time of the last write of this node to every link it holds, keyed by URL
+        self._held = {}
+        self._results = []
+        # Serializes the writes to held links, so that every write is conditional on the latest update time
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._renewer = None
+
+    def claim_batch(self, batch_size):
+        """
+        Claim up to `batch_size` links. Links with an expired lease are claimed before pending links.
+
+        If another node modifies one of the links between the read and the write, the whole claim fails and is
+        retried with a smaller batch after a random backoff.
+
+        Parameters:
+        batch_size (int): The maximum number of links to claim.
+
+        Returns:
+        list: The URLs of the claimed links, empty if there is no work left.
+        """
+        for attempt in range(self.max_attempts):
+            now = datetime.datetime.now(datetime.timezone.utc)
+            snapshots = self._claimable(batch_size, now)
+            if not snapshots:
+                return []
+
+            expires_at = now + datetime.timedelta(seconds=self.lease_seconds)
+            batch = self.db.batch()
+            for snapshot in snapshots:
+                batch.update(snapshot.reference, {
+                    u'status': u'in_progress',
+                    u'lease_owner': self.owner,
+                    u'lease_expires_at': expires_at,
+                }, option=self.db.write_option(last_update_time=snapshot.update_time))
+            try:
+                write_results = batch.commit()
+            except FailedPrecondition:
+                RETRIES.labels('lease_claim').inc()
+                batch_size = max(1, batch_size // 2)
+                sleep_time = random.uniform(0, 0.1 * 2 ** attempt)
+                logger.info(f"Links were claimed by another node. Retrying with {batch_size} links "
+                            f"in {sleep_time:.2f} seconds...")
+                time.sleep(sleep_time)
+                continue
+
+            urls = [snapshot.get(u'url') for snapshot in snapshots]
+            with self._lock:
+                for url, write_result in zip(urls, write_results):
+                    self._held[url] = write_result.update_time
+            logger.info(f"Claimed {len(snapshots)} links as {self.owner} until {expires_at.isoformat()}")
+            return urls
+
+        logger.error(f"Failed to claim links after {self.max_attempts} attempts")
+        return []
+
+    def _claimable(self, limit, now):
+        """
+        Read up to `limit` links with an expired lease, topped up with pending links.
+        """
+        collection_ref = self.db.collection(self.collection_name)
+
+        expired_query = collection_ref.where(filter=FieldFilter(u'status', u'==', 'in_progress'))
+        expired_query = expired_query.where(filter=FieldFilter(u'lease_expires_at', u'<', now))
+        snapshots = list(expired_query.limit(limit).stream())
+        if snapshots:
+            logger.info(f"Reclaiming {len(snapshots)} links with an expired lease")
+
+        if len(snapshots) < limit:
+            # Pick a random sample from a larger window, so that nodes asking at the same time rarely collide
+            needed = limit - len(snapshots)
+            pending_query = collection_ref.where(filter=FieldFilter(u'status', u'==', 'pending'))
+            candidates = list(pending_query.limit(CANDIDATE_FACTOR * needed).stream())
+            snapshots.extend(random.sample(candidates, min(needed, len(candidates))))
+        return snapshots
+
+    def _document(self, url):
+        return self.db.collection(self.collection_name).document(link_document_id(url))
+
+    def _write_held(self, updates):
+        """
+        Write updates to held links, each on the condition that the link was not changed since the last write of
+        this node. Must be called with the lock held.
+
+        The updates are written in batches. If a batch fails because another node took over one of its links, its
+        updates are written one by one, and the links that were taken over are dropped.
+
+        Parameters:
+        updates (list): Tuples of URL and the fields to update.
+
+        Returns:
+        list: The URLs whose update was written.
+        """
+        written = []
+        for start in range(0, len(updates), MAX_BATCH_SIZE):
+            chunk = [(url, fields) for url, fields in updates[start:start + MAX_BATCH_SIZE] if url in self._held]
+            batch = self.db.batch()
+            for url, fields in chunk:
+                batch.update(self._document(url), fields,
+                             option=self.db.write_option(last_update_time=self._held[url]))
+            try:
+                write_results = batch.commit() if chunk else []
+            except (FailedPrecondition, NotFound):
+                write_results = [self._write_one(url, fields) for url, fields in chunk]
+            for (url, _), write_result in zip(chunk, write_results):
+                if write_result is None:
+                    self._held.pop(url, None)
+                    self.lost += 1
+                    logger.warning(f"Lease of {url} was taken over by another node, dropping its update")
+                else:
+                    self._held[url] = write_result.update_time
+                    written.append(url)
+        return written
+
+    def _write_one(self, url, fields):
+        try:
+            return self._document(url).update(fields, option=self.db.write_option(last_update_time=self._held[url]))
+        except (FailedPrecondition, NotFound):
+            return None
+
+    def renew(self):
+        """
+        Extend the lease of every held link that has no result yet.
+
+        Returns:
+        int: The number of renewed leases.
+        """
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.lease_seconds)
+        with self._lock:
+            renewed = self._write_held([(url, {u'lease_expires_at': expires_at}) for url in self._held])
+        if renewed:
+            logger.debug(f"Renewed {len(renewed)} leases until {expires_at.isoformat()}")
+        return len(renewed)
+
+    def start_renewal(self, interval=None):
+        """
+        Renew the held leases on a background thread, so that links taking long to scrape are not claimed by
+        another node in the meantime.
+
+        Parameters:
+        interval (float, optional): Seconds between two renewals. Defaults to a third of the lease duration.
+        """
+        interval = interval or self.lease_seconds / 3
+        self._stopped.clear()
+        self._renewer = threading.Thread(target=self._renew_periodically, args=(interval,), name='lease-renewal',
+                                         daemon=True)
+        self._renewer.start()
+
+    def _renew_periodically(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+                self.renew()
+            except Exception as err:  # pylint: disable=W0718
+                logger.error(f"Failed to renew leases: {err}")
+
+    def stop_renewal(self):
+        """
+        Stop the background renewal.
+        """
+        self._stopped.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+
+    def complete(self, url, fields):
+        """
+        Buffer the result of a claimed link. It is written, together with clearing the lease, only if this node
+        still holds the lease. Results of links whose lease was taken over by another node are dropped.
+
+        Parameters:
+        url (str): The URL of the link.
+        fields (dict): The fields of the result, e.g. the new status.
+        """
+        with self._lock:
+            self._results.append((url, {**fields, u'lease_owner': None, u'lease_expires_at': None}))
+            due = len(self._results) >= self.result_batch_size
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered results. Their links are no longer held afterwards.
+        """
+        with self._lock:
+            results, self._results = self._results, []
+            written = self._write_held(results)
+            for url in written:
+                del self._held[url]
+        if written:
+            logger.debug(f"Wrote the results of {len(written)} claimed links")
+
+    def release(self, urls):
+        """
+        Return claimed links that were not scraped to 'pending', e.g. when a node shuts down.
+
+        Parameters:
+        urls (list): The URLs to release.
+        """
+        with self._lock:
+            released = self._write_held([(url, {
+                u'status': u'pending',
+                u'lease_owner': None,
+                u'lease_expires_at': None,
+            }) for url in urls])
+            for url in released:
+                del self._held[url]
+        if released:
+            logger.info(f"Released {len(released)} claimed links")
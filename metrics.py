@@ -0,0 +1,69 @@
+"""
+This module defines the Prometheus metrics of the services and the ways to export them.
+
+The metrics are registered in the default registry of prometheus_client when the module is first imported. They can
+be served while a run is in progress with `start_metrics_server`, or written to a file in the Prometheus text format
+at the end of a run with `write_snapshot`. Labels only take a small, fixed set of values, such as the service or the
+reason a page was skipped, and never the URL, so that the number of time series stays bounded.
+"""
+import logging
+import os
+import tempfile
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Network round trips, from a few milliseconds to the 30 s request timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# CPU work on one page, from sub-millisecond parses of small pages to large documents
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+FETCH_SECONDS = Histogram('dataloader_fetch_seconds', 'Time to fetch a page, including the body',
+                          ['service'], buckets=LATENCY_BUCKETS)
+PARSE_SECONDS = Histogram('dataloader_parse_seconds', 'Time to parse a page for links or paragraphs',
+                          ['service'], buckets=PARSE_BUCKETS)
+UPLOAD_SECONDS = Histogram('dataloader_upload_seconds', 'Time to upload a blob to GCS', buckets=LATENCY_BUCKETS)
+EMBED_SECONDS = Histogram('dataloader_embed_seconds', 'Time to embed the chunks of a batch of files',
+                          buckets=LATENCY_BUCKETS)
+MILVUS_SECONDS = Histogram('dataloader_milvus_seconds', 'Time of a Milvus insert, delete or flush request',
+                           ['operation'], buckets=LATENCY_BUCKETS)
+
+BYTES_FETCHED = Counter('dataloader_fetched_bytes', 'Bytes of page bodies downloaded', ['service'])
+BYTES_UPLOADED = Counter('dataloader_uploaded_bytes', 'Bytes uploaded to GCS')
+PAGES = Counter('dataloader_pages', 'Pages collected by the link collector or scraped by the scraper', ['service'])
+SKIPPED = Counter('dataloader_skipped', 'Pages or files skipped, by reason', ['service', 'reason'])
+RETRIES = Counter('dataloader_retries', 'Requests retried after a transient error', ['backend'])
+CHUNKS = Counter('dataloader_chunks', 'Chunks split, embedded, inserted into or deleted from Milvus',
+                 ['operation'])
+
+QUEUE_DEPTH = Gauge('dataloader_queue_depth', 'Items waiting in a queue between two stages', ['queue'])
+FRONTIER_DEPTH = Gauge('dataloader_frontier_depth', 'URLs queued in the crawl frontier')
+
+
+def start_metrics_server(port, addr='127.0.0.1'):
+    """
+    Serve the metrics over HTTP on a background thread, for Prometheus to scrape while the run is in progress.
+
+    Parameters:
+    port (int): The port to listen on.
+    addr (str): The address to listen on. Only local clients can connect by default.
+    """
+    start_http_server(port, addr=addr)
+    logger.info(f"Serving metrics on http://{addr}:{port}/metrics")
+
+
+def write_snapshot(path):
+    """
+    Write the current value of every metric to a file in the Prometheus text format, e.g. at the end of a run for
+    the textfile collector of node_exporter. The file is replaced atomically, so a reader never sees a partial
+    snapshot.
+
+    Parameters:
+    path (str): The path of the file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+        f.write(generate_latest(REGISTRY))
+    os.replace(f.name, path)
+    logger.info(f"Wrote metrics snapshot to {path}")
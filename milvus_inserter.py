@@ -0,0 +1,302 @@
+"""
+This module provides the MilvusBulkInserter class, which writes precomputed vectors to Milvus with pymilvus.
+
+Going through `Milvus.from_documents` creates a new LangChain wrapper and connection for every batch, checks the
+collection, and is followed by a flush. The inserter instead reuses the connection of the service's MilvusClient,
+buffers rows and sends them as large column-oriented inserts, and flushes once at the end of the load. For a new
+collection, building the index can be deferred until after the load, so that Milvus indexes the sealed segments
+once instead of indexing growing segments during the load.
+
+The collection schema matches the one LangChain creates: an INT64 'pk', a 'text' and a 'vector' field, and one
+field per metadata key. Collections created by the inserter take deterministic primary keys derived from the source
+and the chunk index, so the chunks of a changed source can be deleted and written again. Collections with
+auto-generated keys, e.g. created by LangChain, are rejected, see milvus_key_migration.py.
+"""
+import hashlib
+import logging
+import threading
+
+from metrics import CHUNKS, MILVUS_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Zilliz Cloud picks the index type and its parameters
+INDEX_PARAMS = {"metric_type": "L2", "index_type": "AUTOINDEX", "params": {}}
+MAX_VARCHAR_LENGTH = 65535
+# Number of primary keys per delete expression
+DELETE_CHUNK_SIZE = 1000
+
+
+def chunk_primary_key(source, index):
+    """
+    Get the primary key of a chunk of a source.
+
+    Parameters:
+    source (str): The source of the chunk, e.g. the URL of the page.
+    index (int): The index of the chunk.
+
+    Returns:
+    int: A non-negative INT64 key.
+    """
+    return int.from_bytes(hashlib.sha256(f"{source}#{index}".encode()).digest()[:8], 'big') & (2 ** 63 - 1)
+
+
+def chunk_primary_keys(source, count):
+    """
+    Get the primary keys of the first `count` chunks of a source.
+
+    Parameters:
+    source (str): The source of the chunks, e.g. the URL of the page.
+    count (int): The number of chunks.
+
+    Returns:
+    list: One non-negative INT64 key per chunk index.
+    """
+    return [chunk_primary_key(source, index) for index in range(count)]
+
+
+class CollectionSchemaError(RuntimeError):
+    """
+    Raised for an existing collection whose schema cannot hold the chunks as they are written.
+    """
+
+
+class AutoIdCollectionError(CollectionSchemaError):
+    """
+    Raised for a collection with auto-generated primary keys, e.g. one created by LangChain.
+    """
+
+
+class MilvusBulkInserter:
+    """
+    Buffer rows and insert them into a Milvus collection in column-oriented batches.
+
+    Attributes:
+        client (MilvusClient): The client whose connection is reused.
+        collection_name (str): Name of the collection.
+        batch_rows (int): Number of buffered rows that triggers an insert.
+        defer_index (bool): Whether a new collection is indexed after the load instead of before.
+        rows_inserted (int): Number of rows inserted.
+        rows_deleted (int): Number of primary keys deleted.
+        insert_calls (int): Number of insert and delete requests sent.
+    """
+
+    def __init__(self, client, collection_name, batch_rows=2000, defer_index=False, collection=None):
+        """
+        Initialize the inserter.
+
+        Parameters:
+        client (MilvusClient): The client whose connection is reused.
+        collection_name (str): Name of the collection. It is created on the first insert if it does not exist.
+        batch_rows (int): Number of buffered rows that triggers an insert.
+        defer_index (bool): If the collection is new, build its index after the load instead of before.
+        collection (pymilvus.Collection, optional): The collection to write to, instead of opening it by name.
+        """
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_rows = batch_rows
+        self.defer_index = defer_index
+        self.rows_inserted = 0
+        self.rows_deleted = 0
+        self.insert_calls = 0
+
+        self._collection = collection
+        self._index_pending = False
+        self._rows = []
+        self._deletes = []
+        self._buffered_tags = []
+        self._inserted_tags = []
+        self._failed_tags = set()
+        self._lock = threading.RLock()
+
+    def _open_collection(self, dimension, metadata):
+        """
+        Open the collection, creating it with a schema for the vector dimension and metadata keys if needed.
+        """
+        if self._collection is not None:
+            return self._collection
+        from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility  # pylint: disable=C0415
+
+        # MilvusClient does not expose its connection alias
+        using = self.client._using  # pylint: disable=W0212
+        if utility.has_collection(self.collection_name, using=using):
+            self._collection = Collection(self.collection_name, using=using)
+            self._check_primary_key()
+            return self._collection
+
+        fields = [
+            FieldSchema('pk', DataType.INT64, is_primary=True, auto_id=False),
+            FieldSchema('text', DataType.VARCHAR, max_length=MAX_VARCHAR_LENGTH),
+            FieldSchema('vector', DataType.FLOAT_VECTOR, dim=dimension),
+        ]
+        for key, value in metadata.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                fields.append(FieldSchema(key, DataType.VARCHAR, max_length=MAX_VARCHAR_LENGTH))
+            elif isinstance(value, int):
+                fields.append(FieldSchema(key, DataType.INT64))
+            else:
+                fields.append(FieldSchema(key, DataType.DOUBLE))
+        self._collection = Collection(self.collection_name, CollectionSchema(fields), using=using)
+        logger.info(f"Created Milvus collection {self.collection_name} with fields {[f.name for f in fields]}")
+
+        if self.defer_index:
+            self._index_pending = True
+        else:
+            self._build_index()
+        return self._collection
+
+    def check_collection(self, metadata_fields=()):
+        """
+        Open the collection if it exists and check that it takes the deterministic primary keys and the metadata of
+        the chunks. Milvus would otherwise drop metadata without a field silently.
+
+        Parameters:
+        metadata_fields (iterable): The metadata keys of the chunks.
+
+        Raises:
+        AutoIdCollectionError: If the collection generates its primary keys.
+        CollectionSchemaError: If the collection has no field for one of the metadata keys.
+        """
+        with self._lock:
+            if self._collection is None:
+                if self.client is None:
+                    return
+                from pymilvus import Collection, utility  # pylint: disable=C0415
+
+                using = self.client._using  # pylint: disable=W0212
+                if not utility.has_collection(self.collection_name, using=using):
+                    return
+                self._collection = Collection(self.collection_name, using=using)
+            self._check_primary_key()
+            missing = set(metadata_fields) - {field.name for field in self._collection.schema.fields}
+            if missing:
+                raise CollectionSchemaError(
+                    f"Milvus collection {self.collection_name} has no field for the metadata {sorted(missing)}. "
+                    f"Migrate to a new collection with milvus_key_migration.py.")
+
+    def _check_primary_key(self):
+        if self._auto_id():
+            raise AutoIdCollectionError(
+                f"Milvus collection {self.collection_name} generates its primary keys, so the chunks of changed and "
+                f"removed documents cannot be deleted. Migrate to a new collection with milvus_key_migration.py.")
+
+    def _auto_id(self):
+        return any(field.name == 'pk' and field.auto_id for field in self._collection.schema.fields)
+
+    def _build_index(self):
+        self._collection.create_index('vector', INDEX_PARAMS)
+        self._collection.load()
+        logger.info(f"Built the index of {self.collection_name}")
+
+    def add(self, docs, vectors, ids=None, delete_ids=None, tag=None):
+        """
+        Buffer the chunks of one file with their vectors. Inserts the buffered rows once `batch_rows` are buffered.
+
+        Parameters:
+        docs (list): The chunks, LangChain documents.
+        vectors (list): The embeddings of the chunks.
+        ids (list, optional): The primary keys of the chunks, required unless the collection generates them.
+        delete_ids (list, optional): Primary keys to delete before the chunks are inserted, e.g. the previous
+            chunks of the same source.
+        tag (optional): Identifies the file, returned by `finish` once its rows are flushed.
+        """
+        with self._lock:
+            ids = ids if ids is not None else [None] * len(docs)
+            self._rows.extend(zip(ids, docs, vectors))
+            self._deletes.extend(delete_ids or [])
+            if tag is not None:
+                self._buffered_tags.append(tag)
+            if len(self._rows) + len(self._deletes) >= self.batch_rows:
+                self._insert_buffered()
+
+    def delete(self, ids, tag=None):
+        """
+        Buffer the deletion of primary keys, e.g. of the chunks of a removed source.
+
+        Parameters:
+        ids (list): The primary keys to delete.
+        tag (optional): Identifies the source, returned by `finish` once the deletion is flushed.
+        """
+        self.add([], [], delete_ids=ids, tag=tag)
+
+    def _insert_buffered(self):
+        """
+        Delete the buffered primary keys, then insert the buffered rows as one column-oriented request. If a request
+        fails, the files of the buffered rows are reported as failed by `finish`.
+        """
+        rows, self._rows = self._rows, []
+        deletes, self._deletes = self._deletes, []
+        tags, self._buffered_tags = self._buffered_tags, []
+        try:
+            if deletes:
+                self._delete(deletes)
+            if rows:
+                self._insert(rows)
+        except Exception:
+            self._failed_tags.update(tags)
+            raise
+        self._inserted_tags.extend(tags)
+
+    def _delete(self, ids):
+        if self._collection is None:
+            if self.client is None:
+                return
+            from pymilvus import utility  # pylint: disable=C0415
+
+            if not utility.has_collection(self.collection_name, using=self.client._using):  # pylint: disable=W0212
+                return
+            self._open_collection(None, {})
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[start:start + DELETE_CHUNK_SIZE]
+            self.insert_calls += 1
+            with MILVUS_SECONDS.labels('delete').time():
+                self._collection.delete(f"pk in [{', '.join(str(pk) for pk in chunk)}]")
+        self.rows_deleted += len(ids)
+        CHUNKS.labels('deleted').inc(len(ids))
+        logger.info(f"Deleted {len(ids)} primary keys from {self.collection_name}")
+
+    def _insert(self, rows):
+        _, first_doc, first_vector = rows[0]
+        collection = self._open_collection(len(first_vector), first_doc.metadata)
+        columns = []
+        for field in collection.schema.fields:
+            if field.name == 'pk':
+                if not field.auto_id:
+                    if any(pk is None for pk, _, _ in rows):
+                        raise ValueError(f"Milvus collection {self.collection_name} needs primary keys")
+                    columns.append([pk for pk, _, _ in rows])
+            elif field.name == 'text':
+                columns.append([doc.page_content for _, doc, _ in rows])
+            elif field.name == 'vector':
+                columns.append([list(vector) for _, _, vector in rows])
+            else:
+                default = '' if field.dtype.name == 'VARCHAR' else 0
+                columns.append([doc.metadata.get(field.name, default) for _, doc, _ in rows])
+        self.insert_calls += 1
+        with MILVUS_SECONDS.labels('insert').time():
+            collection.insert(columns)
+        self.rows_inserted += len(rows)
+        CHUNKS.labels('inserted').inc(len(rows))
+        logger.info(f"Inserted {len(rows)} rows into {self.collection_name}")
+
+    def finish(self):
+        """
+        Insert the remaining rows, flush the collection once and build a deferred index.
+
+        Returns:
+        list: The tags of the files whose rows were all inserted and flushed.
+        """
+        with self._lock:
+            self._insert_buffered()
+            if self._collection is not None:
+                with MILVUS_SECONDS.labels('flush').time():
+                    self._collection.flush()
+                if self._index_pending:
+                    self._build_index()
+                    self._index_pending = False
+            tags = [tag for tag in self._inserted_tags if tag not in self._failed_tags]
+            self._inserted_tags = []
+            self._failed_tags = set()
+            logger.info(f"Flushed {self.rows_inserted} inserted and {self.rows_deleted} deleted rows in "
+                        f"{self.insert_calls} requests into {self.collection_name}")
+            return tags
@@ -0,0 +1,78 @@
+"""
+Migrate the vector store to a Milvus collection with deterministic primary keys.
+
+Collections created by LangChain generate their primary keys, so VectorStoreService cannot delete the chunks of
+changed or removed pages in them and refuses to write to them. It also refuses collections without a field for the
+'page' of PDF chunks. To migrate:
+
+1. Set MILVUS_COLLECTION_NAME to the name of a new collection. VectorStoreService creates it on the first insert,
+   with the primary keys derived from the URL and chunk index of every chunk.
+2. Run this script, which marks every inserted link as 'scraped' again with no chunks in Milvus:
+
+       python milvus_key_migration.py --collection <Firestore collection>
+
+3. Run VectorStoreService (`web_scraper.py -vs`), which ingests all scraped files into the new collection. With
+   EMBEDDING_CACHE_PATH set, chunks embedded before are not sent to the embedding API again.
+4. Drop the old collection once the new one is complete.
+"""
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firestore_writer import BufferedFirestoreWriter
+
+load_dotenv()  # take environment variables from .env.
+logger = logging.getLogger(__name__)
+
+# Statuses of links whose file is in the vector store
+INSERTED_STATUSES = ['db_inserted', 'unchanged']
+
+
+def reset_ingestion_status(db, collection_name):
+    """
+    Mark every link whose file is in the old collection as 'scraped' with no chunks in Milvus, so that the next run
+    of VectorStoreService ingests it into the new collection. Links of removed pages keep their status, without
+    chunks to delete.
+
+    Parameters:
+    db (firestore.Client): Firestore client.
+    collection_name (str): Name of the Firestore collection of the links.
+
+    Returns:
+    int: The number of updated links.
+    """
+    collection_ref = db.collection(collection_name)
+    inserted = collection_ref.where(filter=FieldFilter(u'status', u'in', INSERTED_STATUSES))
+    with_chunks = collection_ref.where(filter=FieldFilter(u'milvus_chunks', u'>', 0))
+
+    writer = BufferedFirestoreWriter(db)
+    updated = set()
+    for query in (inserted, with_chunks):
+        for doc in query.stream():
+            if doc.id in updated:
+                continue
+            fields = {u'milvus_chunks': 0, u'shared_chunks': []}
+            if doc.get(u'status') in INSERTED_STATUSES:
+                fields[u'status'] = u'scraped'
+            writer.update(doc.reference, fields)
+            updated.add(doc.id)
+    writer.close()
+    logger.info(f"Reset the ingestion status of {len(updated)} links in {collection_name}")
+    return len(updated)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Prepare the links for ingestion into a new Milvus collection')
+    parser.add_argument('--collection', default=os.getenv('COLLECTION_NAME'),
+                        help='Firestore collection of the links, COLLECTION_NAME by default')
+    args = parser.parse_args()
+    if not args.collection:
+        raise ValueError("Error: No Firestore collection given.")
+
+    reset_ingestion_status(firestore.Client(), args.collection)
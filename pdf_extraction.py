@@ -0,0 +1,163 @@
+"""
+This module provides the PdfExtractor class, which extracts the text of PDF files page by page in a process pool.
+
+pdfminer parses one page at a time, so only the layout of the current page is held in memory. Every worker process
+runs under an address space limit, and every file under a time limit enforced with a timer signal in the worker, so
+a malformed or huge PDF fails on its own instead of stalling or exhausting the ingestion run.
+"""
+import io
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Content types ScraperService stores for PDF files, without parameters and in lower case
+PDF_CONTENT_TYPES = ['application/pdf', 'application/x-pdf']
+
+
+class PdfLimitExceeded(Exception):
+    """
+    Raised when the extraction of a PDF exceeds its time or memory limit.
+    """
+
+
+def _init_worker(memory_limit_bytes):
+    """
+    Limit the address space of a worker process.
+    """
+    if memory_limit_bytes:
+        import resource  # pylint: disable=C0415
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+
+def _on_alarm(signum, frame):
+    raise PdfLimitExceeded("Time limit exceeded")
+
+
+def extract_pdf_pages(content):
+    """
+    Extract the text of the pages of a PDF one page at a time.
+
+    Parameters:
+    content (bytes): The PDF file.
+
+    Yields:
+    tuple: The page number, starting at 1, and the page text.
+    """
+    from pdfminer.high_level import extract_pages  # pylint: disable=C0415
+    from pdfminer.layout import LTTextContainer  # pylint: disable=C0415
+
+    for page_number, layout in enumerate(extract_pages(io.BytesIO(content)), start=1):
+        yield page_number, ''.join(element.get_text() for element in layout if isinstance(element, LTTextContainer))
+
+
+def _extract_in_worker(content, time_limit=None):
+    """
+    Extract the pages with text of a PDF under the time limit. Runs in a worker process. Only the pages with text
+    are sent back to the parent process.
+
+    Returns:
+    tuple: The pages with text, as tuples of page number and text, and the number of pages.
+    """
+    if time_limit:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        pages = []
+        num_pages = 0
+        for page_number, text in extract_pdf_pages(content):
+            num_pages = page_number
+            if text.strip():
+                pages.append((page_number, text))
+        return pages, num_pages
+    except MemoryError:
+        raise PdfLimitExceeded("Memory limit exceeded") from None
+    finally:
+        if time_limit:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class PdfExtractor:
+    """
+    Extract PDF pages as LangChain documents in a process pool. Use as a context manager.
+
+    Attributes:
+        processes (int): Number of worker processes.
+        time_limit (float): Seconds allowed per file.
+        memory_limit_mb (int): Address space limit of a worker process in MiB.
+    """
+
+    def __init__(self, processes=None, time_limit=120, memory_limit_mb=1024):
+        """
+        Initialize the extractor.
+
+        Parameters:
+        processes (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        time_limit (float): Seconds allowed per file, None for no limit.
+        memory_limit_mb (int): Address space limit of a worker process in MiB, None for no limit.
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.time_limit = time_limit
+        self.memory_limit_mb = memory_limit_mb
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start(self):
+        # Spawned processes only import pdfminer and do not inherit gRPC state from this process
+        mp_context = multiprocessing.get_context('spawn')
+        memory_limit_bytes = self.memory_limit_mb * 1024 ** 2 if self.memory_limit_mb else None
+        self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=mp_context,
+                                         initializer=_init_worker, initargs=(memory_limit_bytes,))
+
+    def extract(self, content, source):
+        """
+        Extract the pages of a PDF.
+
+        Parameters:
+        content (bytes): The PDF file.
+        source (str): The source of the file, stored in the metadata.
+
+        Returns:
+        list: One document per page with text, with 'source' and 'page' metadata.
+        """
+        # Imported here, since spawned workers import this module and only need pdfminer
+        from langchain.docstore.document import Document  # pylint: disable=C0415
+
+        with self._lock:
+            pool = self._pool
+        try:
+            pages, num_pages = pool.submit(_extract_in_worker, content, self.time_limit).result()
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for its memory use. Replace the pool for the following files.
+            with self._lock:
+                if self._pool is pool:
+                    logger.error("PDF worker process died, restarting the process pool")
+                    pool.shutdown(wait=False)
+                    self._start()
+            raise PdfLimitExceeded(f"Worker process died while extracting {source}") from None
+
+        docs = [Document(page_content=text, metadata={'source': source, 'page': page_number})
+                for page_number, text in pages]
+        logger.debug(f"Extracted {len(docs)} pages with text of {num_pages} pages from {source}")
+        return docs
+
+    def close(self):
+        """
+        Shut down the process pool.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
@@ -2,94 +2,225 @@
 This module provides the ScraperService class, which is used to scrape text and PDF content from websites.
 
 This service reads 'pending' links from a Firestore database, performs scraping tasks, and then updates the status
-of the links to 'scraped' when finished. The service also uses multiprocessing to parallelize tasks and utilize 
-multiple cores on the machine.
+of the links to 'scraped' when finished. With `workers` > 1, links are fetched concurrently on a thread pool and the
+HTML is parsed in a process pool to utilize multiple cores on the machine.
 """
+import functools
 import hashlib
+import itertools
 import logging
-import time
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
-import chardet
 import requests
-from bs4 import BeautifulSoup
-from google.api_core.exceptions import DeadlineExceeded
-from google.cloud import bigquery, firestore, storage
+from google.cloud import bigquery, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 
+from bigquery_sink import BufferedBigQuerySink
+from firestore_writer import BufferedFirestoreWriter
+from gcs_uploader import GCSUploader
+from link_leases import LinkLeaseManager, link_document_id
+from metrics import BYTES_FETCHED, FETCH_SECONDS, PAGES, PARSE_SECONDS, SKIPPED
+from text_extraction import get_extraction_engine
+
 logger = logging.getLogger(__name__)
 
+SERVICE = 'scraper'
+
 
 class ScraperService:
     """
     The ScraperService class is used to scrape text and PDF content from websites.
 
     This service reads 'pending' links from a Firestore database, performs scraping tasks, and then updates the status
-    of the links to 'scraped' when finished. The service also uses multiprocessing to parallelize tasks and utilize 
-    multiple cores on the machine.
+    of the links to 'scraped' when finished. With `workers` > 1, links are fetched concurrently on a thread pool and
+    the HTML is parsed in a process pool to utilize multiple cores on the machine.
 
     Attributes:
         collection_name (str): Name of the Firestore collection to read the links from.
         pdf_bucket_name (str): Name of the GCS bucket to store PDF files.
         gcp_bucket (str): Name of the GCS bucket to store text files.
         db (firestore.Client): Firestore client.
+        on_scraped (callable): If set, called with the document ID, URL, file name and content type of every
+            uploaded file once its upload has finished, e.g. to stream it to the vector store.
     """
 
-    def __init__(self, run_id, collection_name, pdf_bucket_name, gcp_bucket, dataset_id, table_id):
+    def __init__(self, run_id, collection_name, pdf_bucket_name, gcp_bucket, dataset_id, table_id,
+                 content_cache=None, audit_spool_path=None, upload_workers=8, extraction_engine='bs4',
+                 lease_seconds=None, lease_owner=None, claim_batch_size=50, db=None, bq_client=None,
+                 storage_client=None):
         """
         Initialize ScraperService with Firestore collection name and GCS bucket names.
+
+        If `content_cache` is given, pages already fetched by LinkCollectorService are read from it instead of
+        being downloaded again. If `audit_spool_path` is given, BigQuery audit rows are spooled to that NDJSON
+        file and written with one load job at the end of `run` instead of streaming inserts. Otherwise, rows whose
+        streaming insert still fails at the end of `run` are kept in `bigquery_sink.FALLBACK_PATH` and loaded by
+        the next run. Uploads to GCS run in the background on `upload_workers` threads. `extraction_engine` selects
+        the paragraph extractor from `text_extraction.EXTRACTION_ENGINES`.
+
+        If `lease_seconds` is given, links are claimed in batches of `claim_batch_size` with a lease instead of
+        being read directly, so that several nodes can scrape the same collection without duplicate work.
+
+        `db`, `bq_client` and `storage_client` are clients shared with other services. New ones are created if they
+        are not given.
         """
         logger.info("Initializing ScraperService...")
         self.collection_name = collection_name
         self.pdf_bucket_name = pdf_bucket_name
         self.gcp_bucket = gcp_bucket
         self.run_id = run_id
+        self.content_cache = content_cache
+        self.extract_paragraphs = get_extraction_engine(extraction_engine)
+        self._parse_pool = None
+        self._local = threading.local()
         logger.info(f"Bigquery run_id: {self.run_id}")
         logger.info(f"Firestore collection name: {self.collection_name}")
         logger.info(f"PDF bucket name: {self.pdf_bucket_name}")
         logger.info(f"GCP bucket: {self.gcp_bucket}")
 
-        self.db = firestore.Client()
+        self.db = db or firestore.Client()
+        self.writer = BufferedFirestoreWriter(self.db)
+        self.on_scraped = None
         logger.info("Firestore client initialized.")
 
-        self.bq_client = bigquery.Client()
+        self.leases = None
+        # Whether the links of the current run were claimed with a lease
+        self._claimed = False
+        self.claim_batch_size = claim_batch_size
+        if lease_seconds:
+            self.leases = LinkLeaseManager(self.db, self.collection_name, owner=lease_owner,
+                                           lease_seconds=lease_seconds)
+            logger.info(f"Claiming links with a {lease_seconds}s lease as {self.leases.owner}")
+
+        self.bq_client = bq_client or bigquery.Client()
         logger.info("BigQuery client initialized.")
 
+        self.uploader = GCSUploader(storage_client=storage_client, max_workers=upload_workers)
+        logger.info("GCS uploader initialized.")
+
         self.dataset_id = dataset_id
         self.table_id = table_id
         logger.info(f"Dataset ID: {self.dataset_id}")
         logger.info(f"Table ID: {self.table_id}")
 
         self._create_bigquery_table_if_not_exists()
+        self.audit_sink = BufferedBigQuerySink(
+            self.bq_client,
+            f"{self.bq_client.project}.{self.dataset_id}.{self.table_id}",
+            spool_path=audit_spool_path,
+        )
         logger.info("ScraperService initialized.")
 
 
-    def run(self, limit=None):
+    def run(self, limit=None, workers=1, parse_processes=None, links=None):
         """
-        Scrape 'pending' links from Firestore and store the scraped content in GCS.
+        Scrape 'pending' links from Firestore, or the given links, and store the scraped content in GCS.
 
         Parameters:
         limit (int, optional): The maximum number of links to scrape.
+        workers (int): Number of links fetched concurrently. With more than one worker, HTML is parsed in a
+            process pool.
+        parse_processes (int, optional): Number of parser processes. Defaults to the number of CPUs.
+        links (iterable, optional): URLs to scrape instead of querying Firestore, e.g. streamed from the link
+            collector. They are read lazily, as the workers accept them.
         """
         logger.info(f"Starting to scrape pending links. Run ID: {self.run_id}")
-        # Retrieve 'pending' links from Firestore
-        links = self._get_pending_links(limit)
-        logger.info(f"Retrieved {len(links)} pending links.")
-
-        # Loop over the list of links
-        for link in links:
-            # Call the _scrape_link function for each link
-            self._scrape_link(link)
+        # Stream 'pending' links from Firestore, page by page, while scraping
+        self._claimed = links is None and self.leases is not None
+        if links is not None:
+            links = itertools.islice(links, limit)
+        elif self._claimed:
+            links = self._claim_pending_links(limit)
+            # Links that take long to scrape keep their lease
+            self.leases.start_renewal()
+        else:
+            links = self._get_pending_links(limit)
+
+        try:
+            if workers > 1:
+                self._scrape_parallel(links, workers, parse_processes or os.cpu_count())
+            else:
+                # Loop over the list of links
+                for link in links:
+                    # Call the _scrape_link function for each link
+                    self._scrape_link(link)
+        finally:
+            # Wait for the background uploads, then commit the buffered status updates and audit rows,
+            # also when the run is interrupted
+            self.uploader.join()
+            try:
+                if self._claimed:
+                    self.leases.stop_renewal()
+                    self.leases.flush()
+                self.writer.flush()
+            finally:
+                self.audit_sink.flush()
         logger.info("Finished scraping pending links.")
 
-    def _get_pending_links(self, limit=None):
+    def _scrape_parallel(self, links, workers, parse_processes):
+        """
+        Scrape links with a thread pool for fetching and a process pool for parsing.
+
+        All threads report into the same Firestore writer, BigQuery sink and uploader. At most twice as many
+        links as there are workers are queued at a time.
+
+        Parameters:
+        links (iterable): The links to scrape.
+        workers (int): Number of fetcher threads.
+        parse_processes (int): Number of parser processes.
+        """
+        logger.info(f"Scraping with {workers} fetcher threads and {parse_processes} parser processes.")
+        # Spawned processes only import the extraction module and do not inherit gRPC state from this process
+        mp_context = multiprocessing.get_context('spawn')
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper') as fetchers, \
+                ProcessPoolExecutor(max_workers=parse_processes, mp_context=mp_context) as parsers:
+            self._parse_pool = parsers
+            pending = set()
+            try:
+                for link in links:
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    pending.add(fetchers.submit(self._scrape_link, link))
+                for future in wait(pending).done:
+                    future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+                self._parse_pool = None
+
+    def _extract(self, html):
+        """
+        Extract the paragraphs of a page, in the parser process pool if one is running.
+
+        Parameters:
+        html (str): The decoded HTML of the page.
+
+        Returns:
+        tuple: The paragraph text and the number of characters in all paragraphs.
+        """
+        with PARSE_SECONDS.labels(SERVICE).time():
+            if self._parse_pool is not None:
+                return self._parse_pool.submit(self.extract_paragraphs, html).result()
+            return self.extract_paragraphs(html)
+
+    def _get_pending_links(self, limit=None, page_size=500):
         """
         Retrieve 'pending' links from Firestore.
 
+        The links are read in pages of `page_size` documents, using the last document of a page as the cursor
+        for the next one, so scraping can start after the first page and only `limit` documents are read.
+
         Parameters:
         limit (int, optional): The maximum number of links to retrieve.
+        page_size (int): The number of documents read per query.
 
         Returns:
-        list: A list of 'pending' links.
+        generator: The URLs of 'pending' links.
         """
         logger.info("Retrieving pending links...")
 
@@ -99,67 +230,194 @@ class ScraperService:
         # Query for documents where status is 'pending'
         query = self.db.collection(self.collection_name).where(filter=status_filter)
 
-        # Execute the query and get the documents
-        docs = query.stream()
+        retrieved = 0
+        last_doc = None
+        while limit is None or retrieved < limit:
+            size = page_size if limit is None else min(page_size, limit - retrieved)
+            page_query = query.limit(size)
+            if last_doc is not None:
+                page_query = page_query.start_after(last_doc)
+
+            # Execute the query and get one page of documents
+            docs = list(page_query.stream())
+            for doc in docs:
+                yield doc.to_dict()['url']
+            retrieved += len(docs)
+            logger.info(f"Retrieved {retrieved} pending links so far.")
+
+            if len(docs) < size:
+                break
+            last_doc = docs[-1]
+        logger.info(f"Retrieved {retrieved} pending links.")
 
-        links = [doc.to_dict()['url'] for doc in docs]
-        logger.info(f"Retrieved {len(links)} pending links.")
-        return links[:limit]  # Limit the number of links
+    def _claim_pending_links(self, limit=None):
+        """
+        Claim 'pending' links and links with an expired lease in batches.
+
+        If the consumer stops early, the claimed links it has not received yet are released again.
+
+        Parameters:
+        limit (int, optional): The maximum number of links to claim.
+
+        Returns:
+        generator: The URLs of the claimed links.
+        """
+        claimed = 0
+        while limit is None or claimed < limit:
+            size = self.claim_batch_size if limit is None else min(self.claim_batch_size, limit - claimed)
+            urls = self.leases.claim_batch(size)
+            if not urls:
+                break
+            claimed += len(urls)
+            for i, url in enumerate(urls):
+                try:
+                    yield url
+                except GeneratorExit:
+                    self.leases.release(urls[i + 1:])
+                    raise
+        logger.info(f"Claimed {claimed} links.")
 
     def _scrape_link(self, url):
-        logger.info(f"Starting to scrape URL: {url}")
+        logger.debug(f"Starting to scrape URL: {url}")
         reason_skipped = None
         file_name = "None"
         content_type = "Unknown"
+        validators = None
+        is_text = False
+        char_count = 0
+        upload = None
         try:
-            response = requests.get(url, timeout=30)
+            response = self._fetch(url)
             response.raise_for_status()
-            content_type = response.headers.get('Content-Type', '')
+            validators = self._validators(response)
+            content_type = self._content_type(response)
             if 'pdf' in content_type:
-                try:
-                    file_name = self._upload_pdf(response.content, url)
-                    is_text = False
-                    char_count = 0
-                except Exception as err: # pylint: disable=W0718
-                    logger.error(f"Failed to upload PDF: {err}")
-                    reason_skipped = f"Failed to upload PDF: {err}"
-                    char_count = 0
+                upload = (self._upload_pdf, response.content)
             elif 'text' in content_type or 'application/json' in content_type:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                text_content = ""
-                char_count = 0
                 content_type = "text"
                 is_text = True  # Assume ASCII until proven otherwise
-                for paragraph in soup.find_all('p'):
-                    paragraph_text = paragraph.get_text()
-                    char_count += len(paragraph_text)
-                    if not self._is_text(paragraph_text):
-                        continue
-                    if self._is_text(paragraph_text) and self._has_min_chars(paragraph_text, 1):
-                        text_content += paragraph_text + '\n'
+                text_content, char_count = self._extract(response.text)
                 if self._has_min_chars(text_content, 1):
-                    file_name = self._upload_text(text_content, url)
+                    upload = (self._upload_text, text_content)
                 else:
                     reason_skipped = "No paragraph with sufficient characters."
-                    logger.info(f"Skipping URL due to empty text. Number of characters: {char_count}")
+                    logger.debug(f"Skipping URL due to empty text. Number of characters: {char_count}")
+                    SKIPPED.labels(SERVICE, 'empty_text').inc()
             else:
-                logger.info(f"Skipping URL due to non-text Content-Type: {content_type}")
+                logger.debug(f"Skipping URL due to non-text Content-Type: {content_type}")
                 reason_skipped = f"Skipping URL due to non-text Content-Type: {content_type}"
+                SKIPPED.labels(SERVICE, 'content_type').inc()
         except requests.HTTPError as err:
             logger.error(f"HTTP error occurred: {err}")
             reason_skipped = f"HTTP error occurred: {err}"
-            is_text = False
-            char_count = 0
+            SKIPPED.labels(SERVICE, 'http_error').inc()
         except requests.exceptions.RequestException as err:
             logger.error(f"Request error occurred: {err}")
             reason_skipped = f"Request error occurred: {err}"
-            is_text = False
-            char_count = 0
+            SKIPPED.labels(SERVICE, 'request_error').inc()
 
-        self._update_link_status(url, 'scraped', is_text, reason_skipped, char_count, file_name, content_type)
+        if upload is None:
+            self._record_result(url, is_text, reason_skipped, char_count, file_name, content_type, validators)
+            return
+
+        # The upload runs in the background; the status is recorded once it has finished
+        upload_method, content = upload
+        callback = functools.partial(self._on_upload_done, url, is_text, char_count, content_type, validators)
+        upload_method(content, url, callback)
+
+    def _on_upload_done(self, url, is_text, char_count, content_type, validators, future):
+        """
+        Record the result of a background upload in Firestore and BigQuery.
+
+        Parameters:
+        url (str): The scraped URL.
+        is_text (bool): Whether the content is text.
+        char_count (int): The number of characters in the content.
+        content_type (str): The content type of the URL's content.
+        validators (dict): The etag, last_modified and content_hash of the scraped content.
+        future (concurrent.futures.Future): The finished upload, resolving to the blob name.
+        """
+        reason_skipped = None
+        file_name = "None"
+        try:
+            file_name = future.result()
+        except Exception as err: # pylint: disable=W0718
+            kind = 'PDF' if 'pdf' in content_type else 'text'
+            logger.error(f"Failed to upload {kind}: {err}")
+            reason_skipped = f"Failed to upload {kind}: {err}"
+            SKIPPED.labels(SERVICE, 'upload_error').inc()
+        self._record_result(url, is_text, reason_skipped, char_count, file_name, content_type, validators)
+
+    def _record_result(self, url, is_text, reason_skipped, char_count, file_name, content_type, validators):
+        """
+        Mark a link as scraped in Firestore and add its audit row for BigQuery.
+        """
+        self._update_link_status(url, 'scraped', is_text, reason_skipped, char_count, file_name, content_type,
+                                 validators)
+        PAGES.labels(SERVICE).inc()
         self._insert_into_bigquery(url, is_text, char_count, reason_skipped, file_name, content_type)
+        if self.on_scraped is not None and file_name != "None":
+            self.on_scraped(self._hash_url(url), url, file_name, content_type)
+
+    def _fetch(self, url):
+        """
+        Get the content of a URL from the content cache, or download it if it is not cached.
+
+        Parameters:
+        url (str): The URL to fetch.
+
+        Returns:
+        requests.Response or CachedResponse: The response for the URL.
+        """
+        if self.content_cache is not None:
+            cached = self.content_cache.get(self._hash_url(url))
+            if cached is not None:
+                logger.debug(f"Using cached content for URL: {url}")
+                return cached
+        with FETCH_SECONDS.labels(SERVICE).time():
+            response = self._session().get(url, timeout=30)
+        BYTES_FETCHED.labels(SERVICE).inc(len(response.content))
+        return response
+
+    def _session(self):
+        """
+        Get the HTTP session of the current thread, so that every fetcher thread reuses its own connections.
+
+        Returns:
+        requests.Session: The session of the current thread.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _validators(self, response):
+        """
+        Get the ETag, Last-Modified and content hash of a response, used for conditional GETs on the next crawl.
+
+        Parameters:
+        response (requests.Response or CachedResponse): The response of the scraped URL.
+
+        Returns:
+        dict: The etag, last_modified and content_hash of the response.
+        """
+        return {
+            u'etag': response.headers.get('ETag'),
+            u'last_modified': response.headers.get('Last-Modified'),
+            u'content_hash': hashlib.sha256(response.content).hexdigest(),
+        }
+
+    @staticmethod
+    def _content_type(response):
+        """
+        Get the media type of a response without parameters and in lower case, e.g. 'application/pdf' for
+        'Application/PDF; charset=binary', so that the stored content types can be matched exactly.
+        """
+        return response.headers.get('Content-Type', '').split(';')[0].strip().lower()
 
-    def _update_link_status(self, url, status, is_text, skipped_reason, num_characters, file_name, content_type):
+    def _update_link_status(self, url, status, is_text, skipped_reason, num_characters, file_name, content_type,
+                            validators=None):
         """
         Update the status of a link in Firestore.
 
@@ -171,57 +429,48 @@ class ScraperService:
         num_characters (int): The number of characters in the content at the URL.
         file_name (str): The name of the file stored in GCS.
         content_type (str): The content type of the URL's content.
+        validators (dict, optional): The etag, last_modified and content_hash of the scraped content.
         """
 
         doc_id = self._hash_url(url)
         doc_ref = self.db.collection(self.collection_name).document(doc_id)  # Use the locally initialized client
 
-        # Exponential backoff parameters
-        max_retries = 5
-        base_sleep_time = 1  # in seconds
-
-        for i in range(max_retries):
-            try:
-                doc_ref.update({
-                    u'status': status,
-                    u'is_text': is_text,
-                    u'skipped_reason': skipped_reason,
-                    u'num_characters': num_characters,
-                    u'file_name': file_name,
-                    u'content_type': content_type  # Add content_type to the document
-                })
-                logger.info(f"Updated URL status in Firestore: {url} => {status}")
-                break
-            except DeadlineExceeded:
-                # If a DeadlineExceeded error occurs, wait for a certain amount of time and then retry
-                sleep_time = base_sleep_time * 2 ** i
-                logger.error(
-                            f"DeadlineExceeded error occurred when updating URL status. "
-                            f"Retrying in {sleep_time} seconds..."
-                            )
-
-                time.sleep(sleep_time)
+        fields = {
+            u'status': status,
+            u'is_text': is_text,
+            u'skipped_reason': skipped_reason,
+            u'num_characters': num_characters,
+            u'file_name': file_name,
+            u'content_type': content_type  # Add content_type to the document
+        }
+        if validators:
+            fields.update(validators)
+
+        if self._claimed:
+            # Written only while this node holds the lease, so that a node whose lease expired cannot overwrite
+            # the result of the node that claimed the link again
+            self.leases.complete(url, fields)
+        else:
+            # Buffered and committed in batches; transient errors are retried by the writer
+            self.writer.update(doc_ref, fields)
+        logger.debug(f"Queued URL status update for Firestore: {url} => {status}")
 
 
 
-    def _upload_pdf(self, content, url):
+    def _upload_pdf(self, content, url, callback=None):
         """
-        Upload a PDF file to Google Cloud Storage.
+        Upload a PDF file to Google Cloud Storage in the background.
 
         Args:
             content (bytes): The content of the PDF file.
             url (str): The URL of the PDF file.
+            callback (callable, optional): Called with the future once the upload has finished.
 
         Returns:
-            str: The name of the uploaded blob.
+            concurrent.futures.Future: Resolves to the name of the uploaded blob.
         """
-        storage_client = storage.Client()
-        bucket = storage_client.get_bucket(self.pdf_bucket_name)
         blob_name = self._clean_url(url) + ".pdf"
-        blob = bucket.blob(blob_name)
-        blob.upload_from_string(content)
-        logger.info(f"PDF uploaded to GCS: {blob_name}")
-        return blob_name  # Return the blob name
+        return self.uploader.submit(self.pdf_bucket_name, blob_name, content, callback=callback)
 
     def _clean_url(self, url):
         """
@@ -237,22 +486,18 @@ class ScraperService:
 
 
 
-    def _upload_text(self, text_content, url):
-        """Upload the scraped page content as a text file to Google Cloud Storage.
+    def _upload_text(self, text_content, url, callback=None):
+        """Upload the scraped page content as a text file to Google Cloud Storage in the background.
 
         :param text_content: The content of the page.
         :param url: The URL of the page.
+        :param callback: Called with the future once the upload has finished.
 
         Returns:
-            str: The name of the uploaded blob.
+            concurrent.futures.Future: Resolves to the name of the uploaded blob.
         """
-        storage_client = storage.Client()
-        bucket = storage_client.get_bucket(self.gcp_bucket)
-        url_clean = url.replace("http://", "").replace("https://", "").replace("/", "__")
-        blob_name = f'{url_clean}.txt'
-        blob = bucket.blob(blob_name)
-        blob.upload_from_string(text_content)
-        return blob_name  # Return the blob name
+        blob_name = f'{self._clean_url(url)}.txt'
+        return self.uploader.submit(self.gcp_bucket, blob_name, text_content, callback=callback)
 
     def _hash_url(self, url):
         """
@@ -264,19 +509,7 @@ class ScraperService:
         Returns:
         str: The hashed URL.
         """
-        return hashlib.md5(url.encode()).hexdigest()
-
-    def _is_text(self, text):
-        """
-        Check if text is binary or ASCII
-
-        Parameters:
-        text (str): The text to check.
-
-        Returns:
-        bool: True if text is ASCII, False if it's binary.
-        """
-        return chardet.detect(text.encode())['encoding'] is not None
+        return link_document_id(url)
 
     def _has_min_chars(self, text, min_chars):
         """
@@ -314,26 +547,14 @@ class ScraperService:
 
     def _insert_into_bigquery(self, url, is_ascii, char_count, reason_skipped, file_name, content_type):
         """
-        Insert a new row or update existing one into the BigQuery table.
-        """
-        errors = None
-        table_ref = f"{self.bq_client.project}.{self.dataset_id}.{self.table_id}"
-        table = self.bq_client.get_table(table_ref)  # Get table reference
-
-        rows_to_insert = [
-            {
-                "run_id": str(self.run_id),
-                "url": url,
-                "is_ascii": is_ascii,
-                "char_count": char_count,
-                "reason_skipped": reason_skipped,
-                "file_name": file_name,
-                "content_type": content_type,
-            }
-        ]
-        errors = self.bq_client.insert_rows_json(table, rows_to_insert)
-
-        if errors:
-            logger.error(f"Encountered errors while inserting/updating rows: {errors}")
-        else:
-            logger.info(f"Rows successfully inserted/updated into table {self.table_id}.")
+        Buffer a row for the BigQuery table. Rows are written in bulk by the audit sink.
+        """
+        self.audit_sink.add({
+            "run_id": str(self.run_id),
+            "url": url,
+            "is_ascii": is_ascii,
+            "char_count": char_count,
+            "reason_skipped": reason_skipped,
+            "file_name": file_name,
+            "content_type": content_type,
+        })
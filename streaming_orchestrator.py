@@ -0,0 +1,247 @@
+"""
+This module provides the StreamingOrchestrator class, which runs LinkCollectorService, ScraperService and
+VectorStoreService at the same time.
+
+Run one after another, the scraper waits for the whole crawl and the vector store for every page to be scraped, so
+the latency of a run is the sum of all services. The orchestrator instead passes every link the collector stores to
+the scraper through a bounded queue, and every file the scraper uploads to the vector store. A service finishes once
+its input is exhausted, and its completion closes the input of the next one. Bounded queues apply backpressure: a
+service that falls behind blocks the one before it.
+
+If a service fails or stops early, the services before it stop passing items on. The dropped links and files keep
+their status 'pending' or 'scraped' in Firestore and are picked up by the next run. At the end, the orchestrator
+logs when each service was active and which of them were on the critical path of the run.
+"""
+import logging
+import queue
+import threading
+import time
+
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class _Channel:
+    """
+    A bounded queue between two services. The producer closes it when it is done, and the consumer abandons it when
+    it stops, after which items are dropped instead of blocking the producer.
+    """
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.abandoned = threading.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.first_received_at = None
+        self._lock = threading.Lock()
+
+    def _put(self, item):
+        while not self.abandoned.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def put(self, item):
+        sent = self._put(item)
+        with self._lock:
+            if sent:
+                self.sent += 1
+            else:
+                self.dropped += 1
+
+    def close(self):
+        self._put(_DONE)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            if self.first_received_at is None:
+                self.first_received_at = time.monotonic()
+            yield item
+
+
+class _StageRecord:
+    def __init__(self, name, input_channel):
+        self.name = name
+        self.input = input_channel
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+
+class StreamingOrchestrator:
+    """
+    Run the selected services concurrently, each on its own thread, connected by bounded queues.
+
+    All services use the Firestore writer of the first service, so that the writes of the collector, the scraper and
+    the vector store to the same link are committed in order.
+
+    Attributes:
+        link_collector (LinkCollectorService): The link collector, or None.
+        scraper (ScraperService): The scraper, or None.
+        vector_store (VectorStoreService): The vector store, or None.
+        queue_size (int): Capacity of each queue between two services.
+        multi_seed (bool): Whether the link collector crawls all seeds at the same time with `run_multi`.
+    """
+
+    def __init__(self, link_collector=None, scraper=None, vector_store=None, queue_size=10000, multi_seed=False):
+        self.link_collector = link_collector
+        self.scraper = scraper
+        self.vector_store = vector_store
+        self.queue_size = queue_size
+        self.multi_seed = multi_seed
+        self._seen_urls = set()
+        self._seen_lock = threading.Lock()
+
+    def run(self, seeds=(), collector_kwargs=None, scraper_kwargs=None, vector_store_kwargs=None):
+        """
+        Run the services until every one of them has finished.
+
+        Parameters:
+        seeds (list): Tuples of start URL and base URL for the link collector.
+        collector_kwargs (dict, optional): Further arguments of `LinkCollectorService.run`, or of `run_multi` in
+            multi-seed mode.
+        scraper_kwargs (dict, optional): Arguments of `ScraperService.run`.
+        vector_store_kwargs (dict, optional): Arguments of `VectorStoreService.run`.
+
+        Returns:
+        dict: The critical path summary, see `_summary`.
+        """
+        services = [service for service in (self.link_collector, self.scraper, self.vector_store) if service]
+        for service in services[1:]:
+            service.writer = services[0].writer
+
+        links = _Channel(self.queue_size) if self.link_collector and self.scraper else None
+        files = _Channel(self.queue_size) if self.scraper and self.vector_store else None
+        if links is not None:
+            self.link_collector.on_link_stored = lambda url: self._send_link(links, url)
+        if files is not None:
+            self.scraper.on_scraped = lambda *args: self._send_file(files, *args)
+
+        # Tuples of name, function, input channel and output channel
+        stages = []
+        if self.link_collector is not None:
+            stages.append(('collect', lambda: self._collect(seeds, collector_kwargs or {}), None, links))
+        if self.scraper is not None:
+            stages.append(('scrape', lambda: self.scraper.run(links=iter(links) if links else None,
+                                                              **(scraper_kwargs or {})), links, files))
+        if self.vector_store is not None:
+            stages.append(('embed', lambda: self.vector_store.run(files=iter(files) if files else None,
+                                                                  **(vector_store_kwargs or {})), files, None))
+
+        records = []
+        threads = []
+        start = time.monotonic()
+        for name, func, input_channel, output_channel in stages:
+            if input_channel is not None:
+                QUEUE_DEPTH.labels(f'stream_{name}').set_function(input_channel.queue.qsize)
+            record = _StageRecord(name, input_channel)
+            thread = threading.Thread(target=self._run_stage, args=(record, func, output_channel),
+                                      name=f'stream-{name}')
+            thread.start()
+            records.append(record)
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        if self.link_collector is not None:
+            self.link_collector.on_link_stored = None
+        if self.scraper is not None:
+            self.scraper.on_scraped = None
+
+        summary = self._summary(records, start, time.monotonic())
+        self._log_summary(summary)
+        return summary
+
+    def _collect(self, seeds, kwargs):
+        if self.multi_seed:
+            self.link_collector.run_multi(seeds, **kwargs)
+            return
+        for start_url, base_url in seeds:
+            self.link_collector.run(start_url=start_url, base_url=base_url, **kwargs)
+
+    def _send_link(self, links, url):
+        # The same URL can be stored by several seeds
+        with self._seen_lock:
+            if url in self._seen_urls:
+                return
+            self._seen_urls.add(url)
+        links.put(url)
+
+    def _send_file(self, files, doc_id, url, file_name, content_type):
+        source_file = self.vector_store.source_file(doc_id, url, file_name, content_type)
+        if source_file is not None:
+            files.put(source_file)
+
+    @staticmethod
+    def _run_stage(record, func, output):
+        record.started_at = time.monotonic()
+        try:
+            func()
+        except Exception as err:  # pylint: disable=W0718
+            logger.error(f"Streaming stage {record.name} failed: {err}", exc_info=True)
+            record.error = str(err)
+        finally:
+            record.finished_at = time.monotonic()
+            if record.input is not None:
+                record.input.abandoned.set()
+            if output is not None:
+                output.close()
+
+    @staticmethod
+    def _summary(records, start, end):
+        """
+        Summarize when each stage was active and how much of the run it was the only stage left running.
+
+        A stage is on the critical path from the moment its input is closed, i.e. the stage before it finished, until
+        it finishes itself. The stage with the longest such tail is the bottleneck of the run. Items are counted when
+        they are put into the input queue of the stage.
+
+        Returns:
+        dict: The wall time, the sum of the stage durations, the bottleneck and the timings of every stage.
+        """
+        stages = {}
+        upstream_finished_at = start
+        for record in records:
+            channel = record.input
+            first_input_at = channel.first_received_at if channel is not None else record.started_at
+            active_from = first_input_at or record.finished_at
+            stages[record.name] = {
+                'first_input_after': round(active_from - start, 3),
+                'finished_after': round(record.finished_at - start, 3),
+                'active_seconds': round(record.finished_at - active_from, 3),
+                'critical_path_seconds': round(max(0.0, record.finished_at - max(upstream_finished_at,
+                                                                                  record.started_at)), 3),
+                'items_queued': channel.sent if channel is not None else None,
+                'items_dropped': channel.dropped if channel is not None else None,
+                'error': record.error,
+            }
+            upstream_finished_at = record.finished_at
+        bottleneck = max(stages, key=lambda name: stages[name]['critical_path_seconds']) if stages else None
+        return {
+            'seconds': round(end - start, 3),
+            'sum_of_stage_seconds': round(sum(stage['active_seconds'] for stage in stages.values()), 3),
+            'bottleneck': bottleneck,
+            'stages': stages,
+        }
+
+    @staticmethod
+    def _log_summary(summary):
+        logger.info(f"Streaming run finished in {summary['seconds']}s, the stages were active for "
+                    f"{summary['sum_of_stage_seconds']}s in total. Bottleneck: {summary['bottleneck']}")
+        for name, stage in summary['stages'].items():
+            details = ''
+            if stage['items_queued'] is not None:
+                details += f", {stage['items_queued']} items queued ({stage['items_dropped']} dropped)"
+            if stage['error']:
+                details += f", failed: {stage['error']}"
+            logger.info(f"Stage {name}: active from {stage['first_input_after']}s to {stage['finished_after']}s, "
+                        f"{stage['critical_path_seconds']}s on the critical path{details}")
@@ -0,0 +1,120 @@
+"""
+This module provides the paragraph extraction engines used by ScraperService.
+
+An engine takes the decoded HTML of a page and returns the text of its `<p>` elements, one paragraph per line,
+together with the number of characters found in all paragraphs. Two engines are available:
+
+- 'bs4': the original extractor and the default, BeautifulSoup with 'html.parser'.
+- 'lxml': lxml's C parser.
+
+Both engines join the paragraphs and check the text of a page once with chardet. Only the paragraphs of a page that
+fails the check are checked one by one, so that the text paragraphs of the page are kept.
+
+The output of the engines differs on malformed markup: lxml builds the tree like a browser and closes a `<p>` at the
+next block element or `<p>`, while 'html.parser' nests them. For example, `<p>Intro<div>block</div>tail</p>` gives
+'Intro' with lxml and 'Introblocktail' with bs4. Run `python -m benchmarks.bench_extraction --check` on saved pages
+before switching engines.
+"""
+import logging
+
+import chardet
+
+logger = logging.getLogger(__name__)
+
+
+def is_text(text):
+    """
+    Check if text is binary or ASCII
+
+    Parameters:
+    text (str): The text to check.
+
+    Returns:
+    bool: True if text is ASCII, False if it's binary.
+    """
+    return chardet.detect(text.encode())['encoding'] is not None
+
+
+def join_paragraphs(paragraphs):
+    """
+    Join the non-empty text paragraphs of a page, one paragraph per line.
+
+    Parameters:
+    paragraphs (list): The text of every paragraph of the page.
+
+    Returns:
+    str: The joined paragraphs, or an empty string if there are none.
+    """
+    paragraphs = [paragraph for paragraph in paragraphs if paragraph]
+    if not paragraphs:
+        return ""
+    text_content = '\n'.join(paragraphs) + '\n'
+    if is_text(text_content):
+        return text_content
+    paragraphs = [paragraph for paragraph in paragraphs if is_text(paragraph)]
+    return '\n'.join(paragraphs) + '\n' if paragraphs else ""
+
+
+def extract_paragraphs_bs4(html):
+    """
+    Extract paragraphs with BeautifulSoup and 'html.parser'.
+
+    Parameters:
+    html (str): The decoded HTML of the page.
+
+    Returns:
+    tuple: The paragraph text, one paragraph per line, and the number of characters in all paragraphs.
+    """
+    from bs4 import BeautifulSoup  # pylint: disable=C0415
+
+    soup = BeautifulSoup(html, 'html.parser')
+    paragraphs = [paragraph.get_text() for paragraph in soup.find_all('p')]
+    return join_paragraphs(paragraphs), sum(len(paragraph) for paragraph in paragraphs)
+
+
+def extract_paragraphs_lxml(html):
+    """
+    Extract paragraphs with lxml.
+
+    Parameters:
+    html (str): The decoded HTML of the page.
+
+    Returns:
+    tuple: The paragraph text, one paragraph per line, and the number of characters in all paragraphs.
+    """
+    import lxml.etree  # pylint: disable=C0415
+    import lxml.html  # pylint: disable=C0415
+
+    # Parse from bytes so that pages with an XML encoding declaration are accepted
+    parser = lxml.html.HTMLParser(encoding='utf-8')
+    try:
+        root = lxml.html.fromstring(html.encode('utf-8', errors='replace'), parser=parser)
+    except (lxml.etree.ParserError, ValueError) as err:
+        logger.debug(f"Failed to parse HTML with lxml: {err}")
+        return "", 0
+
+    paragraphs = [paragraph.text_content() for paragraph in root.iter('p')]
+    return join_paragraphs(paragraphs), sum(len(paragraph) for paragraph in paragraphs)
+
+
+EXTRACTION_ENGINES = {
+    'bs4': extract_paragraphs_bs4,
+    'lxml': extract_paragraphs_lxml,
+}
+
+
+def get_extraction_engine(name):
+    """
+    Get a paragraph extraction engine by name.
+
+    Parameters:
+    name (str): The name of the engine, one of `EXTRACTION_ENGINES`.
+
+    Returns:
+    callable: The extraction function.
+    """
+    try:
+        return EXTRACTION_ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown extraction engine '{name}'. "
+                         f"Available engines: {', '.join(EXTRACTION_ENGINES)}") from None
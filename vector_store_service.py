@@ -1,28 +1,77 @@
+import itertools
 import logging
 import os
+from collections import namedtuple
 
 from dotenv import load_dotenv
 from google.cloud import firestore, storage
 from google.cloud.firestore_v1.base_query import FieldFilter
-from langchain.document_loaders import GCSFileLoader
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores import Milvus
 from pymilvus import MilvusClient
 
+from chunk_dedup import ChunkDeduplicator
+from embedding_cache import CachedEmbeddings
+from embedding_dispatcher import EmbeddingDispatcher
+from firestore_writer import BufferedFirestoreWriter
+from gcs_text_loader import GCSTextLoader
+from ingestion_pipeline import IngestionPipeline, Stage
+from metrics import CHUNKS, EMBED_SECONDS, SKIPPED
+from milvus_inserter import MilvusBulkInserter, chunk_primary_key, chunk_primary_keys
+from pdf_extraction import PDF_CONTENT_TYPES, PdfExtractor
+
 load_dotenv()  # take environment variables from .env.
 logger = logging.getLogger(__name__)
 
+# Metadata of every chunk, each stored in a field of the Milvus collection
+METADATA_FIELDS = ('source', 'page')
+# Status of a link whose PDF failed to extract. It is not retried until the link is scraped again.
+PDF_FAILED_STATUS = 'pdf_failed'
+
+# A scraped file to ingest. `chunk_count` is the number of chunk indices of the file already used in Milvus, None if
+# it has to be read from Firestore. `shared_chunks` are the primary keys of its chunks that near-duplicate chunks of
+# other files were dropped for. They are never deleted, and new chunks of the file skip their indices.
+SourceFile = namedtuple('SourceFile', ['doc_id', 'file_name', 'content_type', 'url', 'chunk_count', 'shared_chunks'],
+                        defaults=((),))
+
 class VectorStoreService:
     """
     A service that retrieves text data from Google Cloud Storage and feeds it into a Milvus database.
     """
-    def __init__(self, run_id, project_name, bucket_name, collection_name, milvus_collection_name):
+    def __init__(self, run_id, project_name, bucket_name, collection_name, milvus_collection_name,
+                 embedding_cache_path=None, embedding_cache_max_entries=1000000, dedup_threshold=None,
+                 dedup_report_path=None, embedding_concurrency=None, embedding_rpm=3000, embedding_tpm=1000000,
+                 pdf_bucket_name=None, pdf_time_limit=120, pdf_memory_limit_mb=1024, milvus_defer_index=False,
+                 db=None, storage_client=None, milvus_client=None, milvus_collection=None, embeddings=None):
         """
         Initializes the service with the given project name and bucket name.
 
         :param project_name: The name of the GCP project.
         :param bucket_name: The name of the GCS bucket containing the text data.
+        :param embedding_cache_path: Optional SQLite file caching embeddings by chunk text and model, so that
+            unchanged chunks are not sent to the embedding API again.
+        :param embedding_cache_max_entries: Maximum number of cached embeddings before the least recently used
+            ones are evicted.
+        :param dedup_threshold: If given, chunks whose estimated Jaccard similarity with an earlier chunk of the
+            run reaches this threshold are dropped before they are embedded. The kept chunk is not deleted with
+            its own file while the dropped copies depend on it.
+        :param dedup_report_path: Optional JSON file listing the sources that share each kept chunk.
+        :param embedding_concurrency: If given, chunks are embedded by an EmbeddingDispatcher with this many
+            concurrent requests instead of OpenAIEmbeddings.
+        :param embedding_rpm: Requests-per-minute limit of the OpenAI account, used with embedding_concurrency.
+        :param embedding_tpm: Tokens-per-minute limit of the OpenAI account, used with embedding_concurrency.
+        :param pdf_bucket_name: The name of the GCS bucket containing the scraped PDFs. If given, their text is
+            extracted page by page and ingested together with the texts.
+        :param pdf_time_limit: Seconds allowed for the text extraction of one PDF.
+        :param pdf_memory_limit_mb: Memory limit of a PDF extraction process in MiB.
+        :param milvus_defer_index: If the Milvus collection does not exist yet, build its index after the first
+            load instead of before.
+        :param db: Optional Firestore client shared with other services.
+        :param storage_client: Optional GCS client shared with other services.
+        :param milvus_client: Optional MilvusClient to use instead of connecting to Zilliz Cloud.
+        :param milvus_collection: Optional pymilvus Collection to write to instead of opening the collection by name.
+        :param embeddings: Optional LangChain Embeddings to use instead of the OpenAI models. They are still wrapped
+            in the embedding cache if embedding_cache_path is given.
         """
         self.run_id = run_id
         self.project_name = project_name
@@ -32,98 +81,274 @@ class VectorStoreService:
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.milvus_api_key = os.getenv('MILVUS_API_KEY')
 
-        self.storage_client = storage.Client()
-        self.db = firestore.Client()
-
-        self.connection_args = {
-            "uri": "https://in03-5052868020ac71b.api.gcp-us-west1.zillizcloud.com",
-            "user": "vaclav@pechtor.ch",
-            "token": self.milvus_api_key,
-            "secure": True
-        }
-
-        self.client = MilvusClient(
+        self.storage_client = storage_client or storage.Client()
+        self.loader = GCSTextLoader(bucket_name, storage_client=self.storage_client)
+        self.pdf_bucket_name = pdf_bucket_name
+        self.pdf_loader = None
+        if pdf_bucket_name:
+            self.pdf_loader = GCSTextLoader(pdf_bucket_name, storage_client=self.storage_client)
+        self.pdf_time_limit = pdf_time_limit
+        self.pdf_memory_limit_mb = pdf_memory_limit_mb
+        self.pdf_extractor = None
+        self.db = db or firestore.Client()
+        self.writer = BufferedFirestoreWriter(self.db)
+
+        self.client = milvus_client or MilvusClient(
             uri="https://in03-5052868020ac71b.api.gcp-us-west1.zillizcloud.com",
             token=self.milvus_api_key
         )
         logger.info(f'Milvus connection: {self.client}')
-
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
+        self.milvus_collection = milvus_collection
+
+        self.embedding_model = "text-embedding-ada-002"
+        if embeddings is not None:
+            self.embeddings = embeddings
+        elif embedding_concurrency:
+            self.embeddings = EmbeddingDispatcher(model=self.embedding_model, max_in_flight=embedding_concurrency,
+                                                  requests_per_minute=embedding_rpm, tokens_per_minute=embedding_tpm)
+        else:
+            self.embeddings = OpenAIEmbeddings(model=self.embedding_model)
         logger.info(f'OpenAI embedings: {self.embeddings}')
+        if embedding_cache_path:
+            self.embeddings = CachedEmbeddings(self.embeddings, embedding_cache_path, self.embedding_model,
+                                               max_entries=embedding_cache_max_entries)
+            logger.info(f'Embedding cache: {embedding_cache_path}')
+
+        self.text_splitter = CharacterTextSplitter(chunk_size=1024, chunk_overlap=0)
+        self.dedup_threshold = dedup_threshold
+        self.dedup_report_path = dedup_report_path
+        self.deduplicator = None
+        self.defer_index = milvus_defer_index
+        self.inserter = None
 
         logger.info(f'Init completed. Milvus db: {self.milvus_collection_name}, Firestore db: {self.collection_name}')
 
 
-    def run(self, num_docs=None):
+    def run(self, num_docs=None, download_workers=8, split_workers=1, embed_workers=1, embed_batch_files=10,
+            insert_batch_files=100, pdf_processes=None, files=None):
         """
-        Runs the service, processing each document in the bucket individually.
+        Runs the service. Files are downloaded, split, embedded and written to Milvus in overlapping stages that are
+        connected by bounded queues.
 
         :param num_docs: The number of documents to process. If None, all documents will be processed.
-        :param collection_name: The name of the collection to store the vector data in. Defaults to 'default'.
+        :param download_workers: Number of files downloaded from GCS at the same time.
+        :param split_workers: Number of threads splitting files into chunks.
+        :param embed_workers: Number of embedding calls at the same time. The EmbeddingDispatcher already sends
+            concurrent requests within one call.
+        :param embed_batch_files: Number of files whose chunks are embedded in one call.
+        :param insert_batch_files: Number of files handed to the Milvus bulk inserter at once.
+        :param pdf_processes: Number of processes extracting PDF text. Defaults to the number of CPUs.
+        :param files: Optional SourceFiles to ingest instead of the scraped files in Firestore, e.g. streamed from
+            the scraper with `source_file`. They are read lazily, as the pipeline accepts them.
         """
         logger.info(f'Starting VectorStoreService. Run ID: {self.run_id}')
 
-        # Fetch file names from Firestore instead of directly from GCS
-        file_names = self._get_text_filenames()
+        if files is None:
+            # Fetch document IDs and file names from Firestore instead of directly from GCS
+            files = self._get_text_files()
+            if self.pdf_loader is not None:
+                files += self._get_pdf_files()
 
         if num_docs is not None:
-            file_names = file_names[:num_docs]
+            files = itertools.islice(files, num_docs)
+
+        self.deduplicator = ChunkDeduplicator(threshold=self.dedup_threshold) if self.dedup_threshold else None
+
+        self.inserter = MilvusBulkInserter(self.client, self.milvus_collection_name, defer_index=self.defer_index,
+                                           collection=self.milvus_collection)
+        # Fail before anything is embedded if changed and removed files cannot be replaced, or pages not stored
+        self.inserter.check_collection(METADATA_FIELDS)
+        pipeline = IngestionPipeline([
+            Stage('download', self._load_file, workers=download_workers, queue_size=2 * download_workers),
+            Stage('split', self._split_file, workers=split_workers),
+            Stage('embed', self._embed_files, workers=embed_workers, batch_size=embed_batch_files),
+            Stage('insert', self._write_batch, batch_size=insert_batch_files,
+                  queue_size=max(64, 2 * insert_batch_files)),
+        ])
+        try:
+            if self.pdf_loader is not None:
+                with PdfExtractor(processes=pdf_processes, time_limit=self.pdf_time_limit,
+                                  memory_limit_mb=self.pdf_memory_limit_mb) as self.pdf_extractor:
+                    pipeline.run(files)
+                self.pdf_extractor = None
+            else:
+                pipeline.run(files)
+
+            self._delete_removed_files()
+            self._finish_insert()
+        finally:
+            # Commit the statuses buffered during the run, e.g. of failed PDFs, also if the insert failed
+            self.writer.flush()
 
-        batch_size = 100
-        batch_docs = []
-        text_splitter = CharacterTextSplitter(chunk_size=1024, chunk_overlap=0)
-
-        for i, file_name in enumerate(file_names):
-            logger.info(f'Processing document {i}.')
-            try:
-                # Load the file from GCS using the file name
-                loader = GCSFileLoader(project_name=self.project_name, bucket=self.bucket_name, blob=file_name)
-                doc = loader.load()
-                logger.info(f'Loaded document {i}.')
-
-                docs = text_splitter.split_documents(doc)
-
-                batch_docs.extend(docs)
-
-                if (i + 1) % batch_size == 0:
-                    logger.info('Writing batch to Milvus.')
-                    _ = Milvus.from_documents(
-                        batch_docs,  # process a batch of documents
-                        embedding=self.embeddings,
-                        connection_args=self.connection_args,
-                        collection_name=self.milvus_collection_name  # Use the given collection name
-                    )
-                    self.client.flush(collection_name=self.milvus_collection_name)
-                    num_entities = self.client.num_entities(collection_name=self.milvus_collection_name)
-                    logger.info(f'Number of vectors in the database: {num_entities}')
-                    batch_docs = []
-
-                # Update the status in Firestore after each file is processed
-                self._set_status_to_db_inserted(file_name)
-            except Exception as e:  # pylint: disable=W0718
-                logger.error(f'Exception occurred while processing document {i}: {e}', exc_info=True)
-
-        # If there are any documents left in the batch, process them
-        logger.info(f'Writing {len(batch_docs)} remaining batch_docs to Milvus.')
-        if batch_docs:
-            _ = Milvus.from_documents(
-                batch_docs,  # process the remaining documents
-                embedding=self.embeddings,
-                connection_args=self.connection_args,
-                collection_name=self.milvus_collection_name  # Use the given collection name
-            )
-            self.client.flush(collection_name=self.milvus_collection_name)
         num_entities = self.client.num_entities(collection_name=self.milvus_collection_name)
         logger.info(f'Number of vectors in the database: {num_entities}')
+        if self.deduplicator is not None:
+            self.deduplicator.log_summary()
+            if self.dedup_report_path:
+                self.deduplicator.write_report(self.dedup_report_path)
+        if isinstance(self.embeddings, CachedEmbeddings):
+            logger.info(f'Embedding cache hits: {self.embeddings.hits}, misses: {self.embeddings.misses}')
         logger.info('VectorStoreService has finished processing.')
 
 
-    def _get_text_filenames(self):
+    def _load_file(self, file):
+        """
+        Load a file from GCS. The text of a PDF is extracted page by page in the PDF process pool.
+
+        Parameters:
+        file (SourceFile): The file to load.
+
+        Returns:
+        tuple: The file and the loaded documents.
+        """
+        if file.chunk_count is None:
+            snapshot = self.db.collection(self.collection_name).document(file.doc_id).get()
+            data = snapshot.to_dict() or {}
+            file = file._replace(chunk_count=data.get(u'milvus_chunks', 0),
+                                 shared_chunks=tuple(data.get(u'shared_chunks', ())))
+        if file.content_type == 'pdf':
+            content = self.pdf_loader.download(file.file_name)
+            try:
+                docs = self.pdf_extractor.extract(content, f'gs://{self.pdf_bucket_name}/{file.file_name}')
+            except Exception as e:  # pylint: disable=W0718
+                self._set_pdf_failed(file, e)
+                raise
+        else:
+            docs = self.loader.load(file.file_name)
+        logger.debug(f'Loaded document {file.file_name}.')
+        return file, docs
+
+
+    def _split_file(self, loaded_file):
+        """
+        Split the documents of a file into chunks and drop near-duplicate chunks.
+
+        Parameters:
+        loaded_file (tuple): The file and the loaded documents.
+
+        Returns:
+        tuple: The file and the chunks.
+        """
+        file, docs = loaded_file
+        chunks = self.text_splitter.split_documents(docs)
+        for chunk in chunks:
+            # Texts have no pages. Every chunk needs the same metadata fields for the Milvus collection schema.
+            chunk.metadata.setdefault('page', 0)
+        if self.deduplicator is not None:
+            keys, _ = self._chunk_keys(file, len(chunks))
+            chunks = self.deduplicator.filter(chunks, owner=file.doc_id, keys=keys)
+        CHUNKS.labels('split').inc(len(chunks))
+        return file, chunks
+
+
+    @staticmethod
+    def _chunk_keys(file, count):
+        """
+        Get the primary keys of the new chunks of a file. The indices of its shared chunks are skipped, so that the
+        new chunks never take the key of a shared chunk that is kept.
+
+        Parameters:
+        file (SourceFile): The file.
+        count (int): The number of chunks.
+
+        Returns:
+        tuple: The keys and the number of chunk indices they span.
+        """
+        shared = set(file.shared_chunks)
+        keys = []
+        index = 0
+        while len(keys) < count:
+            key = chunk_primary_key(file.url, index)
+            if key not in shared:
+                keys.append(key)
+            index += 1
+        return keys, index
+
+
+    def _embed_files(self, split_files):
+        """
+        Embed the chunks of several files with one call.
+
+        Parameters:
+        split_files (list): Tuples of file and chunks.
+
+        Returns:
+        list: Tuples of file, chunks and the embeddings of the chunks.
+        """
+        texts = [chunk.page_content for _, chunks in split_files for chunk in chunks]
+        if texts:
+            with EMBED_SECONDS.time():
+                vectors = iter(self.embeddings.embed_documents(texts))
+            CHUNKS.labels('embedded').inc(len(texts))
+        else:
+            vectors = iter([])
+        return [(file, chunks, [next(vectors) for _ in chunks]) for file, chunks in split_files]
+
+
+    def _write_batch(self, embedded_files):
+        """
+        Buffer the chunks of a batch of files in the bulk inserter, which sends them to Milvus in large inserts.
+
+        The chunks of a file get deterministic primary keys from the URL of the file and the chunk index. The chunks
+        stored for an earlier version of the file, listed by its chunk count in Firestore, and the keys of the new
+        chunks are deleted first, except the chunks that near duplicates of other files were dropped for. Deleting
+        the new keys removes the rows of an earlier run whose flush failed before the chunk count was recorded.
+
+        Parameters:
+        embedded_files (list): Tuples of file, chunks and embeddings.
+        """
+        for file, chunks, vectors in embedded_files:
+            keys, span = self._chunk_keys(file, len(chunks))
+            self.inserter.add(chunks, vectors, ids=keys, delete_ids=self._stale_keys(file, span),
+                              tag=(file.doc_id, 'db_inserted', span, file.shared_chunks))
+
+
+    @staticmethod
+    def _stale_keys(file, span=0):
         """
-        Get all filenames of texts with status 'scraped' from Firestore.
+        Get the primary keys of the chunks stored for an earlier version of a file, without its shared chunks.
+
+        Parameters:
+        file (SourceFile): The file.
+        span (int): The number of chunk indices of the new chunks, whose keys are included as well.
 
         Returns:
-        A list of filenames (str).
+        list: The keys.
+        """
+        shared = set(file.shared_chunks)
+        return [key for key in chunk_primary_keys(file.url, max(file.chunk_count, span)) if key not in shared]
+
+
+    def _delete_removed_files(self):
+        """
+        Delete the vectors of files that no longer have content, e.g. pages that now return an error.
+        """
+        removed = self._get_removed_files()
+        for file in removed:
+            self.inserter.delete(self._stale_keys(file), tag=(file.doc_id, 'db_removed', 0, file.shared_chunks))
+        if removed:
+            logger.info(f'Deleting the vectors of {len(removed)} removed files.')
+
+
+    def _finish_insert(self):
+        """
+        Flush the bulk inserter and, once the vectors are flushed, record the new status and chunk count of every
+        written file in Firestore. Files whose insert failed keep their status and are retried on the next run.
+        """
+        try:
+            results = self.inserter.finish()
+        except Exception as e:  # pylint: disable=W0718
+            logger.error(f'Failed to flush the Milvus collection {self.milvus_collection_name}: {e}', exc_info=True)
+            return
+        self._set_status_to_db_inserted(results)
+
+
+    def _get_text_files(self):
+        """
+        Get all texts with status 'scraped' from Firestore.
+
+        Returns:
+        A list of SourceFile with content type 'text'.
         """
         # Use the locally initialized client to get the collection
         collection_ref = self.db.collection(self.collection_name)
@@ -141,31 +366,101 @@ class VectorStoreService:
         # Execute the query and get the documents
         docs = query.stream()
 
-        # Extract the file names from the documents
-        file_names = [doc.get(u'file_name') for doc in docs]
+        return [self._source_file(doc, 'text') for doc in docs]
 
-        return file_names
 
+    def _get_pdf_files(self):
+        """
+        Get all PDFs with status 'scraped' from Firestore.
 
-    def _set_status_to_db_inserted(self, file_name):
+        Returns:
+        A list of SourceFile with content type 'pdf'.
         """
-        Update the status of a document in Firestore to 'db_inserted'.
+        collection_ref = self.db.collection(self.collection_name)
 
-        Parameters:
-        file_name (str): The name of the file stored in GCS.
+        query = collection_ref.where(filter=FieldFilter(u'status', u'==', 'scraped'))
+        query = query.where(filter=FieldFilter(u'content_type', u'in', PDF_CONTENT_TYPES))
+
+        # PDFs whose upload failed are stored with the file name 'None'
+        return [self._source_file(doc, 'pdf') for doc in query.stream() if doc.get(u'file_name') != 'None']
+
+
+    def _get_removed_files(self):
+        """
+        Get the links that have vectors in Milvus, but no file since they were last scraped, or whose page the link
+        collector found removed from the site.
+
+        Returns:
+        A list of SourceFile.
         """
-        # Use the locally initialized client to get the collection
         collection_ref = self.db.collection(self.collection_name)
 
-        # Query for the document where file_name matches the given file_name
-        docs = collection_ref.where(u'file_name', u'==', file_name).stream()
+        query = collection_ref.where(filter=FieldFilter(u'status', u'==', 'scraped'))
+        query = query.where(filter=FieldFilter(u'file_name', u'==', 'None'))
+        query = query.where(filter=FieldFilter(u'milvus_chunks', u'>', 0))
+
+        removed_query = collection_ref.where(filter=FieldFilter(u'status', u'==', 'removed'))
+        removed_query = removed_query.where(filter=FieldFilter(u'milvus_chunks', u'>', 0))
+
+        return [self._source_file(doc, None) for doc in itertools.chain(query.stream(), removed_query.stream())]
+
+
+    def source_file(self, doc_id, url, file_name, content_type):
+        """
+        Get the SourceFile of a file that was just scraped, or None if the service does not ingest its content type.
+
+        :param doc_id: The Firestore document ID of the link.
+        :param url: The URL of the link.
+        :param file_name: The name of the uploaded blob.
+        :param content_type: The content type stored by the scraper.
+        """
+        if content_type == 'text':
+            return SourceFile(doc_id, file_name, 'text', url, None)
+        if content_type in PDF_CONTENT_TYPES and self.pdf_loader is not None:
+            return SourceFile(doc_id, file_name, 'pdf', url, None)
+        return None
+
 
-        # There should only be one document that matches, but we'll use a loop just in case
-        for doc in docs:
-            # Get a reference to the document
-            doc_ref = collection_ref.document(doc.id)
+    @staticmethod
+    def _source_file(doc, content_type):
+        data = doc.to_dict()
+        return SourceFile(doc.id, data.get(u'file_name'), content_type, data.get(u'url'),
+                          data.get(u'milvus_chunks', 0), tuple(data.get(u'shared_chunks', ())))
 
-            # Update the status to 'db_inserted'
-            doc_ref.update({u'status': 'db_inserted'})
 
-        logger.info(f"Updated status to 'db_inserted' for file: {file_name}")
+    def _set_pdf_failed(self, file, error):
+        """
+        Record that the text of a PDF could not be extracted, e.g. because it is malformed or exceeded the time or
+        memory limit, so that it is not extracted again on every run.
+
+        Parameters:
+        file (SourceFile): The PDF.
+        error (Exception): The error of the extraction.
+        """
+        doc_ref = self.db.collection(self.collection_name).document(file.doc_id)
+        self.writer.update(doc_ref, {u'status': PDF_FAILED_STATUS,
+                                     u'skipped_reason': f'PDF extraction failed: {error}'})
+        SKIPPED.labels('vector_store', 'pdf_failed').inc()
+
+
+    def _set_status_to_db_inserted(self, results):
+        """
+        Record the status, the number of chunk indices in Milvus and the shared chunks of written files in Firestore
+        with batched writes. The shared chunks of a file are the ones it shared before and the ones that chunks of
+        other files were dropped for in this run.
+
+        Parameters:
+        results (list): Tuples of Firestore document ID, status, number of chunk indices and shared chunks.
+        """
+        collection_ref = self.db.collection(self.collection_name)
+        for doc_id, status, chunk_count, shared_chunks in results:
+            fields = {u'status': status, u'milvus_chunks': chunk_count}
+            shared = set(shared_chunks)
+            if self.deduplicator is not None:
+                shared |= self.deduplicator.referenced_keys(doc_id)
+            if shared:
+                fields[u'shared_chunks'] = sorted(shared)
+            self.writer.update(collection_ref.document(doc_id), fields)
+        self.writer.flush()
+
+        logger.info(f"Updated status to 'db_inserted' or 'db_removed' for {len(results)} files")
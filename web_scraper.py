@@ -1,10 +1,16 @@
 """
 Class for coordinating the web scraping services.
 
+The services and the Google Cloud clients they share are created when they are first used, and the modules of the
+services are imported at that point as well. A run that only collects links does not import LangChain or pymilvus,
+and does not connect to BigQuery or Milvus.
+
 Attributes:
     link_collector (LinkCollector): LinkCollector instance.
 """
 import argparse
+import atexit
+import functools
 import logging
 import os
 import sys
@@ -12,59 +18,127 @@ import uuid
 
 from dotenv import load_dotenv
 
-from link_collector_service import LinkCollectorService
-from scraping_service import ScraperService
-from vector_store_service import VectorStoreService
+from content_cache import ContentCache
 
 load_dotenv()  # take environment variables from .env.
 
-# Create a custom logger at the root
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-# Create handlers
-console_handler = logging.StreamHandler(sys.stdout)
-file_handler = logging.FileHandler('app.log')
 
-# Set the level for each handler
-console_handler.setLevel(logging.INFO)
-file_handler.setLevel(logging.INFO)
+def setup_logging():
+    """
+    Log to stdout and to app.log. Called only when the script is run, not when the module is imported, e.g. by
+    the spawned worker processes of ScraperService, which would otherwise open app.log once per process.
+    """
+    # Create a custom logger at the root
+    logger.setLevel(logging.INFO)
+
+    # Create handlers
+    console_handler = logging.StreamHandler(sys.stdout)
+    file_handler = logging.FileHandler('app.log')
 
-# Create formatters and add it to handlers
-log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(log_format)
-file_handler.setFormatter(log_format)
+    # Set the level for each handler
+    console_handler.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+
+    # Create formatters and add it to handlers
+    log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(log_format)
+    file_handler.setFormatter(log_format)
+
+    # Add the handlers to the logger
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
 
-# Add the handlers to the logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
 
 class WebScraper:
     """
-    Initialize WebScraper with a LinkCollector instance.
+    Create the services of a run on demand. All services and start URLs of a run share one set of clients.
     """
     def __init__(self):
         self.run_id = uuid.uuid4()
-        self.link_collector = LinkCollectorService(
-                                            run_id=self.run_id,
-                                            collection_name=os.getenv('COLLECTION_NAME')
-                                            )
-        self.scraper_Service = ScraperService(
-                                            run_id=self.run_id,
-                                            collection_name=os.getenv('COLLECTION_NAME'),
-                                            pdf_bucket_name=os.getenv('PDF_BUCKET_NAME'),
-                                            gcp_bucket=os.getenv('GCS_BUCKET_NAME'),
-                                            dataset_id= os.getenv('DATASET_ID'),
-                                            table_id=os.getenv('TABLE_ID'),
-                                            )
-        self.vector_store_service = VectorStoreService(
-                                            run_id=self.run_id,
-                                            project_name=os.getenv('GCP_PROJECT_NAME'),
-                                            bucket_name=os.getenv('GCS_BUCKET_NAME'),
-                                            collection_name=os.getenv('COLLECTION_NAME'),
-                                            milvus_collection_name=os.getenv('MILVUS_COLLECTION_NAME')           
+        self.content_cache = None
+        if os.getenv('CONTENT_CACHE_DIR'):
+            self.content_cache = ContentCache(
+                                            directory=os.getenv('CONTENT_CACHE_DIR'),
+                                            max_bytes=int(os.getenv('CONTENT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
                                             )
 
+    @functools.cached_property
+    def db(self):
+        from google.cloud import firestore  # pylint: disable=C0415
+
+        return firestore.Client()
+
+    @functools.cached_property
+    def storage_client(self):
+        from google.cloud import storage  # pylint: disable=C0415
+
+        return storage.Client()
+
+    @functools.cached_property
+    def bq_client(self):
+        from google.cloud import bigquery  # pylint: disable=C0415
+
+        return bigquery.Client()
+
+    @functools.cached_property
+    def link_collector(self):
+        from link_collector_service import LinkCollectorService  # pylint: disable=C0415
+
+        return LinkCollectorService(
+                                    run_id=self.run_id,
+                                    collection_name=os.getenv('COLLECTION_NAME'),
+                                    frontier_dir=os.getenv('FRONTIER_DIR'),
+                                    content_cache=self.content_cache,
+                                    db=self.db,
+                                    )
+
+    @functools.cached_property
+    def scraper_Service(self):  # pylint: disable=C0103
+        from scraping_service import ScraperService  # pylint: disable=C0415
+
+        return ScraperService(
+                                run_id=self.run_id,
+                                collection_name=os.getenv('COLLECTION_NAME'),
+                                pdf_bucket_name=os.getenv('PDF_BUCKET_NAME'),
+                                gcp_bucket=os.getenv('GCS_BUCKET_NAME'),
+                                dataset_id= os.getenv('DATASET_ID'),
+                                table_id=os.getenv('TABLE_ID'),
+                                content_cache=self.content_cache,
+                                audit_spool_path=os.getenv('AUDIT_SPOOL_PATH'),
+                                extraction_engine=os.getenv('EXTRACTION_ENGINE', 'bs4'),
+                                lease_seconds=int(os.getenv('LEASE_SECONDS', 0)) or None,
+                                db=self.db,
+                                bq_client=self.bq_client,
+                                storage_client=self.storage_client,
+                                )
+
+    @functools.cached_property
+    def vector_store_service(self):
+        from vector_store_service import VectorStoreService  # pylint: disable=C0415
+
+        return VectorStoreService(
+                                    run_id=self.run_id,
+                                    project_name=os.getenv('GCP_PROJECT_NAME'),
+                                    bucket_name=os.getenv('GCS_BUCKET_NAME'),
+                                    collection_name=os.getenv('COLLECTION_NAME'),
+                                    milvus_collection_name=os.getenv('MILVUS_COLLECTION_NAME'),
+                                    embedding_cache_path=os.getenv('EMBEDDING_CACHE_PATH'),
+                                    embedding_cache_max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 1000000)),
+                                    dedup_threshold=float(os.getenv('DEDUP_THRESHOLD', 0)) or None,
+                                    dedup_report_path=os.getenv('DEDUP_REPORT_PATH'),
+                                    embedding_concurrency=int(os.getenv('EMBEDDING_CONCURRENCY', 0)) or None,
+                                    embedding_rpm=int(os.getenv('EMBEDDING_RPM', 3000)),
+                                    embedding_tpm=int(os.getenv('EMBEDDING_TPM', 1000000)),
+                                    pdf_bucket_name=os.getenv('PDF_BUCKET_NAME') if os.getenv('INGEST_PDFS') else None,
+                                    pdf_time_limit=float(os.getenv('PDF_TIME_LIMIT', 120)),
+                                    pdf_memory_limit_mb=int(os.getenv('PDF_MEMORY_LIMIT_MB', 1024)),
+                                    milvus_defer_index=bool(os.getenv('MILVUS_DEFER_INDEX')),
+                                    db=self.db,
+                                    storage_client=self.storage_client,
+                                    )
+
     def run_service(self, service, kwargs):
         """
         Runs a service with the given arguments.
@@ -83,8 +157,35 @@ class WebScraper:
         for service, kwargs in services_to_run:
             self.run_service(service, kwargs)
 
+    def run_streaming(self, seeds, collect=True, scrape=True, embed=True, collector_kwargs=None,
+                      scraper_kwargs=None, vector_store_kwargs=None, multi_seed=False):
+        """
+        Runs the selected services at the same time. Stored links are streamed to the scraper and uploaded files to
+        the vector store through bounded queues.
+
+        :param seeds: List of tuples of start URL and base URL for the link collector.
+        :param collect: Whether to run the link collector.
+        :param scrape: Whether to run the scraper.
+        :param embed: Whether to run the vector store.
+        :param collector_kwargs: Further arguments of the link collector's run method.
+        :param scraper_kwargs: Arguments of the scraper's run method.
+        :param vector_store_kwargs: Arguments of the vector store's run method.
+        :param multi_seed: Whether to crawl all seeds at the same time with one shared frontier.
+        :return: The critical path summary of the run.
+        """
+        from streaming_orchestrator import StreamingOrchestrator  # pylint: disable=C0415
+
+        orchestrator = StreamingOrchestrator(
+                                            link_collector=self.link_collector if collect else None,
+                                            scraper=self.scraper_Service if scrape else None,
+                                            vector_store=self.vector_store_service if embed else None,
+                                            multi_seed=multi_seed,
+                                            )
+        return orchestrator.run(seeds, collector_kwargs, scraper_kwargs, vector_store_kwargs)
+
 
 if __name__ == "__main__":
+    setup_logging()
 
     parser = argparse.ArgumentParser(description='Web Scraper')
 
@@ -93,8 +194,40 @@ if __name__ == "__main__":
     parser.add_argument('-lc', '--link_collector', action='store_true', help='Run LinkCollectorService')
     parser.add_argument('-ss', '--scraper_service', action='store_true', help='Run ScraperService')
     parser.add_argument('-vs', '--vector_store', action='store_true', help='Run VectorStoreService')
+    parser.add_argument('-c', '--concurrency', type=int, default=None,
+                        help='Collect links with asyncio using this many concurrent requests')
+    parser.add_argument('--per_host_concurrency', type=int, default=4,
+                        help='Maximum concurrent requests per host when --concurrency is set')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of links ScraperService fetches concurrently, parsing HTML in a process pool')
+    parser.add_argument('--download_workers', type=int, default=8,
+                        help='Number of files VectorStoreService downloads from GCS concurrently')
+    parser.add_argument('--split_workers', type=int, default=1,
+                        help='Number of threads VectorStoreService uses to split files into chunks')
+    parser.add_argument('--embed_workers', type=int, default=1,
+                        help='Number of concurrent embedding calls of VectorStoreService')
+    parser.add_argument('--pdf_processes', type=int, default=None,
+                        help='Number of processes VectorStoreService uses to extract PDF text')
+    parser.add_argument('--multi_seed', action='store_true',
+                        help='Crawl all URLs at the same time with one shared frontier, round-robin across hosts')
+    parser.add_argument('--per_host_delay', type=float, default=0.0,
+                        help='Minimum seconds between two requests to the same host with --multi_seed')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Run the selected services at the same time, streaming links and files between them')
+    parser.add_argument('--metrics_port', type=int, default=None,
+                        help='Serve Prometheus metrics on this local port while the run is in progress')
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help='Write a snapshot of the Prometheus metrics to this file at the end of the run')
 
     args = parser.parse_args()
+    vector_store_kwargs = {"download_workers": args.download_workers, "split_workers": args.split_workers,
+                           "embed_workers": args.embed_workers, "pdf_processes": args.pdf_processes}
+    seeds = [(url, args.base_url or url) for url in args.urls or []]
+    if args.multi_seed:
+        collector_kwargs = {"concurrency": args.concurrency or 32, "per_host_concurrency": args.per_host_concurrency,
+                            "per_host_delay": args.per_host_delay}
+    else:
+        collector_kwargs = {"concurrency": args.concurrency, "per_host_concurrency": args.per_host_concurrency}
 
     logger.info("-" * 60)  # This will create a line of 60 hyphens
     logger.info("Starting new run...")
@@ -103,33 +236,69 @@ if __name__ == "__main__":
     if args.link_collector and not args.urls:
         raise ValueError("Error: The LinkCollectorService requires at least one URL.")
 
-    if args.link_collector:
-        for url in args.urls:
-            scraper = WebScraper()
+    if args.metrics_port or args.metrics_file:
+        import metrics  # pylint: disable=C0415
+
+        if args.metrics_port:
+            metrics.start_metrics_server(args.metrics_port)
+        if args.metrics_file:
+            # Also written when the run fails, with the metrics up to the failure
+            atexit.register(metrics.write_snapshot, args.metrics_file)
+
+    scraper = WebScraper()
+
+    if args.streaming:
+        scraper.run_streaming(
+                            seeds=seeds,
+                            collect=args.link_collector,
+                            scrape=args.scraper_service,
+                            embed=args.vector_store,
+                            collector_kwargs=collector_kwargs,
+                            scraper_kwargs={"workers": args.workers},
+                            vector_store_kwargs=vector_store_kwargs,
+                            multi_seed=args.multi_seed,
+                            )
+
+    elif args.link_collector and args.multi_seed:
+        logger.info("Running LinkCollectorService for all seeds...")
+        scraper.link_collector.run_multi(seeds, **collector_kwargs)
+        logger.info("LinkCollectorService completed.")
+
+        services_to_run = []
+
+        if args.scraper_service:
+            services_to_run.append((scraper.scraper_Service, {"workers": args.workers}))
 
+        if args.vector_store:
+            services_to_run.append((scraper.vector_store_service, vector_store_kwargs))
+
+        scraper.run(services_to_run)
+
+    elif args.link_collector:
+        for url in args.urls:
             services_to_run = []
 
             base_url = args.base_url if args.base_url else url
-            services_to_run.append((scraper.link_collector, {"start_url": url, "base_url": base_url}))
+            services_to_run.append((scraper.link_collector, {"start_url": url, "base_url": base_url,
+                                                             "concurrency": args.concurrency,
+                                                             "per_host_concurrency": args.per_host_concurrency}))
 
             if args.scraper_service:
-                services_to_run.append((scraper.scraper_Service, {}))
+                services_to_run.append((scraper.scraper_Service, {"workers": args.workers}))
 
             if args.vector_store:
-                services_to_run.append((scraper.vector_store_service, {}))
+                services_to_run.append((scraper.vector_store_service, vector_store_kwargs))
 
             scraper.run(services_to_run)
 
     else:
-        scraper = WebScraper()
-
         services_to_run = []
 
         if args.scraper_service:
-            services_to_run.append((scraper.scraper_Service, {}))
+            services_to_run.append((scraper.scraper_Service, {"workers": args.workers}))
 
         if args.vector_store:
-            services_to_run.append((scraper.vector_store_service, {}))
+            services_to_run.append((scraper.vector_store_service, vector_store_kwargs))
 
         scraper.run(services_to_run)
 